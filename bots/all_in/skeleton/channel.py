@@ -0,0 +1,129 @@
+'''
+The pokerbot's end of the engine's shared memory channel, see engine/channel.py for the layout.
+Its rings are written with plain stores in program order, so the engine only offers the channel on x86.
+'''
+import io
+import os
+import select
+import struct
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+RING_HEADER = 128
+RING_SIZE = 1 << 16
+COUNTER = struct.Struct('<Q')
+WRITTEN, CLOSED, READ, WAITING = 0, 8, 64, 72
+CPUS = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+# seconds to spin before sleeping on the doorbell, which only helps if the other process can run meanwhile
+SPIN_TIME = 50e-6 if CPUS > 1 else 0.
+SLEEP_SLICE = 1e-3  # a sleeping reader looks at the ring at least this often
+TOKEN = COUNTER.pack(1)
+
+
+def attach(name):
+    '''
+    Attaches the shared memory block without handing it to the resource tracker, as it belongs to the engine.
+    '''
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:  # before python 3.13
+        memory = shared_memory.SharedMemory(name)
+        resource_tracker.unregister(memory._name, 'shared_memory')
+        return memory
+
+
+class SharedMemoryChannel(io.RawIOBase):
+    '''
+    Reads the engine's messages from the first ring and writes the replies to the second one.
+    '''
+
+    def __init__(self, description):
+        name, bell, engine_bell = description.split(',')
+        self.memory = attach(name)
+        self.buffer = self.memory.buf
+        self.incoming = 0
+        self.outgoing = RING_HEADER + RING_SIZE
+        self.bell = int(bell)
+        self.engine_bell = int(engine_bell)
+        os.set_blocking(self.bell, False)
+        self.ring_engine()  # tells the engine that we attached
+
+    def counter(self, ring, field):
+        return COUNTER.unpack_from(self.buffer, ring + field)[0]
+
+    def ring_engine(self):
+        try:
+            os.write(self.engine_bell, TOKEN)
+        except BlockingIOError:
+            pass  # the doorbell rang often enough already
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return True
+
+    def readinto(self, buffer):
+        '''
+        Waits for the engine's next bytes. Returns 0 once the engine closed the channel or exited.
+        '''
+        ring = self.incoming
+        spin_until = time.perf_counter() + SPIN_TIME
+        while self.counter(ring, WRITTEN) == self.counter(ring, READ):
+            if self.buffer[ring + CLOSED]:
+                return 0
+            if time.perf_counter() < spin_until:
+                continue
+            self.buffer[ring + WAITING] = 1
+            if self.counter(ring, WRITTEN) == self.counter(ring, READ) and select.select([self.bell], [], [], SLEEP_SLICE)[0]:
+                try:
+                    if os.read(self.bell, 4096) == b'':
+                        return 0
+                except BlockingIOError:
+                    pass
+            self.buffer[ring + WAITING] = 0
+        read = self.counter(ring, READ)
+        size = min(len(buffer), self.counter(ring, WRITTEN) - read)
+        start = read % RING_SIZE
+        first = min(size, RING_SIZE - start)
+        data = ring + RING_HEADER
+        buffer[:first] = self.buffer[data + start:data + start + first]
+        buffer[first:size] = self.buffer[data:data + size - first]
+        COUNTER.pack_into(self.buffer, ring + READ, read + size)
+        return size
+
+    def write(self, data):
+        ring = self.outgoing
+        data = memoryview(data)
+        total = len(data)
+        while data:
+            written = self.counter(ring, WRITTEN)
+            pending = written - self.counter(ring, READ)
+            size = min(len(data), RING_SIZE - pending)
+            start = written % RING_SIZE
+            first = min(size, RING_SIZE - start)
+            offset = ring + RING_HEADER
+            self.buffer[offset + start:offset + start + first] = data[:first]
+            self.buffer[offset:offset + size - first] = data[first:size]
+            COUNTER.pack_into(self.buffer, ring + WRITTEN, written + size)
+            # also rung when the ring was empty, see engine/channel.py for the missing barrier
+            if pending == 0 or self.buffer[ring + WAITING]:
+                self.ring_engine()
+            data = data[size:]
+            if data:
+                time.sleep(SLEEP_SLICE)  # the ring is full, wait for the engine to read
+        return total
+
+    def makefile(self, mode='rw'):
+        return io.TextIOWrapper(io.BufferedRWPair(self, self))
+
+    def close(self):
+        if self.memory is not None:
+            self.buffer[self.outgoing + CLOSED] = 1
+            self.ring_engine()
+            os.close(self.bell)
+            os.close(self.engine_bell)
+            self.buffer = None
+            self.memory.close()
+            self.memory = None
+        super().close()
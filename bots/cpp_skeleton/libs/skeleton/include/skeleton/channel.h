@@ -0,0 +1,178 @@
+#pragma once
+
+#include <chrono>
+#include <cstdint>
+#include <cstring>
+#include <stdexcept>
+#include <streambuf>
+#include <string>
+#include <thread>
+
+#include <fcntl.h>
+#include <poll.h>
+#include <sys/mman.h>
+#include <unistd.h>
+
+namespace pokerbots::skeleton {
+
+// The pokerbot's end of the engine's shared memory channel, see engine/channel.py for the layout.
+// Reads the engine's messages from the first ring and writes the replies to the second one.
+class SharedMemoryChannel : public std::streambuf {
+private:
+  static constexpr std::size_t RING_HEADER = 128;
+  static constexpr std::size_t RING_SIZE = 1 << 16;
+  static constexpr std::size_t WRITTEN = 0, CLOSED = 8, READ = 64, WAITING = 72;
+  static constexpr std::size_t INCOMING = 0, OUTGOING = RING_HEADER + RING_SIZE;
+  static constexpr std::size_t SIZE = 2 * (RING_HEADER + RING_SIZE);
+  static constexpr int SLEEP_SLICE_MS = 1;  // a sleeping reader looks at the ring at least this often
+
+  unsigned char *memory = nullptr;
+  int bell = -1;
+  int engineBell = -1;
+  std::chrono::nanoseconds spinTime;
+  char input[4096];
+  char output[4096];
+
+  std::uint64_t *counter(std::size_t ring, std::size_t field) {
+    return reinterpret_cast<std::uint64_t *>(memory + ring + field);
+  }
+
+  std::uint64_t load(std::size_t ring, std::size_t field) {
+    return __atomic_load_n(counter(ring, field), __ATOMIC_ACQUIRE);
+  }
+
+  bool flag(std::size_t ring, std::size_t field) {
+    return __atomic_load_n(memory + ring + field, __ATOMIC_ACQUIRE) != 0;
+  }
+
+  void setFlag(std::size_t ring, std::size_t field, unsigned char value) {
+    __atomic_store_n(memory + ring + field, value, __ATOMIC_RELEASE);
+    __atomic_thread_fence(__ATOMIC_SEQ_CST);
+  }
+
+  void ringEngine() {
+    std::uint64_t token = 1;
+    // a full pipe means the doorbell rang often enough already
+    [[maybe_unused]] auto written = ::write(engineBell, &token, sizeof(token));
+  }
+
+  bool writeAll(const char *data, std::size_t size) {
+    while (size > 0) {
+      auto written = load(OUTGOING, WRITTEN);
+      auto pending = static_cast<std::size_t>(written - load(OUTGOING, READ));
+      auto count = std::min(size, RING_SIZE - pending);
+      auto start = written % RING_SIZE;
+      auto first = std::min(count, RING_SIZE - start);
+      auto *ring = memory + OUTGOING + RING_HEADER;
+      std::memcpy(ring + start, data, first);
+      std::memcpy(ring, data + first, count - first);
+      __atomic_store_n(counter(OUTGOING, WRITTEN), written + count, __ATOMIC_RELEASE);
+      __atomic_thread_fence(__ATOMIC_SEQ_CST);
+      // the engine sets its waiting flag without a barrier, so it may be sleeping on an empty ring unseen
+      if (pending == 0 || flag(OUTGOING, WAITING)) {
+        ringEngine();
+      }
+      data += count;
+      size -= count;
+      if (size > 0) {
+        // the ring is full, wait for the engine to read
+        std::this_thread::sleep_for(std::chrono::milliseconds(SLEEP_SLICE_MS));
+      }
+    }
+    return true;
+  }
+
+protected:
+  int_type underflow() override {
+    if (gptr() < egptr()) {
+      return traits_type::to_int_type(*gptr());
+    }
+    auto spinUntil = std::chrono::steady_clock::now() + spinTime;
+    while (load(INCOMING, WRITTEN) == load(INCOMING, READ)) {
+      if (flag(INCOMING, CLOSED)) {
+        return traits_type::eof();
+      }
+      if (std::chrono::steady_clock::now() < spinUntil) {
+        continue;
+      }
+      setFlag(INCOMING, WAITING, 1);
+      if (load(INCOMING, WRITTEN) == load(INCOMING, READ)) {
+        pollfd waiting = {bell, POLLIN, 0};
+        if (::poll(&waiting, 1, SLEEP_SLICE_MS) > 0) {
+          char tokens[4096];
+          if (::read(bell, tokens, sizeof(tokens)) == 0) {
+            return traits_type::eof();  // the engine exited
+          }
+        }
+      }
+      setFlag(INCOMING, WAITING, 0);
+    }
+    auto read = load(INCOMING, READ);
+    auto size = std::min(sizeof(input), static_cast<std::size_t>(load(INCOMING, WRITTEN) - read));
+    auto start = read % RING_SIZE;
+    auto first = std::min(size, RING_SIZE - start);
+    auto *ring = memory + INCOMING + RING_HEADER;
+    std::memcpy(input, ring + start, first);
+    std::memcpy(input + first, ring, size - first);
+    __atomic_store_n(counter(INCOMING, READ), read + size, __ATOMIC_RELEASE);
+    setg(input, input, input + size);
+    return traits_type::to_int_type(*gptr());
+  }
+
+  int_type overflow(int_type c) override {
+    if (sync() != 0) {
+      return traits_type::eof();
+    }
+    if (!traits_type::eq_int_type(c, traits_type::eof())) {
+      *pptr() = traits_type::to_char_type(c);
+      pbump(1);
+    }
+    return traits_type::not_eof(c);
+  }
+
+  int sync() override {
+    writeAll(pbase(), pptr() - pbase());
+    setp(output, output + sizeof(output));
+    return 0;
+  }
+
+public:
+  // description is "<shared memory name>,<fd of our doorbell>,<fd of the engine's doorbell>"
+  explicit SharedMemoryChannel(const std::string &description) {
+    auto first = description.find(',');
+    auto second = description.find(',', first + 1);
+    auto name = "/" + description.substr(0, first);
+    bell = std::stoi(description.substr(first + 1, second - first - 1));
+    engineBell = std::stoi(description.substr(second + 1));
+    int fd = ::shm_open(name.c_str(), O_RDWR, 0);
+    if (fd < 0) {
+      throw std::runtime_error("could not open shared memory " + name);
+    }
+    void *mapped = ::mmap(nullptr, SIZE, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+    ::close(fd);
+    if (mapped == MAP_FAILED) {
+      throw std::runtime_error("could not map shared memory " + name);
+    }
+    memory = static_cast<unsigned char *>(mapped);
+    ::fcntl(bell, F_SETFL, ::fcntl(bell, F_GETFL) | O_NONBLOCK);
+    // spinning only helps if the engine can run meanwhile
+    spinTime = std::thread::hardware_concurrency() > 1 ? std::chrono::microseconds(50) : std::chrono::microseconds(0);
+    setp(output, output + sizeof(output));
+    setg(input, input, input);
+    ringEngine();  // tells the engine that we attached
+  }
+
+  SharedMemoryChannel(const SharedMemoryChannel &) = delete;
+  SharedMemoryChannel &operator=(const SharedMemoryChannel &) = delete;
+
+  ~SharedMemoryChannel() override {
+    sync();
+    setFlag(OUTGOING, CLOSED, 1);
+    ringEngine();
+    ::munmap(memory, SIZE);
+    ::close(bell);
+    ::close(engineBell);
+  }
+};
+
+} // namespace pokerbots::skeleton
@@ -1,52 +1,215 @@
 #pragma once
 
+#include <algorithm>
 #include <charconv>
+#include <cstdint>
+#include <cstdlib>
+#include <cstring>
 #include <iostream>
 #include <optional>
 #include <string>
 #include <utility>
+#include <vector>
 
 #include <boost/algorithm/string.hpp>
 #include <boost/asio/ip/tcp.hpp>
+#include <boost/asio/local/stream_protocol.hpp>
 
 #include <fmt/format.h>
 #include <fmt/ostream.h>
 
 #include "actions.h"
+#include "channel.h"
 #include "constants.h"
 #include "game.h"
 #include "states.h"
 
 namespace pokerbots::skeleton {
 
+// the highest version of the engine's socket protocol this runner speaks, see engine/protocol.py
+constexpr int PROTOCOL_VERSION = 2;
+
+// one clause of an engine message, parsed from either protocol version
+struct Clause {
+  char code;
+  double clock = 0.0;              // T
+  int value = 0;                   // P, R, D, V, the bankroll of G
+  int roundNum = 0;                // G
+  std::vector<std::string> cards;  // H, B, O
+};
+
 template <typename BotType> class Runner {
 private:
   BotType pokerbot;
-  boost::asio::ip::tcp::iostream &stream;
+  std::iostream &stream;
+  bool binary = false;
+  std::vector<std::string> board;  // with version 2 the engine only sends the newly dealt board cards
 
   template <typename Action> void send(Action const& action) {
+    if (binary) {
+      // a little-endian uint16 payload length, the action code and the int32 amount of a raise
+      std::string frame(2, '\0');
+      frame += fmt::format(FMT_STRING("{}"), action).front();
+      if (action.actionType == Action::Type::RAISE) {
+        std::int32_t amount = action.amount;
+        frame.append(reinterpret_cast<const char *>(&amount), sizeof(amount));
+      }
+      frame[0] = static_cast<char>((frame.size() - 2) & 0xff);
+      frame[1] = static_cast<char>((frame.size() - 2) >> 8);
+      stream.write(frame.data(), frame.size());
+      stream.flush();
+      return;
+    }
     std::string code;
     code = fmt::format(FMT_STRING("{}"), action);
-    stream << fmt::format(FMT_STRING("{}"), code) << '\n';
+    stream << fmt::format(FMT_STRING("{}\n"), code) << std::flush;
+  }
+
+  std::vector<Clause> receive() {
+    return binary ? receiveFrame() : receiveLine();
   }
 
-  std::vector<std::string> receive() {
+  std::vector<Clause> receiveLine() {
     std::string line;
-    std::getline(stream, line);
+    if (!std::getline(stream, line)) {
+      return {Clause{'Q'}};
+    }
     boost::algorithm::trim(line);
 
     std::vector<std::string> packet;
     boost::split(packet, line, boost::is_any_of(" "));
-    return packet;
+    std::vector<Clause> clauses;
+    for (const auto &text : packet) {
+      if (text.empty()) {
+        continue;
+      }
+      Clause clause{text[0]};
+      auto leftover = text.substr(1);
+      switch (clause.code) {
+        case 'T': {
+          clause.clock = std::stof(leftover);
+          break;
+        }
+        case 'P':
+        case 'R':
+        case 'D':
+        case 'V': {
+          clause.value = std::stoi(leftover);
+          break;
+        }
+        case 'H':
+        case 'B':
+        case 'O': {
+          boost::split(clause.cards, leftover, boost::is_any_of(","));
+          break;
+        }
+        case 'G': {
+          auto comma = leftover.find(',');
+          clause.value = std::stoi(leftover.substr(0, comma));
+          clause.roundNum = std::stoi(leftover.substr(comma + 1));
+          break;
+        }
+        default: {
+          break;
+        }
+      }
+      clauses.push_back(std::move(clause));
+    }
+    return clauses;
+  }
+
+  static std::string cardName(unsigned char card) {
+    return {"23456789TJQKA"[card / 4], "cdhs"[card % 4]};
+  }
+
+  // numbers are read as little-endian, like on x86 and ARM
+  template <typename T> static T read(const std::vector<unsigned char> &payload, std::size_t &position) {
+    T value;
+    std::memcpy(&value, payload.data() + position, sizeof(T));
+    position += sizeof(T);
+    return value;
+  }
+
+  std::vector<Clause> receiveFrame() {
+    unsigned char header[2];
+    if (!stream.read(reinterpret_cast<char *>(header), sizeof(header))) {
+      return {Clause{'Q'}};
+    }
+    std::vector<unsigned char> payload(header[0] | (header[1] << 8));
+    if (!stream.read(reinterpret_cast<char *>(payload.data()), payload.size())) {
+      return {Clause{'Q'}};
+    }
+    std::vector<Clause> clauses;
+    std::size_t position = 0;
+    while (position < payload.size()) {
+      Clause clause{static_cast<char>(payload[position++])};
+      switch (clause.code) {
+        case 'T': {
+          clause.clock = read<double>(payload, position);
+          break;
+        }
+        case 'P': {
+          clause.value = payload[position++];
+          break;
+        }
+        case 'H':
+        case 'O': {
+          clause.cards = {cardName(payload[position]), cardName(payload[position + 1])};
+          position += 2;
+          if (clause.code == 'H') {
+            board.clear();
+          }
+          break;
+        }
+        case 'B': {
+          auto count = payload[position++];
+          for (int i = 0; i < count; i++) {
+            board.push_back(cardName(payload[position++]));
+          }
+          clause.cards = board;
+          break;
+        }
+        case 'R':
+        case 'D': {
+          clause.value = read<std::int32_t>(payload, position);
+          break;
+        }
+        case 'G': {
+          clause.value = read<std::int32_t>(payload, position);
+          clause.roundNum = read<std::int32_t>(payload, position);
+          break;
+        }
+        default: {
+          break;
+        }
+      }
+      clauses.push_back(std::move(clause));
+    }
+    return clauses;
+  }
+
+  // answers a clause that needs its own ack, like G, with its code
+  void acknowledge(char code) {
+    if (binary) {
+      const char frame[] = {1, 0, code};
+      stream.write(frame, sizeof(frame));
+    } else {
+      stream << code << '\n';
+    }
+    stream.flush();
+  }
+
+  void negotiate(int version) {
+    version = std::min(version, PROTOCOL_VERSION);
+    stream << fmt::format(FMT_STRING("V{}\n"), version) << std::flush;
+    binary = version >= 2;
   }
 
 public:
   template <typename... Args>
-  Runner(boost::asio::ip::tcp::iostream &stream, Args... args)
+  Runner(std::iostream &stream, Args... args)
       : pokerbot(std::forward<Args>(args)...), stream(stream) {}
 
-  ~Runner() { stream.close(); }
-
   void run() {
     GameInfoPtr gameInfo = std::make_shared<GameInfo>(0, 0.0, 1);
     StatePtr roundState = std::make_shared<RoundState>(
@@ -57,20 +220,20 @@ public:
     bool roundFlag = true;
     while (true) {
       auto packet = receive();
+      std::optional<int> offeredVersion;
+      std::optional<char> acknowledged;
       for (const auto &clause : packet) {
-        auto leftover = clause.substr(1);
-        switch (clause[0]) {
+        switch (clause.code) {
           case 'T': {
-            gameInfo = std::make_shared<GameInfo>(gameInfo->bankroll, std::stof(leftover), gameInfo->roundNum);
+            gameInfo = std::make_shared<GameInfo>(gameInfo->bankroll, clause.clock, gameInfo->roundNum);
             break;
           }
           case 'P': {
-            active = std::stoi(leftover);
+            active = clause.value;
             break;
           }
           case 'H': {
-            std::vector<std::string> cards;
-            boost::split(cards, leftover, boost::is_any_of(","));
+            const auto &cards = clause.cards;
 
             std::array<std::array<std::string, 2>, 2> hands;
             hands[active][0] = cards[0];
@@ -104,12 +267,11 @@ public:
           }
           case 'R': {
             roundState = std::static_pointer_cast<const RoundState>(roundState)->proceed({Action::Type::RAISE,
-                                                                                          std::stoi(leftover)});
+                                                                                          clause.value});
             break;
           }
           case 'B': {
-            std::vector<std::string> cards;
-            boost::split(cards, leftover, boost::is_any_of(","));
+            const auto &cards = clause.cards;
             auto maker = std::static_pointer_cast<const RoundState>(roundState);
             roundState = std::make_shared<RoundState>(maker->button, maker->street, maker->pips, maker->stacks,
                                                       maker->hands, cards, maker->previousState);
@@ -117,8 +279,7 @@ public:
           }
           case 'O': {
             // backtrack
-            std::vector<std::string> cards;
-            boost::split(cards, leftover, boost::is_any_of(","));
+            const auto &cards = clause.cards;
             roundState = std::static_pointer_cast<const RoundState>(roundState)->previousState;
             auto maker = std::static_pointer_cast<const RoundState>(roundState);
             auto revisedHands = maker->hands;
@@ -130,7 +291,7 @@ public:
             break;
           }
           case 'D': {
-            auto delta = std::stoi(leftover);
+            auto delta = clause.value;
             std::array<int, 2> deltas;
             deltas[active] = delta;
             deltas[1 - active] = -1 * delta;
@@ -149,6 +310,25 @@ public:
             roundFlag = true;
             break;
           }
+          case 'N': {
+            // a new match in the same process
+            gameInfo = std::make_shared<GameInfo>(0, 0.0, 1);
+            roundFlag = true;
+            acknowledged = clause.code;
+            break;
+          }
+          case 'G': {
+            // a resumed match continues with this bankroll and round
+            gameInfo = std::make_shared<GameInfo>(clause.value, gameInfo->gameClock, clause.roundNum);
+            roundFlag = true;
+            acknowledged = clause.code;
+            break;
+          }
+          case 'V': {
+            // answered instead of the ack
+            offeredVersion = clause.value;
+            break;
+          }
           case 'Q': {
             return;
           }
@@ -157,7 +337,11 @@ public:
           }
         }
       }
-      if (roundFlag) {
+      if (offeredVersion) {
+        negotiate(*offeredVersion);
+      } else if (acknowledged) {
+        acknowledge(*acknowledged);
+      } else if (roundFlag) {
         send(Action {Action::Type::CHECK});
       } else {
         auto action = pokerbot.getAction(gameInfo, std::static_pointer_cast<const RoundState>(roundState), active);
@@ -169,6 +353,29 @@ public:
 
 template <typename BotType, typename... Args>
 void runBot(std::string &host, std::string &port, Args... args) {  
+  // local transports the engine offers instead of TCP, see engine/transport.py
+  if (const char *description = std::getenv("POKERBOT_SHM")) {
+    SharedMemoryChannel channel(description);
+    std::iostream stream(&channel);
+    fmt::print(std::cout, FMT_STRING("connected to engine via shared memory\n"));
+    std::cout << std::flush;
+    auto r = Runner<BotType>(stream, std::forward<Args>(args)...);
+    r.run();
+    return;
+  }
+  if (const char *path = std::getenv("POKERBOT_SOCKET")) {
+    boost::asio::local::stream_protocol::iostream stream;
+    stream.connect(boost::asio::local::stream_protocol::endpoint(path));
+    if (stream) {
+      fmt::print(std::cout, FMT_STRING("connected to engine via {}\n"), path);
+      std::cout << std::flush;
+      auto r = Runner<BotType>(stream, std::forward<Args>(args)...);
+      r.run();
+      return;
+    }
+    fmt::print(std::cerr, FMT_STRING("Unable to connect to {}; {}\n"), path, stream.error().message());
+  }
+
   boost::asio::ip::tcp::iostream stream;
   
   fmt::print(std::cout, FMT_STRING("connecting to engine via {}:{}\n"), host, port);
@@ -2,12 +2,22 @@
 The infrastructure for interacting with the engine.
 '''
 import argparse
+import os
 import socket
+import struct
 import time
 from .actions import FoldAction, CallAction, CheckAction, RaiseAction
 from .states import GameState, TerminalState, RoundState
 from .states import STARTING_STACK, BIG_BLIND, SMALL_BLIND
 from .bot import Bot
+from .channel import SharedMemoryChannel
+
+PROTOCOL_VERSION = 2  # the highest version of the engine's socket protocol this runner speaks
+CARD_NAMES = [rank + suit for rank in '23456789TJQKA' for suit in 'cdhs']
+FRAME_HEADER = struct.Struct('<H')
+FLOAT64 = struct.Struct('<d')
+INT32 = struct.Struct('<i')
+RESUME = struct.Struct('<ii')  # bankroll and round number
 
 
 class Runner():
@@ -18,17 +28,82 @@ class Runner():
     def __init__(self, pokerbot, socketfile):
         self.pokerbot = pokerbot
         self.socketfile = socketfile
+        self.binary = False
+        self.board = []
 
     def receive(self):
         '''
-        Generator for incoming messages from the engine.
+        Generator for incoming messages from the engine. A message is a list of (code, value) clauses.
         '''
         while True:
-            packet = self.socketfile.readline().strip().split(' ')
+            packet = self.receive_frame() if self.binary else self.receive_line()
             if not packet:
                 break
             yield packet
 
+    def receive_line(self):
+        '''
+        Parses a text message (protocol version 1).
+        '''
+        line = self.socketfile.readline()
+        if not line:
+            return []
+        packet = []
+        for clause in line.strip().split(' '):
+            code, leftover = clause[:1], clause[1:]
+            if code in ('H', 'B', 'O'):
+                packet.append((code, leftover.split(',')))
+            elif code == 'T':
+                packet.append((code, float(leftover)))
+            elif code in ('P', 'R', 'D', 'V'):
+                packet.append((code, int(leftover)))
+            elif code == 'G':
+                packet.append((code, [int(value) for value in leftover.split(',')]))
+            else:
+                packet.append((code, None))
+        return packet
+
+    def receive_frame(self):
+        '''
+        Parses a binary frame (protocol version 2), see engine/protocol.py.
+        Boards only contain the newly dealt cards, so they are added to the board of the round.
+        '''
+        stream = self.socketfile.buffer
+        header = stream.read(FRAME_HEADER.size)
+        if len(header) < FRAME_HEADER.size:
+            return []
+        payload = stream.read(FRAME_HEADER.unpack(header)[0])
+        packet = []
+        position = 0
+        while position < len(payload):
+            code = chr(payload[position])
+            position += 1
+            if code == 'T':
+                packet.append((code, FLOAT64.unpack_from(payload, position)[0]))
+                position += FLOAT64.size
+            elif code == 'P':
+                packet.append((code, payload[position]))
+                position += 1
+            elif code in ('H', 'O'):
+                packet.append((code, [CARD_NAMES[payload[position]], CARD_NAMES[payload[position + 1]]]))
+                position += 2
+                if code == 'H':
+                    self.board = []
+            elif code == 'B':
+                count = payload[position]
+                self.board = self.board + [CARD_NAMES[card] for card in payload[position + 1:position + 1 + count]]
+                packet.append((code, self.board))
+                position += 1 + count
+            elif code in ('R', 'D'):
+                packet.append((code, INT32.unpack_from(payload, position)[0]))
+                position += INT32.size
+            elif code == 'G':
+                packet.append((code, list(RESUME.unpack_from(payload, position))))
+                position += RESUME.size
+            else:
+                packet.append((code, None))
+        return packet
+
     def send(self, action):
         '''
         Encodes an action and sends it to the engine.
@@ -40,9 +115,34 @@ class Runner():
         elif isinstance(action, CheckAction):
             code = 'K'
         else:  # isinstance(action, RaiseAction)
-            code = 'R' + str(action.amount)
-        self.socketfile.write(code + '\n')
+            code = 'R'
+        if self.binary:
+            payload = code.encode() + (INT32.pack(int(action.amount)) if code == 'R' else b'')
+            self.socketfile.buffer.write(FRAME_HEADER.pack(len(payload)) + payload)
+            self.socketfile.buffer.flush()
+        else:
+            self.socketfile.write(code + (str(action.amount) if code == 'R' else '') + '\n')
+            self.socketfile.flush()
+
+    def acknowledge(self, code):
+        '''
+        Answers a clause that needs its own ack, like G, with its code.
+        '''
+        if self.binary:
+            self.socketfile.buffer.write(FRAME_HEADER.pack(1) + code.encode())
+            self.socketfile.buffer.flush()
+        else:
+            self.socketfile.write(code + '\n')
+            self.socketfile.flush()
+
+    def negotiate(self, version):
+        '''
+        Answers the protocol version offered by the engine and switches to binary frames for version 2.
+        '''
+        version = min(version, PROTOCOL_VERSION)
+        self.socketfile.write('V{}\n'.format(version))
         self.socketfile.flush()
+        self.binary = version >= 2
 
     def run(self):
         '''
@@ -53,43 +153,45 @@ class Runner():
         active = 0
         round_flag = True
         for packet in self.receive():
-            for clause in packet:
-                if clause[0] == 'T':
-                    game_state = GameState(game_state.bankroll, float(clause[1:]), game_state.round_num)
-                elif clause[0] == 'P':
-                    active = int(clause[1:])
-                elif clause[0] == 'H':
+            offered_version = None
+            acknowledged = None
+            for code, value in packet:
+                if code == 'T':
+                    game_state = GameState(game_state.bankroll, value, game_state.round_num)
+                elif code == 'P':
+                    active = value
+                elif code == 'H':
                     hands = [[], []]
-                    hands[active] = clause[1:].split(',')
+                    hands[active] = value
                     pips = [SMALL_BLIND, BIG_BLIND]
                     stacks = [STARTING_STACK - SMALL_BLIND, STARTING_STACK - BIG_BLIND]
                     round_state = RoundState(0, 0, pips, stacks, hands, [], None)
                     if round_flag:
                         self.pokerbot.handle_new_round(game_state, round_state, active)
                         round_flag = False
-                elif clause[0] == 'F':
+                elif code == 'F':
                     round_state = round_state.proceed(FoldAction())
-                elif clause[0] == 'C':
+                elif code == 'C':
                     round_state = round_state.proceed(CallAction())
-                elif clause[0] == 'K':
+                elif code == 'K':
                     round_state = round_state.proceed(CheckAction())
-                elif clause[0] == 'R':
-                    round_state = round_state.proceed(RaiseAction(int(clause[1:])))
-                elif clause[0] == 'B':
+                elif code == 'R':
+                    round_state = round_state.proceed(RaiseAction(value))
+                elif code == 'B':
                     round_state = RoundState(round_state.button, round_state.street, round_state.pips, round_state.stacks,
-                                             round_state.hands, clause[1:].split(','), round_state.previous_state)
-                elif clause[0] == 'O':
+                                             round_state.hands, value, round_state.previous_state)
+                elif code == 'O':
                     # backtrack
                     round_state = round_state.previous_state
                     revised_hands = list(round_state.hands)
-                    revised_hands[1-active] = clause[1:].split(',')
+                    revised_hands[1-active] = value
                     # rebuild history
                     round_state = RoundState(round_state.button, round_state.street, round_state.pips, round_state.stacks,
                                              revised_hands, round_state.deck, round_state.previous_state)
                     round_state = TerminalState([0, 0], round_state)
-                elif clause[0] == 'D':
+                elif code == 'D':
                     assert isinstance(round_state, TerminalState)
-                    delta = int(clause[1:])
+                    delta = value
                     deltas = [-delta, -delta]
                     deltas[active] = delta
                     round_state = TerminalState(deltas, round_state.previous_state)
@@ -97,9 +199,23 @@ class Runner():
                     self.pokerbot.handle_round_over(game_state, round_state, active)
                     game_state = GameState(game_state.bankroll, game_state.game_clock, game_state.round_num + 1)
                     round_flag = True
-                elif clause[0] == 'Q':
+                elif code == 'N':  # a new match in the same process
+                    game_state = GameState(0, 0., 1)
+                    round_flag = True
+                    acknowledged = code
+                elif code == 'G':  # a resumed match continues with this bankroll and round
+                    game_state = GameState(value[0], game_state.game_clock, value[1])
+                    round_flag = True
+                    acknowledged = code
+                elif code == 'V':  # answered instead of the ack
+                    offered_version = value
+                elif code == 'Q':
                     return
-            if round_flag:  # ack the engine
+            if offered_version is not None:
+                self.negotiate(offered_version)
+            elif acknowledged is not None:
+                self.acknowledge(acknowledged)
+            elif round_flag:  # ack the engine
                 self.send(CheckAction())
             else:
                 assert active == round_state.button % 2
@@ -116,11 +232,19 @@ def parse_args():
     parser.add_argument('port', type=int, help='Port on host to connect to')
     return parser.parse_args()
 
-def run_bot(pokerbot, args):
+def connect(args):
     '''
-    Runs the pokerbot.
+    Connects to the engine over the local transport it offered in the environment, if any, otherwise over TCP.
     '''
-    assert isinstance(pokerbot, Bot)
+    if 'POKERBOT_SHM' in os.environ:
+        channel = SharedMemoryChannel(os.environ['POKERBOT_SHM'])
+        print('connected to engine via shared memory', flush=True)
+        return channel
+    if 'POKERBOT_SOCKET' in os.environ:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(os.environ['POKERBOT_SOCKET'])
+        print('connected to engine via {}'.format(os.environ['POKERBOT_SOCKET']), flush=True)
+        return sock
     connected = False
     print('connecting to engine via {}:{}'.format(args.host,args.port), flush=True)
     while not connected:
@@ -135,6 +259,14 @@ def run_bot(pokerbot, args):
             time.sleep(1)
             
     print('connected to engine via {}:{}'.format(args.host,args.port), flush=True)
+    return sock
+
+def run_bot(pokerbot, args):
+    '''
+    Runs the pokerbot.
+    '''
+    assert isinstance(pokerbot, Bot)
+    sock = connect(args)
     socketfile = sock.makefile('rw')
     runner = Runner(pokerbot, socketfile)
     runner.run()
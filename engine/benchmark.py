@@ -0,0 +1,459 @@
+'''
+Benchmarks for the engine.
+
+Plays rounds with a random policy directly on the round states, without bots, logs or sockets,
+and reports how many states per second RoundState and CompactRoundState process.
+Also times showdowns for boards of different run lengths and the batched table evaluator,
+whole matches of the engine against stub players that answer instantly, the round trip of the socket
+protocol over every transport and protocol version, and writing the game log and the summary of
+matches with 1k, 100k and 1M rounds.
+
+Run with: python engine/benchmark.py [--rounds N] [--seed S] [--json PATH] [--compare BASELINE]
+--json writes the results as JSON, which can serve as the baseline of a later run: --compare prints the
+change of every result against the baseline and exits with status 1 if one got worse by more than
+--tolerance.
+'''
+import argparse
+import contextlib
+import eval7
+import io
+import json
+import numpy as np
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from actions import FoldAction, CallAction, CheckAction, RaiseAction
+from dealer import DeckSource, final_street
+from showdown import ShowdownEvaluator
+import handtable
+import stats
+from states import RoundState, TerminalState, CompactRoundState, FOLD, CALL, CHECK, RAISE, ACTION_BITS
+from stats import GameSummary
+from gamelog import GameLog
+from protocol import TextProtocol, BinaryProtocol
+from transport import BotConnection, run
+from channel import ORDERED_STORES
+from config import STARTING_STACK, BIG_BLIND, SMALL_BLIND, CONNECT_TIMEOUT
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SKELETON_PATH = os.path.join(BASE_DIR, 'bots', 'python_skeleton')
+
+ACTION_CLASSES = [FoldAction, CallAction, CheckAction, RaiseAction]
+# the legal action bits of every mask in the same order as ACTION_CLASSES
+MASK_TO_BITS = [tuple(bit for bit in (FOLD, CALL, CHECK, RAISE) if mask & bit) for mask in range(16)]
+TRANSPORTS = ('tcp', 'unix', 'shm') if ORDERED_STORES else ('tcp', 'unix')
+
+# a pokerbot that answers every message with a check at once, connected like the skeleton runner
+ECHO_BOT = '''
+import io, os, socket, struct, sys
+sys.path.insert(0, sys.argv[1])
+framed = sys.argv[3] == '2'
+if 'POKERBOT_SHM' in os.environ:
+    from skeleton.channel import SharedMemoryChannel
+    channel = SharedMemoryChannel(os.environ['POKERBOT_SHM'])
+    stream = io.BufferedRWPair(channel, channel)
+else:
+    if 'POKERBOT_SOCKET' in os.environ:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(os.environ['POKERBOT_SOCKET'])
+    else:
+        sock = socket.create_connection(('localhost', int(sys.argv[2])))
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    stream = sock.makefile('rwb')
+while True:
+    if framed:
+        header = stream.read(2)
+        if len(header) < 2:
+            break
+        stream.read(struct.unpack('<H', header)[0])
+        stream.write(b'\\x01\\x00K')
+    else:
+        if not stream.readline():
+            break
+        stream.write(b'K\\n')
+    stream.flush()
+'''
+
+
+def deal(deck_source, num_rounds):
+    '''
+    Deals all rounds up front so that only the work on the states is measured.
+    '''
+    deals = []
+    for round_num in range(1, num_rounds + 1):
+        deck = deck_source.deck(round_num)
+        hands = [deck.deal(2), deck.deal(2)]
+        deals.append((final_street(deck), hands, deck))
+    return deals
+
+
+def simulate_round_states(deals, seed):
+    '''
+    Plays the deals with random legal actions on RoundState.
+    Returns the number of states visited and the deltas of the first player.
+    '''
+    rng = random.Random(seed)
+    summary = GameSummary(('player_1', 'player_2'), 'benchmark')
+    num_states = 0
+    deltas = []
+    for street, hands, deck in deals:
+        round_state = RoundState(0, 0, street, [SMALL_BLIND, BIG_BLIND], [STARTING_STACK - SMALL_BLIND, STARTING_STACK - BIG_BLIND], hands, deck, -1, None)
+        while not isinstance(round_state, TerminalState):
+            legal_actions = round_state.legal_actions()
+            action = rng.choice([action for action in ACTION_CLASSES if action in legal_actions])
+            action = RaiseAction(rng.randint(*round_state.raise_bounds())) if action is RaiseAction else action()
+            round_state = round_state.proceed(action, summary)
+            num_states += 1
+        deltas.append(round_state.deltas[0])
+    return num_states, deltas
+
+
+def simulate_compact_states(deals, seed):
+    '''
+    Same as simulate_round_states, but on CompactRoundState.
+    Makes the same random choices, so the deltas have to be identical.
+    '''
+    rng = random.Random(seed)
+    summary = GameSummary(('player_1', 'player_2'), 'benchmark')
+    num_states = 0
+    deltas = []
+    for street, hands, deck in deals:
+        round_state = CompactRoundState(street, hands, deck)
+        while round_state.deltas is None:
+            action = rng.choice(MASK_TO_BITS[round_state.legal_mask()])
+            amount = rng.randint(*round_state.raise_bounds()) if action == RAISE else 0
+            round_state.apply(action, amount, summary)
+            num_states += 1
+        deltas.append(round_state.deltas[0])
+    return num_states, deltas
+
+
+def verify(deals, seed):
+    '''
+    Steps RoundState and CompactRoundState side by side, compares them after every action
+    and finally undoes every action of the compact state again.
+    '''
+    rng = random.Random(seed)
+    summary = GameSummary(('player_1', 'player_2'), 'benchmark')
+    fields = lambda state: (state.button, state.street, list(state.pips), list(state.stacks), state.reached_run)
+    for round_num, (street, hands, deck) in enumerate(deals, 1):
+        round_state = RoundState(0, 0, street, [SMALL_BLIND, BIG_BLIND], [STARTING_STACK - SMALL_BLIND, STARTING_STACK - BIG_BLIND], hands, deck, -1, None)
+        compact_state = CompactRoundState(street, hands, deck)
+        history = []
+        while not isinstance(round_state, TerminalState):
+            assert fields(round_state) == fields(compact_state), round_num
+            assert round_state.legal_actions() == compact_state.legal_actions(), round_num
+            assert round_state.raise_bounds() == compact_state.raise_bounds(), round_num
+            history.append(fields(compact_state))
+            legal_actions = round_state.legal_actions()
+            action = rng.choice([action for action in ACTION_CLASSES if action in legal_actions])
+            action = RaiseAction(rng.randint(*round_state.raise_bounds())) if action is RaiseAction else action()
+            round_state = round_state.proceed(action, summary)
+            compact_state.apply(ACTION_BITS[type(action)], getattr(action, 'amount', 0))
+        assert round_state.deltas == compact_state.deltas, round_num
+        while history:
+            compact_state.undo()
+            assert fields(compact_state) == history.pop(), round_num
+        assert not compact_state.is_terminal() and not compact_state.undo_log, round_num
+
+
+def record(results, name, value, unit, higher_is_better=True):
+    results[name] = {'value': value, 'unit': unit, 'higher_is_better': higher_is_better}
+
+
+def run_benchmark(name, simulate, deals, seed):
+    start_time = time.perf_counter()
+    num_states, deltas = simulate(deals, seed)
+    duration = time.perf_counter() - start_time
+    print('{:<20} {:>10} states {:>8.3f}s {:>12,.0f} states/s {:>10,.0f} rounds/s'.format(
+        name, num_states, duration, num_states / duration, len(deals) / duration))
+    return num_states / duration, deltas
+
+
+def benchmark_showdowns(seed, num_showdowns=2000):
+    '''
+    Times showdowns of both players with eval7.evaluate and with the ShowdownEvaluator for different board lengths.
+    '''
+    rng = random.Random(seed)
+    times = {}
+    for board_length in (5, 8, 12, 20, 30, 48):
+        showdowns = []
+        for _ in range(num_showdowns):
+            cards = list(eval7.Deck().cards)
+            rng.shuffle(cards)
+            showdowns.append((cards[4:4 + board_length], cards[:2], cards[2:4]))
+        start_time = time.perf_counter()
+        for board, hand0, hand1 in showdowns:
+            eval7.evaluate(board + hand0) > eval7.evaluate(board + hand1)
+        eval7_time = (time.perf_counter() - start_time) / num_showdowns
+        evaluator = ShowdownEvaluator()
+        start_time = time.perf_counter()
+        for board, hand0, hand1 in showdowns:
+            evaluator.evaluate(board, hand0) > evaluator.evaluate(board, hand1)
+        evaluator_time = (time.perf_counter() - start_time) / num_showdowns
+        print('showdown with {:>2} board cards: eval7 {:>6.1f}us  ShowdownEvaluator {:>6.1f}us'.format(
+            board_length, eval7_time * 1e6, evaluator_time * 1e6))
+        times[board_length] = evaluator_time
+    return times
+
+
+def benchmark_hand_table(seed, num_hands=1000000):
+    '''
+    Compares the batched table evaluator with calling eval7.evaluate for every 7 card hand.
+    '''
+    rng = np.random.default_rng(seed)
+    hands = np.argsort(rng.random((num_hands, 52)), axis=1)[:, :7]
+    start_time = time.perf_counter()
+    handtable.evaluate_batch(hands)
+    table_speed = num_hands / (time.perf_counter() - start_time)
+    cards = [None] * 52
+    for card in eval7.Deck().cards:
+        cards[handtable.card_id(card)] = card
+    eval7_hands = [[cards[card] for card in hand] for hand in hands[:num_hands // 10].tolist()]
+    start_time = time.perf_counter()
+    for hand in eval7_hands:
+        eval7.evaluate(hand)
+    eval7_speed = len(eval7_hands) / (time.perf_counter() - start_time)
+    print('7 card hands: eval7 {:>12,.0f} hands/s  handtable.evaluate_batch {:>12,.0f} hands/s'.format(eval7_speed, table_speed))
+    return table_speed
+
+
+class StubPlayer():
+    '''
+    Stands in for Player in Game.run and checks or calls at once, so every round goes to showdown.
+    '''
+
+    def __init__(self, name, path, match_id, index):
+        self.name = name
+        self.path = path
+        self.index = index
+        self.bankroll = 0
+        self.game_clock = 60.
+        self.connection = None
+
+    async def start(self):
+        pass
+
+    def negotiate_protocol(self):
+        pass
+
+    def query(self, round_state, player_message, game_log, summary):
+        del player_message[1:]
+        legal_actions = {CheckAction} if isinstance(round_state, TerminalState) else round_state.legal_actions()
+        return CheckAction() if CheckAction in legal_actions else CallAction()
+
+    def stop(self):
+        pass
+
+
+def load_engine(directory, **settings):
+    '''
+    Imports engine.py, which is otherwise only run as a script, and points its settings and the summary
+    at the directory.
+    '''
+    import engine
+    overrides = {'DUPLICATE_DEALS': False, 'EARLY_STOPPING': False, 'HAND_HISTORY': False,
+                 'CHECKPOINT_INTERVAL': 0, 'RESUME': False, 'HEADLESS': False, 'GAME_LOGS_PATH': directory}
+    overrides.update(settings)
+    for name, value in overrides.items():
+        setattr(engine, name, value)
+    stats.SUMMARY_PATH = directory
+    return engine
+
+
+def benchmark_engine(num_rounds, seed, directory):
+    '''
+    Plays a whole match with Game.run against stub players, including the game log and the summary.
+    '''
+    engine = load_engine(directory, NUM_ROUNDS=num_rounds, DECK_SEED=seed)
+    game = engine.Game(engine.GameConfig('player_1', 'bots/python_skeleton', 'player_2', 'bots/python_skeleton', 'benchmark'))
+    start_time = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        game.run(engine.BotPool(StubPlayer, isolate=True))
+    speed = num_rounds / (time.perf_counter() - start_time)
+    print('engine with stub players {:>12,.0f} rounds/s'.format(speed))
+    return speed
+
+
+def protocol_messages(version, seed):
+    '''
+    The messages of a round that goes to the river, encoded for the protocol version.
+    '''
+    deck = DeckSource(seed).deck(1)
+    hands = [deck.deal(2), deck.deal(2)]
+    board = deck.peek(5)
+    rounds = [
+        [('T', None), ('P', 0), ('H', hands[0])],
+        [('C', None), ('K', None), ('B', board[:3])],
+        [('K', None), ('K', None), ('B', board[:4])],
+        [('K', None), ('K', None), ('B', board)],
+        [('K', None), ('D', 2), ('O', hands[1])],
+    ]
+    protocol = BinaryProtocol() if version == 2 else TextProtocol()
+    return [protocol.encode(clauses, 59.5) for clauses in rounds]
+
+
+def benchmark_protocol(transport, version, num_messages, seed):
+    '''
+    Sends num_messages messages to a pokerbot that answers at once. Returns the messages per second
+    and the median and 99th percentile of the round trip time.
+    '''
+    connection = BotConnection()
+    port = connection.listen(0)
+    environment, pass_fds = connection.listen_local(transport)
+    proc = subprocess.Popen([sys.executable, '-c', ECHO_BOT, SKELETON_PATH, str(port), str(version)],
+                            env=dict(os.environ, **environment), pass_fds=pass_fds)
+    connection.started()
+    try:
+        run(connection.wait_connected(CONNECT_TIMEOUT))
+        connection.framed = version == 2
+        messages = protocol_messages(version, seed)
+        latencies = []
+        for message_num in range(num_messages):
+            start_time = time.perf_counter()
+            connection.request(messages[message_num % len(messages)], CONNECT_TIMEOUT)
+            latencies.append(time.perf_counter() - start_time)
+    finally:
+        connection.close()
+        proc.wait()
+    latencies.sort()
+    speed = num_messages / sum(latencies)
+    median, p99 = latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+    print('protocol {} over {:<4} {:>10,.0f} messages/s  round trip p50 {:>6.1f}us  p99 {:>6.1f}us'.format(
+        version, transport, speed, median * 1e6, p99 * 1e6))
+    return speed, median, p99
+
+
+def benchmark_log_write(num_rounds, seed, directory):
+    '''
+    Writes the game log of num_rounds rounds that go to showdown, with the records the engine creates.
+    '''
+    engine = load_engine(directory)
+    deck = DeckSource(seed).deck(1)
+    hands = [deck.deal(2), deck.deal(2)]
+    board = deck.peek(5)
+    names = ('player_1', 'player_2')
+    log = GameLog(os.path.join(directory, 'benchmark_{}.log'.format(num_rounds)))
+    start_time = time.perf_counter()
+    for round_num in range(1, num_rounds + 1):
+        log.append('===')
+        log.append(('Round #{}, {} ({}), {} ({})', round_num, names[0], round_num, names[1], -round_num))
+        log.append(('{} posts the blind of {}', names[0], SMALL_BLIND))
+        log.append(('{} posts the blind of {}', names[1], BIG_BLIND))
+        log.append((engine.DEALT, names[0], hands[0]))
+        log.append((engine.DEALT, names[1], hands[1]))
+        log.append(('{} calls', names[0]))
+        log.append(('{} checks', names[1]))
+        for street, street_name in enumerate(engine.STREET_NAMES, 3):
+            log.append((engine.STREET, street_name, board[:street], names[0], BIG_BLIND, names[1], BIG_BLIND))
+            log.append(('{} checks', names[1]))
+            log.append(('{} checks', names[0]))
+        log.append((engine.SHOWS, names[0], hands[0]))
+        log.append((engine.SHOWS, names[1], hands[1]))
+        log.append(('{} won {}', names[0], BIG_BLIND))
+        log.append(('{} won {}', names[1], -BIG_BLIND))
+    log.close()
+    duration = time.perf_counter() - start_time
+    print('game log of {:>9,} rounds {:>8.3f}s'.format(num_rounds, duration))
+    return duration
+
+
+def benchmark_summary_write(num_rounds, seed, directory):
+    '''
+    Writes the summary of a match of num_rounds rounds.
+    '''
+    load_engine(directory)
+    rng = random.Random(seed)
+    names = ('player_1', 'player_2')
+    summary = GameSummary(names, 'benchmark_{}'.format(num_rounds))
+    # every round ends with a fold before the flop
+    preflop_state = RoundState(0, 0, 5, [SMALL_BLIND, BIG_BLIND], [STARTING_STACK - SMALL_BLIND, STARTING_STACK - BIG_BLIND], [[], []], None, -1, None)
+    for round_num in range(1, num_rounds + 1):
+        delta = rng.randint(-STARTING_STACK, STARTING_STACK)
+        summary.add_round(round_num, [0, 1], TerminalState([delta, -delta], preflop_state))
+        for index in range(2):
+            summary.add_response_time(index, None, CheckAction, rng.expovariate(1e4))
+        summary.add_round_time(1e-4, 2e-4, [60. - round_num * 1e-5, 60. - round_num * 2e-5])
+    start_time = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        summary.write_summary()
+    duration = time.perf_counter() - start_time
+    print('summary of {:>9,} rounds {:>8.3f}s'.format(num_rounds, duration))
+    return duration
+
+
+def compare(results, baseline, tolerance):
+    '''
+    Prints the change of every result against the baseline and returns the names of those that got worse
+    by more than the tolerance.
+    '''
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline or not baseline[name]['value']:
+            continue
+        change = result['value'] / baseline[name]['value'] - 1
+        worse = -change if result['higher_is_better'] else change
+        if worse > tolerance:
+            regressions.append(name)
+        print('{:<40} {:>14.6g} {:>14.6g} {:<10} {:>+7.1%}{}'.format(
+            name, baseline[name]['value'], result['value'], result['unit'], change, '  REGRESSION' if worse > tolerance else ''))
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog='python engine/benchmark.py')
+    parser.add_argument('--rounds', type=int, default=100000, help='Number of rounds to simulate, defaults to 100000')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the decks and the random policy, defaults to 0')
+    parser.add_argument('--engine-rounds', type=int, default=10000, help='Rounds of the match against stub players, defaults to 10000')
+    parser.add_argument('--messages', type=int, default=20000, help='Messages per protocol benchmark, defaults to 20000')
+    parser.add_argument('--log-rounds', type=str, default='1000,100000,1000000',
+                        help='Comma separated match lengths for the log and summary benchmarks, defaults to 1000,100000,1000000')
+    parser.add_argument('--json', type=str, help='Write the results as JSON to this file')
+    parser.add_argument('--compare', type=str, help='Compare the results with those of an earlier --json run')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Relative change that counts as a regression, defaults to 0.2')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    results = {}
+    deals = deal(DeckSource(args.seed), args.rounds)
+    verify(deals[:1000], args.seed)
+    speed, deltas = run_benchmark('RoundState', simulate_round_states, deals, args.seed)
+    compact_speed, compact_deltas = run_benchmark('CompactRoundState', simulate_compact_states, deals, args.seed)
+    assert deltas == compact_deltas, 'CompactRoundState does not match RoundState'
+    print('speedup: {:.2f}x'.format(compact_speed / speed))
+    record(results, 'RoundState states/s', speed, 'states/s')
+    record(results, 'CompactRoundState states/s', compact_speed, 'states/s')
+    for board_length, showdown_time in benchmark_showdowns(args.seed).items():
+        record(results, 'showdown with {} board cards'.format(board_length), showdown_time, 's', higher_is_better=False)
+    record(results, 'handtable hands/s', benchmark_hand_table(args.seed), 'hands/s')
+    with tempfile.TemporaryDirectory(prefix='pokerbots_benchmark_') as directory:
+        record(results, 'engine rounds/s', benchmark_engine(args.engine_rounds, args.seed, directory), 'rounds/s')
+        for version in (1, 2):
+            for transport in TRANSPORTS:
+                speed, median, p99 = benchmark_protocol(transport, version, args.messages, args.seed)
+                name = 'protocol {} over {}'.format(version, transport)
+                record(results, name + ' messages/s', speed, 'messages/s')
+                record(results, name + ' round trip p50', median, 's', higher_is_better=False)
+                record(results, name + ' round trip p99', p99, 's', higher_is_better=False)
+        for num_rounds in map(int, args.log_rounds.split(',')):
+            record(results, 'game log of {} rounds'.format(num_rounds), benchmark_log_write(num_rounds, args.seed, directory), 's', higher_is_better=False)
+            record(results, 'summary of {} rounds'.format(num_rounds), benchmark_summary_write(num_rounds, args.seed, directory), 's', higher_is_better=False)
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump({'python': platform.python_version(), 'machine': platform.platform(), 'cpus': os.cpu_count(),
+                       'args': vars(args), 'results': results}, json_file, indent=2)
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)['results']
+        print()
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(len(regressions), 'regressions:', ', '.join(regressions))
+            sys.exit(1)
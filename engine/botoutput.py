@@ -0,0 +1,111 @@
+'''
+Captures what a pokerbot prints, with bounded memory however much it prints.
+
+Both stdout and stderr of the pokerbot process are drained by their own reader thread as soon as the
+pokerbot writes, so a chatty pokerbot never blocks on a full pipe. The output goes to the bot log with at most
+PLAYER_LOG_SIZE_LIMIT bytes per match: the first half of the limit is kept as it arrives, of the rest only the
+last half of the limit is kept in a ring of lines, and a note tells how much was left out in between.
+'''
+import os
+from collections import deque
+from threading import Lock, Thread
+
+LINE_SIZE = 64 * 1024  # longer lines are read in pieces
+OMITTED = '\n... {} bytes omitted ...\n\n'
+
+
+class BotOutput():
+    '''
+    The head and tail of a pokerbot's output that was not written to its bot log yet.
+    '''
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.lock = Lock()
+        self.readers = []
+        self.path = None  # of the bot log written last
+        self.written = 0  # bytes in that bot log
+        self.reset()
+
+    def reset(self):
+        self.head = []
+        self.head_size = 0
+        self.tail = deque()
+        self.tail_size = 0
+        self.omitted = 0
+
+    def capture(self, stream):
+        '''
+        Starts a thread that reads the stream until the pokerbot closes it.
+        '''
+        reader = Thread(target=self.read, args=(stream,), daemon=True)
+        reader.start()
+        self.readers.append(reader)
+
+    def read(self, stream):
+        try:
+            for line in iter(lambda: stream.readline(LINE_SIZE), b''):
+                self.add(line)
+        except (OSError, ValueError):  # the stream was closed under us
+            pass
+
+    def add(self, data):
+        if not data:
+            return
+        with self.lock:
+            head_room = self.limit // 2 - self.head_size
+            if head_room > 0:
+                self.head.append(data[:head_room])
+                self.head_size += len(self.head[-1])
+                data = data[head_room:]
+                if not data:
+                    return
+            self.tail.append(data)
+            self.tail_size += len(data)
+            tail_limit = self.limit - self.limit // 2
+            while self.tail_size > tail_limit:
+                excess = self.tail_size - tail_limit
+                if len(self.tail[0]) <= excess:
+                    dropped = self.tail.popleft()
+                else:
+                    dropped = self.tail[0][:excess]
+                    self.tail[0] = self.tail[0][excess:]
+                self.tail_size -= len(dropped)
+                self.omitted += len(dropped)
+
+    def join(self, timeout):
+        '''
+        Waits for the reader threads to reach the end of the pokerbot's output after it exited.
+        '''
+        for reader in self.readers:
+            reader.join(timeout)
+        self.readers = [reader for reader in self.readers if reader.is_alive()]
+
+    def write(self, path):
+        '''
+        Moves the captured output to the bot log at path. Output captured later for the same path, like what the
+        pokerbot prints when it quits, is appended within what is left of the limit.
+        '''
+        with self.lock:
+            head, tail, omitted = b''.join(self.head), b''.join(self.tail), self.omitted
+            self.reset()
+        if path != self.path:
+            self.path = path
+            self.written = 0
+            mode = 'wb'
+        else:
+            mode = 'ab'
+        room = self.limit - self.written
+        if len(head) > room:
+            omitted += len(head) - room + len(tail)
+            head, tail = head[:room], b''
+        elif len(head) + len(tail) > room:
+            cut = len(head) + len(tail) - room
+            omitted += cut
+            tail = tail[cut:]
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, mode) as log_file:
+            self.written += log_file.write(head)
+            if omitted:
+                log_file.write(OMITTED.format(omitted).encode())
+            self.written += log_file.write(tail)
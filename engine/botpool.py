@@ -0,0 +1,55 @@
+'''
+Keeps pokerbots running between the matches of one engine process.
+
+A pokerbot that finished a match is not stopped but parked in the pool. When the next match needs the same
+bot, the engine sends it the new match clause (N), the pokerbot resets its GameState and acks with N, and the
+match starts without building, starting and connecting it again. A pokerbot that answers anything else is
+stopped and replaced by a fresh one. With isolate set every match gets fresh pokerbots, as if there was no pool.
+'''
+import os
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class BotPool():
+    '''
+    Idle players by bot path. Works with Player and InProcessPlayer.
+    '''
+
+    def __init__(self, player_class, isolate=False):
+        self.player_class = player_class
+        self.isolate = isolate
+        self.idle = {}
+
+    def acquire(self, name, path, match_id, index):
+        '''
+        Returns a player for the bot and whether it is already running. A player that is not running
+        still has to be built and started.
+        '''
+        idle = self.idle.get(os.path.join(BASE_DIR, path), [])
+        while idle:
+            player = idle.pop()
+            if player.new_match(name, match_id, index):
+                return player, True
+            print(player.name, 'did not acknowledge the new match, restarting it')
+            player.stop()
+        return self.player_class(name, path, match_id, index), False
+
+    def release(self, player):
+        '''
+        Parks the player of a finished match for the next one, or stops it if matches are isolated.
+        '''
+        if self.isolate:
+            player.stop()
+        else:
+            player.write_bot_log()
+            self.idle.setdefault(player.path, []).append(player)
+
+    def close(self):
+        '''
+        Stops all idle players.
+        '''
+        for players in self.idle.values():
+            for player in players:
+                player.stop()
+        self.idle.clear()
@@ -0,0 +1,145 @@
+'''
+Skips rebuilding pokerbots that did not change since their last successful build.
+
+A build is identified by a hash of the build command and the contents of every file in the bot's directory.
+The hash is taken after the build, so the build outputs are part of it: if the directory still looks exactly
+like after the last successful build, the build is skipped. The cache also remembers the hashes of single
+files by size and modification time, so unchanged files are not read again.
+
+Builds such as pip installs leave their outputs outside the bot's directory, so the hash also covers the
+environment the engine runs in: the python interpreter, the PATH the build command is looked up in and the
+distributions installed in site-packages. A fresh environment therefore builds the bots again.
+'''
+import hashlib
+import json
+import os
+import site
+import sys
+import sysconfig
+import threading
+import time
+
+# written by running the bots, so they must not invalidate the cache
+IGNORED_DIRECTORIES = {'__pycache__', '.git', '.pytest_cache', '.mypy_cache'}
+IGNORED_SUFFIXES = ('.pyc', '.pyo')
+
+
+def environment_hash():
+    '''
+    Returns the hash of the python environment: interpreter, PATH and the installed distributions.
+    '''
+    digest = hashlib.sha256(json.dumps([sys.executable, sys.prefix, os.environ.get('PATH', '')]).encode())
+    directories = {sysconfig.get_paths()['purelib'], sysconfig.get_paths()['platlib']}
+    if site.ENABLE_USER_SITE:
+        directories.add(site.getusersitepackages())
+    for directory in sorted(directories):
+        try:
+            entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+        except OSError:
+            continue
+        for entry in entries:
+            # reinstalling a distribution replaces its metadata directory, which changes its modification time
+            if entry.name.endswith(('.dist-info', '.egg-info', '.egg-link', '.pth')):
+                digest.update('{} {}\0'.format(entry.name, entry.stat().st_mtime_ns).encode())
+    return digest.hexdigest()
+
+
+class BuildCache():
+    '''
+    Successful builds by hash, stored as JSON. Safe to use from the threads that build both players.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.bot_locks = {}
+        try:
+            with open(path) as cache_file:
+                cache = json.load(cache_file)
+            self.builds = cache['builds']
+            self.files = cache['files']
+        except (FileNotFoundError, json.decoder.JSONDecodeError, KeyError):
+            self.builds = {}
+            self.files = {}
+
+    def bot_lock(self, bot_path):
+        '''
+        Returns the lock that keeps two players from building the same bot at the same time.
+        '''
+        with self.lock:
+            return self.bot_locks.setdefault(os.path.realpath(bot_path), threading.Lock())
+
+    def file_hash(self, path):
+        stat = os.stat(path)
+        with self.lock:
+            cached = self.files.get(path)
+        if cached is not None and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+        digest = hashlib.sha256()
+        with open(path, 'rb') as bot_file:
+            for chunk in iter(lambda: bot_file.read(1 << 20), b''):
+                digest.update(chunk)
+        with self.lock:
+            self.files[path] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        return digest.hexdigest()
+
+    def build_hash(self, bot_path, command):
+        '''
+        Returns the hash of the build command, the python environment and all files in the bot's directory.
+        '''
+        bot_path = os.path.realpath(bot_path)
+        digest = hashlib.sha256(json.dumps(command).encode())
+        digest.update(environment_hash().encode())  # taken after the build too, so it includes what the build installed
+        for directory, directories, files in os.walk(bot_path):
+            directories[:] = sorted(name for name in directories if name not in IGNORED_DIRECTORIES)
+            for name in sorted(files):
+                if name.endswith(IGNORED_SUFFIXES):
+                    continue
+                path = os.path.join(directory, name)
+                if os.path.isfile(path):
+                    digest.update(os.path.relpath(path, bot_path).encode() + b'\0')
+                    digest.update(self.file_hash(path).encode())
+        return digest.hexdigest()
+
+    def lookup(self, bot_path, command):
+        '''
+        Returns the record of the last successful build if the bot did not change since, otherwise None.
+        '''
+        build_hash = self.build_hash(bot_path, command)
+        with self.lock:
+            return self.builds.get(build_hash)
+
+    def record(self, bot_path, command, duration):
+        '''
+        Remembers a successful build and how long it took.
+        '''
+        build_hash = self.build_hash(bot_path, command)
+        with self.lock:
+            self.builds.pop(build_hash, None)  # the newest build of a bot comes last
+            self.builds[build_hash] = {
+                'bot': os.path.realpath(bot_path),
+                'command': command,
+                'duration': round(duration, 3),
+                'built_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+            }
+            self.save()
+
+    def save(self):
+        # keep what other engines running in parallel recorded in the meantime
+        try:
+            with open(self.path) as cache_file:
+                builds = json.load(cache_file)['builds']
+        except (FileNotFoundError, json.decoder.JSONDecodeError, KeyError):
+            builds = {}
+        builds.update(self.builds)
+        # builds of other bots are kept, old builds of the same bot are dropped
+        latest = {}
+        for build_hash, build in builds.items():
+            latest[build['bot']] = (build_hash, build)
+        self.builds = {build_hash: build for build_hash, build in latest.values()}
+        self.files = {path: entry for path, entry in self.files.items() if os.path.exists(path)}
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temporary_path = self.path + '.' + str(os.getpid())
+        with open(temporary_path, 'w') as cache_file:
+            json.dump({'builds': self.builds, 'files': self.files}, cache_file, indent=2)
+        os.replace(temporary_path, self.path)
@@ -0,0 +1,212 @@
+'''
+A shared memory channel between the engine and a pokerbot running on the same machine.
+
+The channel is a multiprocessing.shared_memory block holding two single-producer single-consumer byte rings,
+one per direction, and a doorbell per direction. The writer copies the bytes into the ring and advances its
+write counter. The reader spins on the write counter for a short while, which catches the replies of fast
+pokerbots without any system call, and only then sets its waiting flag and sleeps on the doorbell. Like a
+futex, the writer rings the doorbell if the reader is waiting, and also whenever the ring was empty before the
+write: python has no memory barriers, so without a StoreLoad barrier the reader may still see the old write
+counter after setting its flag while the writer does not see the flag yet (even on x86, whose store buffer lets
+a load pass an earlier store). As the engine
+and the pokerbots take turns, nearly every message is written to an empty ring and rings the doorbell; a reader
+that caught the message while spinning drains the spare token the next time it sleeps. The doorbells are
+pipes: they work on every POSIX system and a pipe that reaches end of file tells that the pokerbot died.
+
+Layout of ring i (0: engine to pokerbot, 1: pokerbot to engine) at offset i * (RING_HEADER + RING_SIZE):
+
+    +0    uint64 bytes written          +8    uint8 closed by the writer
+    +64   uint64 bytes read             +72   uint8 reader is waiting
+    +128  RING_SIZE bytes of data
+
+The pokerbot finds the channel in the POKERBOT_SHM environment variable as
+<shared memory name>,<fd of its doorbell>,<fd of the engine's doorbell> and rings the engine's doorbell once
+it attached.
+
+The counters are written after the data with plain stores, so a reader that sees a new counter also sees the
+data only if stores become visible in program order. x86 guarantees that; ARM and most other architectures do
+not, and a reader there could take stale bytes for a message. Python has no barrier to order the stores, so
+the engine only offers the channel where ORDERED_STORES holds and otherwise falls back to the unix domain
+socket, see transport.py.
+'''
+import os
+import platform
+import select
+import socket
+import struct
+import time
+from multiprocessing import shared_memory
+
+RING_HEADER = 128
+RING_SIZE = 1 << 16
+COUNTER = struct.Struct('<Q')
+WRITTEN, CLOSED, READ, WAITING = 0, 8, 64, 72
+CPUS = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+# seconds to spin before sleeping on the doorbell, which only helps if the other process can run meanwhile
+SPIN_TIME = 50e-6 if CPUS > 1 else 0.
+SLEEP_SLICE = 1e-3  # a sleeping reader looks at the ring at least this often
+TOKEN = COUNTER.pack(1)
+# x86 makes stores visible in program order, which the rings rely on
+ORDERED_STORES = platform.machine().lower() in ('x86_64', 'amd64', 'i386', 'i686')
+
+
+class Ring():
+    '''
+    One direction of the channel.
+    '''
+
+    def __init__(self, buffer, offset):
+        self.buffer = buffer
+        self.offset = offset
+        self.data = offset + RING_HEADER
+
+    def counter(self, field):
+        return COUNTER.unpack_from(self.buffer, self.offset + field)[0]
+
+    def set_counter(self, field, value):
+        COUNTER.pack_into(self.buffer, self.offset + field, value)
+
+    def flag(self, field):
+        return self.buffer[self.offset + field]
+
+    def set_flag(self, field, value):
+        self.buffer[self.offset + field] = value
+
+    def available(self):
+        return self.counter(WRITTEN) - self.counter(READ)
+
+    def write(self, data):
+        '''
+        Copies as much of data into the ring as fits and returns how many bytes that were.
+        '''
+        written = self.counter(WRITTEN)
+        size = min(len(data), RING_SIZE - (written - self.counter(READ)))
+        start = written % RING_SIZE
+        first = min(size, RING_SIZE - start)
+        self.buffer[self.data + start:self.data + start + first] = data[:first]
+        self.buffer[self.data:self.data + size - first] = data[first:size]
+        self.set_counter(WRITTEN, written + size)
+        return size
+
+    def read(self, size):
+        read = self.counter(READ)
+        size = min(size, self.counter(WRITTEN) - read)
+        start = read % RING_SIZE
+        first = min(size, RING_SIZE - start)
+        data = bytes(self.buffer[self.data + start:self.data + start + first]) + bytes(self.buffer[self.data:self.data + size - first])
+        self.set_counter(READ, read + size)
+        return data
+
+
+class SharedMemoryChannel():
+    '''
+    The engine's end of the channel. Behaves like the blocking socket BotConnection uses.
+    '''
+
+    def __init__(self):
+        self.memory = shared_memory.SharedMemory(create=True, size=2 * (RING_HEADER + RING_SIZE))
+        self.outgoing = Ring(self.memory.buf, 0)
+        self.incoming = Ring(self.memory.buf, RING_HEADER + RING_SIZE)
+        self.incoming.set_flag(WAITING, 1)  # the pokerbot rings once it attached
+        # the pokerbot's doorbell and the engine's doorbell, the pokerbot gets one end of each
+        self.bot_bell, self.bot_bell_write = os.pipe()
+        self.engine_bell, self.engine_bell_write = os.pipe()
+        os.set_blocking(self.engine_bell, False)
+        os.set_blocking(self.bot_bell_write, False)
+        self.timeout = None
+        self.peer_closed = False
+        self.unlinked = False
+
+    def environment(self):
+        '''
+        Returns the environment variable and the file descriptors the pokerbot process needs.
+        '''
+        description = '{},{},{}'.format(self.memory.name, self.bot_bell, self.engine_bell_write)
+        return {'POKERBOT_SHM': description}, (self.bot_bell, self.engine_bell_write)
+
+    def started(self):
+        '''
+        Closes the pokerbot's ends of the doorbells in the engine once the pokerbot process has them,
+        so that the engine's doorbell reaches end of file if the pokerbot dies.
+        '''
+        os.close(self.bot_bell)
+        os.close(self.engine_bell_write)
+        self.bot_bell = self.engine_bell_write = None
+
+    def fileno(self):
+        return self.engine_bell
+
+    def attached(self):
+        '''
+        Called when the engine's doorbell rang while waiting for the pokerbot. Returns False if the pokerbot died.
+        '''
+        if not self.drain_bell():
+            return False
+        self.unlink()  # both processes have it mapped, so it disappears with them
+        return True
+
+    def unlink(self):
+        if not self.unlinked:
+            self.memory.unlink()
+            self.unlinked = True
+
+    def drain_bell(self):
+        try:
+            if os.read(self.engine_bell, 4096) == b'':
+                self.peer_closed = True
+                return False
+        except BlockingIOError:
+            pass
+        return True
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def sendall(self, data):
+        data = memoryview(data)
+        while data:
+            empty = not self.outgoing.available()
+            data = data[self.outgoing.write(data):]
+            if empty or self.outgoing.flag(WAITING):
+                try:
+                    os.write(self.bot_bell_write, TOKEN)
+                except BlockingIOError:
+                    pass  # the doorbell rang often enough already
+            if data:
+                time.sleep(SLEEP_SLICE)  # the ring is full, wait for the pokerbot to read
+
+    def recv(self, size):
+        '''
+        Returns up to size bytes, b'' if the pokerbot closed the channel. Raises socket.timeout after the timeout.
+        '''
+        start_time = time.perf_counter()
+        spin_until = start_time + SPIN_TIME
+        deadline = None if self.timeout is None else start_time + self.timeout
+        incoming = self.incoming
+        while not incoming.available():
+            if incoming.flag(CLOSED) or self.peer_closed:
+                return b''
+            now = time.perf_counter()
+            if now < spin_until:
+                continue
+            if deadline is not None and now >= deadline:
+                raise socket.timeout
+            incoming.set_flag(WAITING, 1)
+            if not incoming.available():
+                remaining = SLEEP_SLICE if deadline is None else min(SLEEP_SLICE, deadline - now)
+                if select.select([self.engine_bell], [], [], remaining)[0]:
+                    self.drain_bell()
+            incoming.set_flag(WAITING, 0)
+        return incoming.read(size)
+
+    def close(self):
+        if self.memory is None:
+            return
+        self.outgoing.set_flag(CLOSED, 1)
+        for fd in (self.bot_bell, self.bot_bell_write, self.engine_bell, self.engine_bell_write):
+            if fd is not None:
+                os.close(fd)
+        self.outgoing = self.incoming = None
+        self.unlink()
+        self.memory.close()
+        self.memory = None
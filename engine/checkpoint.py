@@ -0,0 +1,39 @@
+'''
+Saves and restores the state of a running match, so that a crashed or preempted engine can continue it.
+'''
+import os
+import pickle
+
+CHECKPOINT_VERSION = 5
+
+
+def save_checkpoint(path, state):
+    '''
+    Writes the state next to the old checkpoint first, so a crash while saving keeps the previous one.
+    '''
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = path + '.tmp'
+    with open(temporary_path, 'wb') as checkpoint_file:
+        pickle.dump(dict(state, version=CHECKPOINT_VERSION), checkpoint_file, pickle.HIGHEST_PROTOCOL)
+        checkpoint_file.flush()
+        os.fsync(checkpoint_file.fileno())
+    os.replace(temporary_path, path)
+
+
+def load_checkpoint(path):
+    '''
+    Returns the saved state or None if there is no usable checkpoint.
+    '''
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as checkpoint_file:
+        state = pickle.load(checkpoint_file)
+    if state.get('version') != CHECKPOINT_VERSION:
+        print('Ignoring checkpoint', path, 'of an incompatible engine version')
+        return None
+    return state
+
+
+def remove_checkpoint(path):
+    if os.path.exists(path):
+        os.remove(path)
@@ -6,6 +6,8 @@ if os.path.exists(env_file): # in docker container it won't exist but will be se
     load_dotenv(env_file, override=True)
 
 DOCKERIZE_BOTS = os.environ.get('DOCKERIZE_BOTS', 'false').lower() == 'true'
+HEADLESS = os.environ.get('HEADLESS', 'false').lower() == 'true'
+BOT_TRANSPORT = os.environ.get('BOT_TRANSPORT', 'tcp').lower()
 
 PLAYER1_NAME = os.environ.get('PLAYER1_NAME', 'Player_1')
 PLAYER1_PATH = os.environ.get('PLAYER1_PATH', 'bots/python_skeleton')
@@ -15,18 +17,44 @@ PLAYER2_PATH = os.environ.get('PLAYER2_PATH', 'bots/python_skeleton')
 PLAYER2_PORT = int(os.environ.get('PLAYER2_PORT', '3002'))
 
 MATCH_ID = os.environ.get('MATCH_ID', 'match')
+NUM_MATCHES = int(os.environ.get('NUM_MATCHES', '1'))
+ISOLATE_MATCHES = os.environ.get('ISOLATE_MATCHES', 'false').lower() == 'true'
 
 PLAYER_LOG_SIZE_LIMIT = int(os.environ.get('PLAYER_LOG_SIZE_LIMIT', '524288'))
 ENFORCE_GAME_CLOCK = os.environ.get('ENFORCE_GAME_CLOCK', 'true').lower() == 'true'
 STARTING_GAME_CLOCK = float(os.environ.get('STARTING_GAME_CLOCK', '60'))
 BUILD_TIMEOUT = float(os.environ.get('BUILD_TIMEOUT', '60'))
+BUILD_CACHE = os.environ.get('BUILD_CACHE', 'true').lower() == 'true'
 CONNECT_TIMEOUT = float(os.environ.get('CONNECT_TIMEOUT', '10'))
+PROTOCOL_VERSION = int(os.environ.get('PROTOCOL_VERSION', '2'))
 
 NUM_ROUNDS = int(os.environ.get('NUM_ROUNDS', '1000'))
 STARTING_STACK = int(os.environ.get('STARTING_STACK', '100'))
 BIG_BLIND = int(os.environ.get('BIG_BLIND', '2'))
 SMALL_BLIND = int(os.environ.get('SMALL_BLIND', '1'))
 
+DECK_SEED = int(os.environ['DECK_SEED']) if os.environ.get('DECK_SEED') else None
+DUPLICATE_DEALS = os.environ.get('DUPLICATE_DEALS', 'false').lower() == 'true'
+
+EARLY_STOPPING = os.environ.get('EARLY_STOPPING', 'false').lower() == 'true'
+EARLY_STOPPING_CONFIDENCE = float(os.environ.get('EARLY_STOPPING_CONFIDENCE', '0.99'))
+EARLY_STOPPING_MARGIN = float(os.environ.get('EARLY_STOPPING_MARGIN', '0.5'))
+EARLY_STOPPING_MIN_ROUNDS = int(os.environ.get('EARLY_STOPPING_MIN_ROUNDS', '100'))
+
+HAND_HISTORY = os.environ.get('HAND_HISTORY', 'false').lower() == 'true'
+
+CHECKPOINT_INTERVAL = int(os.environ.get('CHECKPOINT_INTERVAL', '0'))
+RESUME = os.environ.get('RESUME', 'false').lower() == 'true'
+
+PROFILE = os.environ.get('PROFILE', 'off').lower()
+PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL', '0.001'))
+
 BOT_LOGS_PATH = 'logs/bot_logs'
 GAME_LOGS_PATH = 'logs/game_logs'
-SUMMARY_PATH = 'logs/summary'
\ No newline at end of file
+SUMMARY_PATH = 'logs/summary'
+HAND_HISTORY_PATH = 'logs/hand_histories'
+CHECKPOINT_PATH = 'logs/checkpoints'
+BUILD_CACHE_PATH = 'logs/build_cache.json'
+PROFILE_PATH = 'logs/profiles'
+LEADERBOARD_PATH = 'logs/leaderboard.json'
+HAND_INDEX_PATH = 'logs/hands.sqlite'
\ No newline at end of file
@@ -0,0 +1,46 @@
+'''
+Reproducible deck streams for the engine.
+'''
+import copy
+import random
+import eval7
+
+
+def final_street(deck):
+    '''
+    Returns the last street of a round dealt from deck (after the hands were dealt).
+    In the royal variant cards continue to be dealt past the river until a non-face card is dealt.
+    '''
+    street = 5
+    while deck.cards[street-1].rank in (9, 10, 11):  # jack, queen, king
+        street += 1
+    return min(street, 48)
+
+
+class DeckSource():
+    '''
+    Produces the shuffled deck of every round of a match from a single seed.
+    Every deal gets its own random generator, so any deal can be reproduced without replaying the ones before it.
+    In duplicate mode every deal is used for two consecutive rounds. As the players swap seats after every round,
+    both players get to play each set of cards (including the same run) from both seats.
+    '''
+
+    def __init__(self, seed=None, duplicate=False):
+        self.seed = seed if seed is not None else random.SystemRandom().randrange(2 ** 32)
+        self.duplicate = duplicate
+        self.template = eval7.Deck()  # creating the cards is much slower than shuffling them
+
+    def deal_index(self, round_num):
+        '''
+        Returns the index of the deal used in round round_num (starting at 1).
+        '''
+        return (round_num - 1) // 2 if self.duplicate else round_num - 1
+
+    def deck(self, round_num):
+        '''
+        Returns a freshly shuffled eval7.Deck for round round_num.
+        '''
+        deck = copy.copy(self.template)
+        deck.cards = list(self.template.cards)
+        random.Random('{}:{}'.format(self.seed, self.deal_index(round_num))).shuffle(deck.cards)
+        return deck
@@ -1,18 +1,29 @@
-import eval7
 import os
 import time
 import json
 import subprocess
 import socket
+import struct
+import asyncio
 
+from actions import FoldAction, CallAction, CheckAction, RaiseAction
+from states import CompactRoundState, TerminalState, ACTION_BITS
 from stats import GameSummary
-from config import GAME_LOGS_PATH, BOT_LOGS_PATH, NUM_ROUNDS, SMALL_BLIND, BIG_BLIND, STARTING_STACK, STARTING_GAME_CLOCK, CONNECT_TIMEOUT, BUILD_TIMEOUT, ENFORCE_GAME_CLOCK, PLAYER_LOG_SIZE_LIMIT, PLAYER1_NAME, PLAYER1_PATH, PLAYER2_NAME, PLAYER2_PATH, DOCKERIZE_BOTS, PLAYER1_PORT, PLAYER2_PORT
-from collections import namedtuple
-from queue import Queue
-from threading import Thread
+from headless import InProcessPlayer
+from dealer import DeckSource, final_street
+from gamelog import GameLog
+from checkpoint import save_checkpoint, load_checkpoint, remove_checkpoint
+from transport import BotConnection, EVENT_LOOP, run_concurrently
+from buildcache import BuildCache
+from protocol import TextProtocol, BinaryProtocol
+from botpool import BotPool
+from botoutput import BotOutput
+from profiling import Profiler
+from config import GAME_LOGS_PATH, BOT_LOGS_PATH, BUILD_CACHE, BUILD_CACHE_PATH, HAND_HISTORY_PATH, HAND_HISTORY, CHECKPOINT_PATH, CHECKPOINT_INTERVAL, RESUME, PROFILE, PROFILE_INTERVAL, PROFILE_PATH, NUM_ROUNDS, SMALL_BLIND, BIG_BLIND, STARTING_STACK, STARTING_GAME_CLOCK, CONNECT_TIMEOUT, BUILD_TIMEOUT, ENFORCE_GAME_CLOCK, PLAYER_LOG_SIZE_LIMIT, PLAYER1_NAME, PLAYER1_PATH, PLAYER2_NAME, PLAYER2_PATH, MATCH_ID, NUM_MATCHES, ISOLATE_MATCHES, DOCKERIZE_BOTS, HEADLESS, BOT_TRANSPORT, PLAYER1_PORT, PLAYER2_PORT, PROTOCOL_VERSION, DECK_SEED, DUPLICATE_DEALS, EARLY_STOPPING, EARLY_STOPPING_CONFIDENCE, EARLY_STOPPING_MARGIN, EARLY_STOPPING_MIN_ROUNDS
 import re
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUILDS = BuildCache(os.path.join(BASE_DIR, BUILD_CACHE_PATH))
 
 # Socket encoding scheme:
 #
@@ -26,26 +37,28 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 # B**,**,**,**,** the board cards in common format
 # O**,** the opponent's hand in common format
 # D### the player's bankroll delta from the round
+# N new match, the player resets its game state and acks with N
+# G#,# resumed match, the player's bankroll and the number of the next round, acked with G
 # Q game over
+# V# the highest protocol version the engine speaks, sent once after connecting
 #
 # Clauses are separated by spaces
 # Messages end with '\n'
 # The engine expects a response of K at the end of the round as an ack,
 # otherwise a response which encodes the player's action
 # Action history is sent once, including the player's actions
-
-FoldAction = namedtuple('FoldAction', [])
-CallAction = namedtuple('CallAction', [])
-CheckAction = namedtuple('CheckAction', [])
-RaiseAction = namedtuple('RaiseAction', ['amount'])
-TerminalState = namedtuple('TerminalState', ['deltas', 'previous_state'])
+# A runner that answers V2 instead of the ack switches to the binary frames described in protocol.py
 
 STREET_NAMES = ['Flop', 'Turn', 'River']
 DECODE = {'F': FoldAction, 'C': CallAction, 'K': CheckAction, 'R': RaiseAction}
-CCARDS = lambda cards: ','.join(map(str, cards))
+ENCODE = {action: code for code, action in DECODE.items()}
 PCARDS = lambda cards: '[{}]'.format(' '.join(map(str, cards)))
 PVALUE = lambda name, value: ', {} ({})'.format(name, value)
 STATUS = lambda players: ''.join([PVALUE(p.name, p.bankroll) for p in players])
+# formatters for the game log, applied by the log writer thread
+DEALT = lambda name, cards: '{} dealt {}'.format(name, PCARDS(cards))
+SHOWS = lambda name, cards: '{} shows {}'.format(name, PCARDS(cards))
+STREET = lambda street_name, board, name0, value0, name1, value1: street_name + ' ' + PCARDS(board) + PVALUE(name0, value0) + PVALUE(name1, value1)
 
 class Player():
     '''
@@ -61,8 +74,9 @@ class Player():
         self.bankroll = 0
         self.commands = None
         self.bot_subprocess = None
-        self.socketfile = None
-        self.bytes_queue = Queue()
+        self.connection = None
+        self.protocol = TextProtocol()
+        self.output = BotOutput(PLAYER_LOG_SIZE_LIMIT)
         self.player_connection = None if DOCKERIZE_BOTS else PlayerConnection(self.name, self.path, BUILD_TIMEOUT)
 
     def build(self):
@@ -84,172 +98,237 @@ class Player():
             print(self.name, 'commands.json misformatted')
 
         if self.player_connection is not None and self.commands is not None and len(self.commands['build']) > 0:
-            try:
-                proc = self.player_connection.build(self.commands['build'])
-                if proc is not None:
-                    self.bytes_queue.put(proc.stdout)
-            except subprocess.TimeoutExpired as timeout_expired:
-                error_message = 'Timed out waiting for ' + self.name + ' to build'
-                print(error_message)
-                self.bytes_queue.put(timeout_expired.stdout)
-                self.bytes_queue.put(error_message.encode())
-            except (TypeError, ValueError) as e:
-                print(e)
-                print(self.name, 'build command misformatted')
-                self.bytes_queue.put(str(e).encode())
-            except OSError as e:
-                print(e)
-                print(self.name, 'build failed - check "build" in commands.json')
-                self.bytes_queue.put(str(e).encode())
-            except Exception as e:
-                print(e)
-                self.bytes_queue.put(str(e).encode())
+            with BUILDS.bot_lock(self.path):
+                self.build_pokerbot()
 
-    def run_containerized(self):
+    def build_pokerbot(self):
+        '''
+        Runs the build command, unless the bot did not change since its last successful build.
+        '''
         try:
-            server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            if BUILD_CACHE:
+                build = BUILDS.lookup(self.path, self.commands['build'])
+                if build is not None:
+                    print(self.name, 'build skipped, unchanged since {} (took {:.1f}s)'.format(build['built_at'], build['duration']))
+                    return
+            start_time = time.perf_counter()
+            proc = self.player_connection.build(self.commands['build'])
+            duration = time.perf_counter() - start_time
+            if proc is not None:
+                self.output.add(proc.stdout)
+                self.output.add(proc.stderr)
+                if proc.returncode == 0:
+                    print(self.name, 'built in {:.1f}s'.format(duration))
+                    if BUILD_CACHE:
+                        BUILDS.record(self.path, self.commands['build'], duration)
+                else:
+                    print(self.name, 'build failed with exit code', proc.returncode)
+        except subprocess.TimeoutExpired as timeout_expired:
+            error_message = 'Timed out waiting for ' + self.name + ' to build'
+            print(error_message)
+            self.output.add(timeout_expired.stdout)
+            self.output.add(timeout_expired.stderr)
+            self.output.add(error_message.encode())
+        except (TypeError, ValueError) as e:
+            print(e)
+            print(self.name, 'build command misformatted')
+            self.output.add(str(e).encode())
+        except OSError as e:
+            print(e)
+            print(self.name, 'build failed - check "build" in commands.json')
+            self.output.add(str(e).encode())
+        except Exception as e:
+            print(e)
+            self.output.add(str(e).encode())
+
+    async def start(self):
+        '''
+        Builds and runs the pokerbot, or waits for its container to connect.
+        Both players are started concurrently on the event loop.
+        '''
+        if DOCKERIZE_BOTS:
+            await self.run_containerized()
+        else:
+            await EVENT_LOOP.run_in_executor(None, self.build)
+            await self.run()
+
+    async def run_containerized(self):
+        try:
+            connection = BotConnection()
             port = (PLAYER1_PORT if self.index == 0 else PLAYER2_PORT)
-            with server_socket:
-                print('start listening on port {} for {}'.format(port, self.name), flush=True)
-                server_socket.bind(('', port))
-                server_socket.settimeout(CONNECT_TIMEOUT)
-                server_socket.listen()
-                port = server_socket.getsockname()[1]
-                # block until we timeout or the player connects
-                client_socket, _ = server_socket.accept()
-                with client_socket:
-                    client_socket.settimeout(CONNECT_TIMEOUT)
-                    sock = client_socket.makefile('rw')
-                    self.socketfile = sock
-                    print(self.name, 'connected successfully', flush=True)
+            print('start listening on port {} for {}'.format(port, self.name), flush=True)
+            connection.listen(port)
+            # wait until we timeout or the player connects
+            await connection.wait_connected(CONNECT_TIMEOUT)
+            self.connection = connection
+            print(self.name, 'connected successfully after {:.3f}s'.format(connection.connect_time), flush=True)
         except (TypeError, ValueError) as e:
             print(e)
             print(self.name, 'run command misformatted')
-        except socket.timeout:
+        except asyncio.TimeoutError:
             print('Timed out waiting for', self.name, 'to connect. Check if the bot is running and the port is open. Did you forget to set the DOCKERIZE_BOTS=false environment variable?')
         except OSError as e:
             print(self.name, 'run failed - check "run" in commands.json;', e)
 
-    def run(self):
+    async def run(self):
         '''
         Runs the pokerbot and establishes the socket connection.
         '''
         if self.player_connection is not None and self.commands is not None and len(self.commands['run']) > 0:
             try:
-                server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                with server_socket:
-                    server_socket.bind(('', 0))
-                    server_socket.settimeout(CONNECT_TIMEOUT)
-                    server_socket.listen()
-                    port = server_socket.getsockname()[1]
-                    proc = self.player_connection.run(self.commands['run'] + [str(port)], port)
-                    self.bot_subprocess = proc
-                    # function for bot listening
-                    def enqueue_output(out, queue):
-                        try:
-                            for line in out:
-                                queue.put(line)
-                        except ValueError:
-                            pass
-                    # start a separate bot listening thread which dies with the program
-                    Thread(target=enqueue_output, args=(proc.stdout, self.bytes_queue), daemon=True).start()
-                    # block until we timeout or the player connects
-                    client_socket, _ = server_socket.accept()
-                    with client_socket:
-                        client_socket.settimeout(CONNECT_TIMEOUT)
-                        sock = client_socket.makefile('rw')
-                        self.socketfile = sock
-                        print(self.name, 'connected successfully')
+                connection = BotConnection()
+                port = connection.listen(0)
+                environment, pass_fds = connection.listen_local(BOT_TRANSPORT)
+                proc = self.player_connection.run(self.commands['run'] + [str(port)], port, environment, pass_fds)
+                connection.started()
+                self.bot_subprocess = proc
+                # drain both pipes right away, so the pokerbot never blocks on a full one
+                self.output.capture(proc.stdout)
+                self.output.capture(proc.stderr)
+                # wait until we timeout or the player connects
+                await connection.wait_connected(CONNECT_TIMEOUT)
+                self.connection = connection
+                print(self.name, 'connected successfully via {} after {:.3f}s'.format(connection.transport, connection.connect_time))
             except (TypeError, ValueError) as e:
                 print(e)
                 print(self.name, 'run command misformatted')
-            except socket.timeout:
+            except asyncio.TimeoutError:
                 print('Timed out waiting for', self.name, 'to connect')
             except OSError:
                 print(self.name, 'run failed - check "run" in commands.json')
 
+    def negotiate_protocol(self):
+        '''
+        Offers the binary protocol to the pokerbot. Runners that do not know it ack the unknown clause with K
+        and keep the text protocol.
+        '''
+        if self.connection is None or PROTOCOL_VERSION < 2:
+            return
+        try:
+            reply = self.connection.request('V{}\n'.format(PROTOCOL_VERSION), CONNECT_TIMEOUT).strip()
+        except OSError:
+            print(self.name, 'did not answer the protocol negotiation')
+            return
+        if reply == 'V2':
+            self.protocol = BinaryProtocol()
+            self.connection.framed = True
+        print(self.name, 'speaks protocol version', self.protocol.version, flush=True)
+
+    def resume(self, bankroll, game_clock, round_num):
+        '''
+        Restores the bankroll and game clock of a match continued from a checkpoint. The pokerbot starts fresh,
+        but its GameState continues with the bankroll and round number sent in the G clause, and it learns its
+        game clock from the next message.
+        '''
+        self.bankroll = bankroll
+        self.game_clock = game_clock
+        if self.connection is None:
+            return
+        try:
+            reply = self.connection.request(self.protocol.encode([('G', (bankroll, round_num))]), CONNECT_TIMEOUT)
+            if self.protocol.decode(reply)[0] == 'G':
+                return
+        except (OSError, IndexError, struct.error):
+            pass
+        print(self.name, 'did not acknowledge the resumed match, its GameState starts at round 1 with a bankroll of 0')
+
+    def new_match(self, name, match_id, index):
+        '''
+        Tells the running pokerbot that a new match starts, so it resets its GameState.
+        Returns False if the pokerbot did not acknowledge and has to be restarted.
+        '''
+        if self.connection is None or self.connection.socket is None:
+            return False
+        try:
+            reply = self.connection.request(self.protocol.encode([('N', None)]), CONNECT_TIMEOUT)
+            if self.protocol.decode(reply)[0] != 'N':
+                return False
+        except (OSError, IndexError, struct.error):
+            return False
+        self.name = name
+        self.match_id = match_id
+        self.index = index
+        self.game_clock = STARTING_GAME_CLOCK
+        self.bankroll = 0
+        return True
+
     def stop(self):
         '''
         Closes the socket connection and stops the pokerbot.
         '''
-        if self.socketfile is not None:
+        if self.connection is not None:
             try:
-                self.socketfile.write('Q\n')
-                self.socketfile.close()
-            except socket.timeout:
-                print('Timed out waiting for', self.name, 'to disconnect')
+                self.connection.close(self.protocol.encode([('Q', None)]))
             except OSError:
                 print('Could not close socket connection with', self.name)
         if self.bot_subprocess is not None:
             try:
-                outs, _ = self.bot_subprocess.communicate(timeout=CONNECT_TIMEOUT)
-                self.bytes_queue.put(outs)
+                self.bot_subprocess.wait(timeout=CONNECT_TIMEOUT)
             except subprocess.TimeoutExpired:
                 print('Timed out waiting for', self.name, 'to quit')
                 self.bot_subprocess.kill()
-                outs, _ = self.bot_subprocess.communicate()
-                self.bytes_queue.put(outs)
+                self.bot_subprocess.wait()
+            self.output.join(CONNECT_TIMEOUT)
+            self.bot_subprocess.stdout.close()
+            self.bot_subprocess.stderr.close()
+        self.write_bot_log()
 
+    def write_bot_log(self):
+        '''
+        Moves what the pokerbot printed so far to the bot log of the current match.
+        A pokerbot kept running for the next match appends the rest of its output when it stops.
+        '''
         # When bots are dockerized we don't have access to their logs in the engine
         if not DOCKERIZE_BOTS:
-            logs_dir = os.path.join(BASE_DIR, BOT_LOGS_PATH)
-            os.makedirs(logs_dir, exist_ok=True)
-            with open(os.path.join(logs_dir, self.match_id + "_" + self.name + '.txt'), 'wb') as log_file:
-                bytes_written = 0
-                for output in self.bytes_queue.queue:
-                    try:
-                        bytes_written += log_file.write(output)
-                        if bytes_written >= PLAYER_LOG_SIZE_LIMIT:
-                            break
-                    except TypeError:
-                        pass
+            self.output.write(os.path.join(BASE_DIR, BOT_LOGS_PATH, self.match_id + "_" + self.name + '.txt'))
 
     def query(self, round_state, player_message, game_log, summary: GameSummary):
         '''
         Requests one action from the pokerbot over the socket connection.
         At the end of the round, we request a CheckAction from the pokerbot.
         '''
-        legal_actions = round_state.legal_actions() if isinstance(round_state, RoundState) else {CheckAction}
-        if self.socketfile is not None and self.game_clock > 0.:
-            clause = ''
+        legal_actions = {CheckAction} if isinstance(round_state, TerminalState) else round_state.legal_actions()
+        if self.connection is not None and self.game_clock > 0.:
+            reply = ''
             try:
-                player_message[0] = 'T{:.3f}'.format(self.game_clock)
-                message = ' '.join(player_message) + '\n'
+                message = self.protocol.encode(player_message, self.game_clock)
                 del player_message[1:]  # do not send redundant action history
                 start_time = time.perf_counter()
-                self.socketfile.write(message)
-                self.socketfile.flush()
-                clause = self.socketfile.readline().strip()
+                # no single response may take longer than CONNECT_TIMEOUT or the remaining game clock
+                deadline = min(self.game_clock, CONNECT_TIMEOUT) if ENFORCE_GAME_CLOCK else CONNECT_TIMEOUT
+                reply = self.connection.request(message, deadline)
                 end_time = time.perf_counter()
                 if ENFORCE_GAME_CLOCK:
                     self.game_clock -= end_time - start_time
                 if self.game_clock <= 0.:
                     print("timeout")
                     raise socket.timeout
-                action = DECODE[clause[0]]
+                code, amount = self.protocol.decode(reply)
+                action = DECODE[code]
+                summary.add_response_time(self.index, round_state, None if isinstance(round_state, TerminalState) else action, end_time - start_time)
                 if action in legal_actions:
-                    if clause[0] == 'R':
-                        amount = int(clause[1:])
+                    if code == 'R':
+                        amount = int(amount)
                         min_raise, max_raise = round_state.raise_bounds()
                         if min_raise <= amount <= max_raise:
                             return action(amount)
                     else:
                         return action()
                 game_log.append(self.name + ' attempted illegal ' + action.__name__)
-                summary.add_illegal_action(self.name)
+                summary.add_illegal_action(self.index)
             except socket.timeout:
                 error_message = self.name + ' ran out of time'
                 game_log.append(error_message)
                 print(error_message)
                 self.game_clock = 0.
-                summary.add_timeout(self.name)
+                summary.add_timeout(self.index)
             except OSError:
                 error_message = self.name + ' disconnected'
                 game_log.append(error_message)
                 print(error_message)
                 self.game_clock = 0.
-            except (IndexError, KeyError, ValueError):
-                game_log.append(self.name + ' response misformatted: ' + str(clause))
+            except (IndexError, KeyError, ValueError, struct.error):
+                game_log.append(self.name + ' response misformatted: ' + str(reply).strip())
         return CheckAction() if CheckAction in legal_actions else FoldAction()
 
 
@@ -264,109 +343,10 @@ class PlayerConnection():
             stdout=subprocess.PIPE, stderr=subprocess.PIPE,
             cwd=self.path, timeout=self.build_timeout, check=False)
 
-    def run(self, command_string, port):
+    def run(self, command_string, port, environment=None, pass_fds=()):
         return subprocess.Popen(command_string,
             stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-            cwd=self.path)
-
-
-class RoundState(namedtuple('_RoundState', ['button', 'street', 'final_street', 'pips', 'stacks', 'hands', 'deck', 'reached_run', 'previous_state'])):
-    '''
-    Encodes the game tree for one round of poker.
-    '''
-
-    # Showdown street is no longer guaranteed to be street == 5
-    # Need to include check on final card dealt whether it is a black card (clubs or spades)
-
-    def showdown(self, summary: GameSummary):
-        '''
-        Compares the players' hands and computes payoffs.
-        '''
-        score0 = eval7.evaluate(self.deck.peek(self.final_street) + self.hands[0])
-        score1 = eval7.evaluate(self.deck.peek(self.final_street) + self.hands[1])
-        if score0 > score1:
-            delta = STARTING_STACK - self.stacks[1]
-        elif score0 < score1:
-            delta = self.stacks[0] - STARTING_STACK
-        else:  # split the pot
-            delta = (self.stacks[0] - self.stacks[1]) // 2
-            summary.num_chops += 1
-        return TerminalState([delta, -delta], self)
-
-    def legal_actions(self):
-        '''
-        Returns a set which corresponds to the active player's legal moves.
-        '''
-        active = self.button % 2
-        continue_cost = self.pips[1-active] - self.pips[active]
-        if continue_cost == 0:
-            # we can only raise the stakes if both players can afford it
-            bets_forbidden = (self.stacks[0] == 0 or self.stacks[1] == 0)
-            return {CheckAction} if bets_forbidden else {CheckAction, RaiseAction}
-        # continue_cost > 0
-        # similarly, re-raising is only allowed if both players can afford it
-        raises_forbidden = (continue_cost == self.stacks[active] or self.stacks[1-active] == 0)
-        return {FoldAction, CallAction} if raises_forbidden else {FoldAction, CallAction, RaiseAction}
-
-    def raise_bounds(self):
-        '''
-        Returns a tuple of the minimum and maximum legal raises.
-        '''
-        active = self.button % 2
-        continue_cost = self.pips[1-active] - self.pips[active]
-        max_contribution = min(self.stacks[active], self.stacks[1-active] + continue_cost)
-        min_contribution = min(max_contribution, continue_cost + max(continue_cost, BIG_BLIND))
-        return (self.pips[active] + min_contribution, self.pips[active] + max_contribution)
-
-    def proceed_street(self, summary: GameSummary):
-        '''
-        Resets the players' pips and advances the game tree to the next round of betting.
-        '''
-        # if self.street == 5:
-        #     return self.showdown()
-        if self.street == self.final_street:
-            return self.showdown(summary)
-        new_street = 3 if self.street == 0 else self.street + 1
-        if self.street < 5: 
-            reached_run = -1 
-        elif self.street == 5:
-            reached_run = self.stacks[0]
-        else:
-            reached_run = self.reached_run
-        return RoundState(1, new_street, self.final_street, [0, 0], self.stacks, self.hands, self.deck, reached_run, self)
-
-    def proceed(self, action, summary: GameSummary):
-        '''
-        Advances the game tree by one action performed by the active player.
-        '''
-        active = self.button % 2
-        if isinstance(action, FoldAction):
-            delta = self.stacks[0] - STARTING_STACK if active == 0 else STARTING_STACK - self.stacks[1]
-            return TerminalState([delta, -delta], self)
-        if isinstance(action, CallAction):
-            if self.button == 0:  # sb calls bb
-                return RoundState(1, 0, self.final_street, [BIG_BLIND] * 2, [STARTING_STACK - BIG_BLIND] * 2, self.hands, self.deck, self.reached_run, self)
-            # both players acted
-            new_pips = list(self.pips)
-            new_stacks = list(self.stacks)
-            contribution = new_pips[1-active] - new_pips[active]
-            new_stacks[active] -= contribution
-            new_pips[active] += contribution
-            state = RoundState(self.button + 1, self.street, self.final_street, new_pips, new_stacks, self.hands, self.deck, self.reached_run, self)
-            return state.proceed_street(summary)
-        if isinstance(action, CheckAction):
-            if (self.street == 0 and self.button > 0) or self.button > 1:  # both players acted
-                return self.proceed_street(summary)
-            # let opponent act
-            return RoundState(self.button + 1, self.street, self.final_street, self.pips, self.stacks, self.hands, self.deck, self.reached_run, self)
-        # isinstance(action, RaiseAction)
-        new_pips = list(self.pips)
-        new_stacks = list(self.stacks)
-        contribution = action.amount - new_pips[active]
-        new_stacks[active] -= contribution
-        new_pips[active] += contribution
-        return RoundState(self.button + 1, self.street, self.final_street, new_pips, new_stacks, self.hands, self.deck, self.reached_run, self)
-
+            cwd=self.path, env=dict(os.environ, **environment) if environment else None, pass_fds=pass_fds)
 
 
 class GameConfig:
@@ -378,6 +358,8 @@ class GameConfig:
         date_id = time.strftime('%Y%m%d%H%M%S')
         self.match_id = self.sanitize_filename(match_id) + "_" + date_id
         self.gamelog_name = self.match_id + "_" + self.player1_name + '_vs_' + self.player2_name
+        # without the date, so that a restarted engine finds the checkpoint of the match
+        self.checkpoint_name = self.sanitize_filename(match_id) + "_" + self.player1_name + '_vs_' + self.player2_name
 
     def sanitize_filename(self, name):
         return re.sub(r'[^a-zA-Z0-9_\-]', '_', name.lower())
@@ -389,74 +371,83 @@ class Game():
 
     def __init__(self, game_config):
         self.config = game_config
-        self.log = ['0.02 HPI Pokerbots - ' + self.config.player1_name + ' vs ' + self.config.player2_name]
+        self.checkpoint_path = os.path.join(BASE_DIR, CHECKPOINT_PATH, self.config.checkpoint_name + '.ckpt')
+        self.checkpoint = load_checkpoint(self.checkpoint_path) if RESUME else None
+        if self.checkpoint is not None:
+            self.config.match_id = self.checkpoint['match_id']
+            self.config.gamelog_name = self.checkpoint['gamelog_name']
+        self.log_path = os.path.join(BASE_DIR, GAME_LOGS_PATH, self.config.gamelog_name + '.log')
         self.player_messages = [[], []]
         players = (self.config.player1_name, self.config.player2_name)
+        self.hand_history = None
+        if self.checkpoint is not None:
+            self.log = GameLog(self.log_path, self.checkpoint['log_offset'])
+            self.summary = self.checkpoint['summary']
+            if self.checkpoint['hand_history'] is not None:
+                self.hand_history = self.open_hand_history(players, self.checkpoint['hand_history'])
+            self.deck_source = DeckSource(self.checkpoint['deck_seed'], self.checkpoint['duplicate_deals'])
+            return
+        self.log = GameLog(self.log_path)
+        self.log.append('0.02 HPI Pokerbots - ' + self.config.player1_name + ' vs ' + self.config.player2_name)
         self.summary = GameSummary(players, self.config.match_id)
+        if HAND_HISTORY:
+            self.hand_history = self.open_hand_history(players)
+        self.deck_source = DeckSource(DECK_SEED, DUPLICATE_DEALS)
+        self.summary.set_deck_seed(self.deck_source.seed, self.deck_source.duplicate)
+        if EARLY_STOPPING:
+            self.summary.enable_early_stopping(EARLY_STOPPING_CONFIDENCE, EARLY_STOPPING_MARGIN, EARLY_STOPPING_MIN_ROUNDS)
+
+    def open_hand_history(self, players, checkpoint=None):
+        '''
+        Opens the hand history of the match, continuing it after the checkpoint if one is given.
+        '''
+        # imported here as the hand history tools need numpy, which matches without HAND_HISTORY do not
+        from handhistory import HandHistoryWriter, FILE_EXTENSION
+        path = os.path.join(BASE_DIR, HAND_HISTORY_PATH, self.config.gamelog_name + FILE_EXTENSION)
+        return HandHistoryWriter(path, players, self.config.match_id, checkpoint=checkpoint)
 
     def log_round_state(self, players, round_state):
         '''
         Incorporates RoundState information into the game log and player messages and game summaries.
         '''
         if round_state.street == 0 and round_state.button == 0:
-            self.log.append('{} posts the blind of {}'.format(players[0].name, SMALL_BLIND))
-            self.log.append('{} posts the blind of {}'.format(players[1].name, BIG_BLIND))
-            self.log.append('{} dealt {}'.format(players[0].name, PCARDS(round_state.hands[0])))
-            self.log.append('{} dealt {}'.format(players[1].name, PCARDS(round_state.hands[1])))
-            self.player_messages[0] = ['T0.', 'P0', 'H' + CCARDS(round_state.hands[0])]
-            self.player_messages[1] = ['T0.', 'P1', 'H' + CCARDS(round_state.hands[1])]
+            self.log.append(('{} posts the blind of {}', players[0].name, SMALL_BLIND))
+            self.log.append(('{} posts the blind of {}', players[1].name, BIG_BLIND))
+            self.log.append((DEALT, players[0].name, round_state.hands[0]))
+            self.log.append((DEALT, players[1].name, round_state.hands[1]))
+            self.player_messages[0] = [('T', None), ('P', 0), ('H', round_state.hands[0])]
+            self.player_messages[1] = [('T', None), ('P', 1), ('H', round_state.hands[1])]
         elif round_state.street > 0 and round_state.button == 1:
             board = round_state.deck.peek(round_state.street)
             street_name = STREET_NAMES[round_state.street - 3] if round_state.street < 6 else 'Run'
-            self.log.append(street_name + ' ' + PCARDS(board) +
-                            PVALUE(players[0].name, STARTING_STACK-round_state.stacks[0]) +
-                            PVALUE(players[1].name, STARTING_STACK-round_state.stacks[1]))
-            compressed_board = 'B' + CCARDS(board)
-            self.player_messages[0].append(compressed_board)
-            self.player_messages[1].append(compressed_board)
-
-    def record_pfr(self, name, action, can_raise):
-        if can_raise:
-            self.summary.add_pfr_opportunity(name)
-            if isinstance(action, RaiseAction):
-                self.summary.add_pfr(name)
-    
-    def record_vpip(self, name, action):
-        self.summary.add_vpip_opportunity(name)
-        if (isinstance(action, CallAction) or isinstance(action, RaiseAction)):
-            self.summary.add_vpip(name)
-
-    def record_preflop_action(self, name, action, can_raise):
-        self.record_vpip(name, action)
-        self.record_pfr(name, action, can_raise)
-
-    def record_action_for_stats(self, name, action, is_pre_flop_action, can_raise):
-        if is_pre_flop_action:
-            self.record_preflop_action(name, action, can_raise)
+            self.log.append((STREET, street_name, board,
+                             players[0].name, STARTING_STACK-round_state.stacks[0],
+                             players[1].name, STARTING_STACK-round_state.stacks[1]))
+            self.player_messages[0].append(('B', board))
+            self.player_messages[1].append(('B', board))
 
     def log_action(self, name, action, bet_override):
         '''
         Incorporates action information into the game log and player messages and game summaries.
         '''
         if isinstance(action, FoldAction):
-            phrasing = ' folds'
-            code = 'F'
+            record = ('{} folds', name)
+            clause = ('F', None)
         elif isinstance(action, CallAction):
-            phrasing = ' calls'
-            code = 'C'
+            record = ('{} calls', name)
+            clause = ('C', None)
         elif isinstance(action, CheckAction):
-            phrasing = ' checks'
-            code = 'K'
+            record = ('{} checks', name)
+            clause = ('K', None)
         else:  # isinstance(action, RaiseAction)
-            phrasing = (' bets ' if bet_override else ' raises to ') + str(action.amount)
-            code = 'R' + str(action.amount)
-        self.log.append(name + phrasing)
-        self.player_messages[0].append(code)
-        self.player_messages[1].append(code)
+            record = ('{} bets {}' if bet_override else '{} raises to {}', name, action.amount)
+            clause = ('R', action.amount)
+        self.log.append(record)
+        self.player_messages[0].append(clause)
+        self.player_messages[1].append(clause)
 
     def summarize_round(self, players, round_state, round_num: int):
-        name_to_delta = {players[0].name: round_state.deltas[0], players[1].name: round_state.deltas[1]}
-        self.summary.add_round(round_num, name_to_delta)
+        self.summary.add_round(round_num, [players[0].index, players[1].index], round_state)
 
     def log_terminal_state(self, players, round_state):
         '''
@@ -464,25 +455,36 @@ class Game():
         '''
         previous_state = round_state.previous_state
         if FoldAction not in previous_state.legal_actions():
-            self.log.append('{} shows {}'.format(players[0].name, PCARDS(previous_state.hands[0])))
-            self.log.append('{} shows {}'.format(players[1].name, PCARDS(previous_state.hands[1])))
-            self.player_messages[0].append('O' + CCARDS(previous_state.hands[1]))
-            self.player_messages[1].append('O' + CCARDS(previous_state.hands[0]))
-        self.log.append('{} awarded {}'.format(players[0].name, round_state.deltas[0]))
-        self.log.append('{} awarded {}'.format(players[1].name, round_state.deltas[1]))
-        self.player_messages[0].append('D' + str(round_state.deltas[0]))
-        self.player_messages[1].append('D' + str(round_state.deltas[1]))
+            self.log.append((SHOWS, players[0].name, previous_state.hands[0]))
+            self.log.append((SHOWS, players[1].name, previous_state.hands[1]))
+            self.player_messages[0].append(('O', previous_state.hands[1]))
+            self.player_messages[1].append(('O', previous_state.hands[0]))
+        self.log.append(('{} awarded {}', players[0].name, round_state.deltas[0]))
+        self.log.append(('{} awarded {}', players[1].name, round_state.deltas[1]))
+        self.player_messages[0].append(('D', round_state.deltas[0]))
+        self.player_messages[1].append(('D', round_state.deltas[1]))
 
         if previous_state.reached_run > 0: 
             self.log.append('Run reached')
             pre_run_contribution = STARTING_STACK - previous_state.reached_run
             # print('pre_run_contribution', pre_run_contribution)
             if round_state.deltas[0] > round_state.deltas[1]:
-                self.log.append('{} won {}'.format(players[0].name, round_state.deltas[0] - pre_run_contribution))
-                self.log.append('{} won {}'.format(players[1].name, round_state.deltas[1] + pre_run_contribution))
+                self.log.append(('{} won {}', players[0].name, round_state.deltas[0] - pre_run_contribution))
+                self.log.append(('{} won {}', players[1].name, round_state.deltas[1] + pre_run_contribution))
             else:
-                self.log.append('{} won {}'.format(players[0].name, round_state.deltas[0] + pre_run_contribution))
-                self.log.append('{} won {}'.format(players[1].name, round_state.deltas[1] - pre_run_contribution))
+                self.log.append(('{} won {}', players[0].name, round_state.deltas[0] + pre_run_contribution))
+                self.log.append(('{} won {}', players[1].name, round_state.deltas[1] - pre_run_contribution))
+
+    def deal(self, round_num):
+        '''
+        Returns the deck of the round, the hands dealt from it and the final street.
+        '''
+        deck = self.deck_source.deck(round_num)
+        hands = [deck.deal(2), deck.deal(2)]
+
+        # eval7 card euits are defined as ('c', 'd', 'h', 's')
+        
+        return deck, hands, final_street(deck)
 
     def run_round(self, players, round_num):
         '''
@@ -491,87 +493,171 @@ class Game():
 
         # ROYAL VARIANT ENTAILS THAT CARDS MAY CONTINUE TO BE DEALT PAST THE RIVER UNTIL A NON-FACE CARD IS DEALT
 
-        deck = eval7.Deck()
-        deck.shuffle()
-        hands = [deck.deal(2), deck.deal(2)]
-
-        # eval7 card euits are defined as ('c', 'd', 'h', 's')
-        
-        FINAL_STREET = 5 
-        while deck.cards[FINAL_STREET-1].rank in (9, 10, 11): 
-            FINAL_STREET += 1
-        
-        if FINAL_STREET > 48:
-            FINAL_STREET = 48
+        deck, hands, FINAL_STREET = self.deal(round_num)
 
-        pips = [SMALL_BLIND, BIG_BLIND]
-        stacks = [STARTING_STACK - SMALL_BLIND, STARTING_STACK - BIG_BLIND]
-        round_state = RoundState(0, 0, FINAL_STREET, pips, stacks, hands, deck, -1, None)
-        while not isinstance(round_state, TerminalState):
+        # the actions are applied in place, the players and the summary see the state before each action
+        round_state = CompactRoundState(FINAL_STREET, hands, deck)
+        actions = []
+        self.summary.new_round()
+        while not round_state.is_terminal():
             self.log_round_state(players, round_state)
             active = round_state.button % 2
             player:Player = players[active]
             action = player.query(round_state, self.player_messages[active], self.log, self.summary)
-            bet_override = (round_state.pips == [0, 0])
+            bet_override = (round_state.pips[0] == round_state.pips[1] == 0)
             self.log_action(player.name, action, bet_override)
-
-            is_pre_flop_action = (round_state.street == 0)
-            can_raise = RaiseAction in round_state.legal_actions()
-            self.record_action_for_stats(player.name, action, is_pre_flop_action, can_raise)
-
-            round_state = round_state.proceed(action, self.summary)
+            amount = getattr(action, 'amount', 0)
+            actions.append((player.index, round_state.street, ENCODE[type(action)], amount))
+            self.summary.add_action(player.index, round_state, action)
+            round_state.apply(ACTION_BITS[type(action)], amount, self.summary)
+        round_state = TerminalState(round_state.deltas, round_state.to_round_state())
         self.log_terminal_state(players, round_state)
         self.summarize_round(players, round_state, round_num)
         for player, player_message, delta in zip(players, self.player_messages, round_state.deltas):
             player.query(round_state, player_message, self.log, self.summary)
             player.bankroll += delta
+        if self.hand_history is not None:
+            self.record_hand_history(players, round_state, round_num, actions)
 
-    def run(self):
+    def record_hand_history(self, players, round_state, round_num, actions):
+        '''
+        Adds the round to the hand history, with the players in the order of the match instead of the seats.
+        '''
+        previous_state = round_state.previous_state
+        seats = [players[0].index, players[1].index]
+        deltas = [round_state.deltas[seats.index(0)], round_state.deltas[seats.index(1)]]
+        clocks = [players[seats.index(0)].game_clock, players[seats.index(1)].game_clock]
+        hands = [previous_state.hands[seats.index(0)], previous_state.hands[seats.index(1)]]
+        board = previous_state.deck.peek(previous_state.street)
+        showdown = FoldAction not in previous_state.legal_actions()
+        pot = 2 * STARTING_STACK - previous_state.stacks[0] - previous_state.stacks[1]
+        self.hand_history.add_round(round_num, seats[0], previous_state.final_street, previous_state.street,
+                                    showdown, deltas, pot, clocks, hands, board, actions)
+
+    def save_checkpoint(self, players, round_num):
+        '''
+        Saves everything needed to continue the match after round_num, once the logs are written up to this round.
+        '''
+        players = sorted(players, key=lambda player: player.index)
+        save_checkpoint(self.checkpoint_path, {
+            'match_id': self.config.match_id,
+            'gamelog_name': self.config.gamelog_name,
+            'round_num': round_num,
+            'bankrolls': [player.bankroll for player in players],
+            'game_clocks': [player.game_clock for player in players],
+            'deck_seed': self.deck_source.seed,
+            'duplicate_deals': self.deck_source.duplicate,
+            'summary': self.summary,
+            'log_offset': self.log.sync(),
+            'hand_history': None if self.hand_history is None else self.hand_history.checkpoint(),
+        })
+
+    def run(self, pool=None):
+        '''
+        Plays the match. Players are taken from the pool and given back to it afterwards, so that a pool
+        shared by several matches keeps the pokerbots running between them.
+        '''
         print('Starting the pbc engine...', flush=True)
-        players = [
-            Player(self.config.player1_name, self.config.player1_path, self.config.match_id, 0),
-            Player(self.config.player2_name, self.config.player2_path, self.config.match_id, 1)
+        first_round = 1
+        if self.checkpoint is not None:
+            first_round = self.checkpoint['round_num'] + 1
+            print('Resuming the match from the checkpoint after round', self.checkpoint['round_num'], flush=True)
+        elif RESUME:
+            print('No checkpoint found at', os.path.normpath(self.checkpoint_path), '- starting a new match', flush=True)
+        print('Deck seed: {}{}'.format(self.deck_source.seed, ' (duplicate deals)' if self.deck_source.duplicate else ''), flush=True)
+        print('Writing logs to', os.path.normpath(self.log_path), flush=True)
+        # without a pool the players of this match are stopped at its end
+        own_pool = pool is None
+        if own_pool:
+            pool = BotPool(InProcessPlayer if HEADLESS else Player, isolate=True)
+        acquired = [
+            pool.acquire(self.config.player1_name, self.config.player1_path, self.config.match_id, 0),
+            pool.acquire(self.config.player2_name, self.config.player2_path, self.config.match_id, 1)
         ]
-        for player in players:
-            if DOCKERIZE_BOTS:
-                player.run_containerized()
-            else:
+        players = [player for player, _ in acquired]
+        started = [player for player, running in acquired if not running]
+        if len(started) < len(players):
+            print('Reusing', ', '.join(player.name for player, running in acquired if running), 'from the previous match', flush=True)
+        if HEADLESS:
+            for player in started:
                 player.build()
                 player.run()
+        elif started:
+            run_concurrently([player.start() for player in started])
+            for player in started:
+                player.negotiate_protocol()
+        if self.checkpoint is not None:
+            for player in players:
+                player.resume(self.checkpoint['bankrolls'][player.index], self.checkpoint['game_clocks'][player.index], first_round)
+            # the players swap seats after every round
+            if first_round % 2 == 0:
+                players = players[::-1]
         print(f'Players connected successfully. Starting {NUM_ROUNDS} rounds...', flush=True)
-        for round_num in range(1, NUM_ROUNDS + 1):
+        for round_num in range(first_round, NUM_ROUNDS + 1):
+            start_time = time.perf_counter()
+            response_time = self.summary.total_response_time
             self.log.append('===')
-            self.log.append('Round #' + str(round_num) + STATUS(players))
-            if round_num % (NUM_ROUNDS // 10) == 0:
-                name_to_bankrolls = {player.name: player.bankroll for player in players}
-                self.summary.add_bankrolls(round_num, name_to_bankrolls)
+            self.log.append(('Round #{}, {} ({}), {} ({})', round_num, players[0].name, players[0].bankroll, players[1].name, players[1].bankroll))
             self.run_round(players, round_num)
+            self.summary.add_round_time(time.perf_counter() - start_time, self.summary.total_response_time - response_time,
+                                        [player.game_clock for player in sorted(players, key=lambda player: player.index)])
             players = players[::-1]
+            # in duplicate mode only stop after both rounds of a deal were played
+            if self.summary.is_decided() and not (self.deck_source.duplicate and round_num % 2 == 1):
+                print('Stopping early after round', round_num, flush=True)
+                self.summary.stop_early(round_num)
+                break
+            if CHECKPOINT_INTERVAL > 0 and round_num % CHECKPOINT_INTERVAL == 0 and round_num < NUM_ROUNDS:
+                self.save_checkpoint(players, round_num)
         self.log.append('')
         self.log.append('Final' + STATUS(players))
-        
-        for player in players:
-            player.stop()
-        name = self.config.gamelog_name + '.log'
-
-        gamelogs_path = os.path.join(BASE_DIR, GAME_LOGS_PATH)
-        print('Writing logs to', os.path.normpath(os.path.join(gamelogs_path, name)))
-        os.makedirs(gamelogs_path, exist_ok=True)
+        self.log.close()
+        if self.hand_history is not None:
+            self.hand_history.close()
 
-        with open(os.path.join(gamelogs_path, name), 'w') as log_file:
-            log_file.write('\n'.join(self.log))
+        for player in players:
+            pool.release(player)
+        if own_pool:
+            pool.close()
 
         print('Players:', self.config.player1_name, 'vs.', self.config.player2_name)
-        print('Result:', self.summary.discretized_bankrolls[-1][1][0], 'vs.', self.summary.discretized_bankrolls[-1][1][1])
-
-        self.summary.set_logs(self.log)
+        bankrolls = self.summary.get_bankrolls()
+        print('Result:', bankrolls[0], 'vs.', bankrolls[1])
+
+        if not HEADLESS:
+            # players kept from an earlier match did not connect for this one
+            for player in started:
+                if player.connection is not None:
+                    self.summary.set_connection_times(player.index, player.connection.connect_time, player.connection.handshake_time)
+        self.summary.set_log_file(os.path.relpath(self.log_path, BASE_DIR))
         self.summary.write_summary()
+        remove_checkpoint(self.checkpoint_path)
         
 
 if __name__ == '__main__':
-    Game(GameConfig(
-        PLAYER1_NAME,
-        PLAYER1_PATH,
-        PLAYER2_NAME,
-        PLAYER2_PATH
-    )).run()
+    pool = BotPool(InProcessPlayer if HEADLESS else Player, isolate=ISOLATE_MATCHES)
+    try:
+        for match_num in range(1, NUM_MATCHES + 1):
+            match_id = MATCH_ID if NUM_MATCHES == 1 else '{}_{}'.format(MATCH_ID, match_num)
+            game = Game(GameConfig(
+                PLAYER1_NAME,
+                PLAYER1_PATH,
+                PLAYER2_NAME,
+                PLAYER2_PATH,
+                match_id
+            ))
+            if PROFILE in ('cprofile', 'sample'):
+                profiler = Profiler(PROFILE, PROFILE_INTERVAL)
+                profiler.instrument(Game, 'deal', 'deal')
+                profiler.instrument(InProcessPlayer if HEADLESS else Player, 'query', 'query')
+                profiler.instrument(CompactRoundState, 'apply', 'proceed')
+                profiler.instrument(CompactRoundState, 'showdown', 'showdown')
+                for method in ('log_round_state', 'log_action', 'log_terminal_state', 'record_hand_history'):
+                    profiler.instrument(Game, method, 'log')
+                profiler.instrument(GameLog, 'close', 'log')
+                profiler.instrument(GameSummary, 'write_summary', 'summary write')
+                profiler.run(lambda: game.run(pool), os.path.join(BASE_DIR, PROFILE_PATH, game.config.gamelog_name))
+            else:
+                game.run(pool)
+    finally:
+        pool.close()
@@ -0,0 +1,105 @@
+'''
+Streams the game log to disk on a background thread.
+'''
+import os
+from queue import Queue
+from threading import Thread
+
+BATCH_SIZE = 1024  # records handed to the writer at once
+MAX_PENDING_BATCHES = 64  # the engine waits for the writer if it falls further behind
+
+
+def format_record(record):
+    '''
+    Records are either finished lines or tuples of a format string (or function) and its arguments.
+    '''
+    if isinstance(record, str):
+        return record
+    template = record[0]
+    return template(*record[1:]) if callable(template) else template.format(*record[1:])
+
+
+class GameLog():
+    '''
+    Collects log records and hands them to a writer thread in batches.
+    The records are only formatted by the writer, so logging costs the engine little more than creating a tuple.
+    '''
+
+    def __init__(self, path, offset=None):
+        self.path = path
+        self.offset = offset or 0
+        self.resume = offset is not None
+        self.batch = []
+        self.queue = Queue(MAX_PENDING_BATCHES)
+        self.error = None  # what stopped the writer, raised again in the engine
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.writer = Thread(target=self.write_batches, name='GameLogWriter', daemon=True)
+        self.writer.start()
+
+    def append(self, record):
+        self.batch.append(record)
+        if len(self.batch) >= BATCH_SIZE:
+            self.check_error()
+            self.queue.put(self.batch)
+            self.batch = []
+
+    def check_error(self):
+        if self.error is not None:
+            raise self.error
+
+    def open_log(self):
+        # a resumed log is cut back to the offset of the checkpoint and continued from there
+        log_file = open(self.path, 'r+' if self.resume else 'w')
+        if self.resume:
+            log_file.seek(self.offset)
+            log_file.truncate()
+        return log_file
+
+    def write_batches(self):
+        log_file = None
+        try:
+            log_file = self.open_log()
+        except OSError as e:
+            self.error = e
+        separator = '\n' if self.offset else ''
+        while True:
+            batch = self.queue.get()
+            try:
+                if batch is None:
+                    break
+                if self.error is None:
+                    log_file.write(separator + '\n'.join(map(format_record, batch)))
+                    separator = '\n'
+                    log_file.flush()
+                    self.offset = log_file.tell()
+            except Exception as e:
+                # after an error the batches are still taken, so the engine never waits for the writer forever
+                self.error = e
+            finally:
+                self.queue.task_done()
+        if log_file is not None:
+            log_file.close()
+
+    def sync(self):
+        '''
+        Waits until all records are written and returns the size of the log file.
+        Raises the error that stopped the writer, if any.
+        '''
+        if self.batch:
+            self.queue.put(self.batch)
+            self.batch = []
+        self.queue.join()
+        self.check_error()
+        return self.offset
+
+    def close(self):
+        '''
+        Writes the remaining records and waits for the writer to finish.
+        Raises the error that stopped the writer, if any.
+        '''
+        if self.batch:
+            self.queue.put(self.batch)
+            self.batch = []
+        self.queue.put(None)
+        self.writer.join()
+        self.check_error()
@@ -0,0 +1,317 @@
+'''
+Binary columnar hand histories.
+
+A hand history file stores the rounds of one match in blocks of BLOCK_SIZE rounds. Every block holds one
+array per column, compressed separately with zlib, so a single round or a single column can be read
+without touching the rest of the file.
+
+Files are memory-mapped for reading. Uncompressed columns (compression level 0) are returned as read-only
+NumPy views into the map without copying, compressed columns are decompressed once and cached.
+
+Layout (little endian):
+- MAGIC, the length of the JSON header and the header (players, match id, block size, compression, columns)
+- the blocks, column after column
+- the index: offset, stored length and raw length of every column of every block (uint64)
+- the trailer: offset of the index, number of blocks, number of rounds and MAGIC
+
+Per round columns are indexed by the position of the round in the file. Players are referred to by their
+index in the header, i.e. the order of PLAYER1 and PLAYER2 in the match, independent of the seat.
+The actions and board cards of a round are stored in columns of their own, action_offset and board_offset
+hold the position of the first action and board card of every round within its block.
+Cards are encoded as rank * 4 + suit with ranks 0 (two) to 12 (ace) and suits c, d, h, s.
+
+Convert existing text logs with: python engine/handhistory.py logs/game_logs/*.log
+'''
+import argparse
+import json
+import mmap
+import os
+import struct
+import zlib
+import numpy as np
+from array import array
+
+from logparser import GameLogParser
+
+MAGIC = b'PBHH'
+TRAILER = struct.Struct('<QII4s')
+BLOCK_SIZE = 4096
+COMPRESSION_LEVEL = 6
+FILE_EXTENSION = '.phh'
+
+# name, array typecode and values per round
+ROUND_COLUMNS = [
+    ('round_num', 'i', 1),
+    ('button', 'B', 1),  # the player in the small blind, who acts first preflop
+    ('final_street', 'B', 1),  # 0 if unknown (converted from a log without showdown)
+    ('street', 'B', 1),  # the street the round ended on (0, 3, 4, 5 or the length of the run)
+    ('showdown', 'B', 1),
+    ('deltas', 'i', 2),
+    ('pot', 'i', 1),  # chips both players put in
+    ('clocks', 'f', 2),  # remaining game clocks after the round, nan if unknown
+    ('hands', 'B', 4),
+    ('action_offset', 'I', 1),
+    ('board_offset', 'I', 1),
+]
+# name, array typecode; one value per action or board card
+ACTION_COLUMNS = [
+    ('action_player', 'B'),
+    ('action_street', 'B'),
+    ('action_code', 'B'),  # ord of F, C, K or R as in the socket protocol
+    ('action_amount', 'i'),  # the raise amount, 0 for other actions
+]
+BOARD_COLUMNS = [
+    ('board', 'B'),
+]
+COLUMNS = [(name, typecode) for name, typecode, _ in ROUND_COLUMNS] + ACTION_COLUMNS + BOARD_COLUMNS
+CARD_IDS = {rank + suit: r * 4 + s for r, rank in enumerate('23456789TJQKA') for s, suit in enumerate('cdhs')}
+CARD_NAMES = {card_id: name for name, card_id in CARD_IDS.items()}
+
+
+class HandHistoryWriter():
+    '''
+    Appends rounds to a hand history file and writes a block whenever BLOCK_SIZE rounds are collected.
+    '''
+
+    def __init__(self, path, players, match_id, block_size=BLOCK_SIZE, compression_level=COMPRESSION_LEVEL, checkpoint=None):
+        self.path = path
+        self.block_size = block_size
+        self.compression_level = compression_level
+        if checkpoint is not None:
+            # continue a file after a crash, dropping everything written after the checkpoint
+            self.file = open(path, 'r+b')
+            self.file.seek(checkpoint['offset'])
+            self.file.truncate()
+            self.num_rounds = checkpoint['num_rounds']
+            self.index = checkpoint['index']
+            self.columns = checkpoint['columns']
+            self.block_rounds = checkpoint['block_rounds']
+            return
+        self.num_rounds = 0
+        self.index = array('Q')
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.file = open(path, 'wb')
+        header = json.dumps({
+            'players': list(players),
+            'match_id': match_id,
+            'block_size': block_size,
+            'compression': 'zlib' if compression_level > 0 else None,
+            'columns': COLUMNS,
+        }).encode()
+        self.file.write(MAGIC + struct.pack('<I', len(header)) + header)
+        self.new_block()
+
+    def new_block(self):
+        self.columns = {name: array(typecode) for name, typecode in COLUMNS}
+        self.block_rounds = 0
+
+    def add_round(self, round_num, button, final_street, street, showdown, deltas, pot, clocks, hands, board, actions):
+        '''
+        Adds one round. hands are the two cards of both players, cards are eval7.Cards or strings like 'Ah'.
+        actions are tuples of player, street, code ('F', 'C', 'K' or 'R') and amount.
+        '''
+        columns = self.columns
+        columns['round_num'].append(round_num)
+        columns['button'].append(button)
+        columns['final_street'].append(final_street)
+        columns['street'].append(street)
+        columns['showdown'].append(showdown)
+        columns['deltas'].extend(deltas)
+        columns['pot'].append(pot)
+        columns['clocks'].extend(clocks)
+        columns['hands'].extend([CARD_IDS[str(card)] for hand in hands for card in hand])
+        columns['action_offset'].append(len(columns['action_code']))
+        columns['board_offset'].append(len(columns['board']))
+        for player, action_street, code, amount in actions:
+            columns['action_player'].append(player)
+            columns['action_street'].append(action_street)
+            columns['action_code'].append(ord(code))
+            columns['action_amount'].append(amount)
+        columns['board'].extend([CARD_IDS[str(card)] for card in board])
+        self.num_rounds += 1
+        self.block_rounds += 1
+        if self.block_rounds == self.block_size:
+            self.write_block()
+
+    def write_block(self):
+        for name, _ in COLUMNS:
+            data = self.columns[name].tobytes()
+            stored = zlib.compress(data, self.compression_level) if self.compression_level > 0 else data
+            self.index.extend([self.file.tell(), len(stored), len(data)])
+            self.file.write(stored)
+        self.new_block()
+
+    def checkpoint(self):
+        '''
+        Returns the state needed to continue the file with the checkpoint argument of the constructor.
+        '''
+        self.file.flush()
+        return {
+            'offset': self.file.tell(),
+            'num_rounds': self.num_rounds,
+            'index': array('Q', self.index),
+            'columns': {name: array(values.typecode, values) for name, values in self.columns.items()},
+            'block_rounds': self.block_rounds,
+        }
+
+    def close(self):
+        '''
+        Writes the last block, the index and the trailer.
+        '''
+        if self.block_rounds:
+            self.write_block()
+        index_offset = self.file.tell()
+        self.file.write(self.index.tobytes())
+        num_blocks = len(self.index) // (3 * len(COLUMNS))
+        self.file.write(TRAILER.pack(index_offset, num_blocks, self.num_rounds, MAGIC))
+        self.file.close()
+
+
+class HandHistoryReader():
+    '''
+    Reads single rounds and whole columns of a memory-mapped hand history file as NumPy arrays.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, header_length = struct.unpack_from('<4sI', self.buffer)
+        if magic != MAGIC:
+            raise ValueError(path + ' is not a hand history file')
+        self.header = json.loads(self.buffer[8:8 + header_length])
+        self.players = self.header['players']
+        self.block_size = self.header['block_size']
+        self.columns = {name: np.dtype(typecode) for name, typecode in self.header['columns']}
+        self.column_ids = {name: i for i, (name, _) in enumerate(self.header['columns'])}
+        self.widths = {name: width for name, _, width in ROUND_COLUMNS}
+        self.compressed = self.header['compression'] == 'zlib'
+        index_offset, self.num_blocks, self.num_rounds, magic = TRAILER.unpack_from(self.buffer, len(self.buffer) - TRAILER.size)
+        if magic != MAGIC:
+            raise ValueError(path + ' is incomplete, the match was not finished')
+        self.index = np.frombuffer(self.buffer, dtype='<u8', count=self.num_blocks * len(self.columns) * 3, offset=index_offset)
+        self.index = self.index.reshape(self.num_blocks, len(self.columns), 3)
+        self.block_cache = {}
+        self.column_cache = {}
+
+    def __len__(self):
+        return self.num_rounds
+
+    def close(self):
+        self.block_cache.clear()
+        self.column_cache.clear()
+        self.index = None
+        try:
+            self.buffer.close()
+        except BufferError:
+            pass  # arrays handed out still point into the map, it is closed once they are gone
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def read_block_column(self, block, name):
+        '''
+        Returns one column of one block, with a second axis for columns with several values per round.
+        '''
+        values = self.block_cache.get((block, name))
+        if values is not None:
+            return values
+        offset, stored_length, raw_length = (int(value) for value in self.index[block, self.column_ids[name]])
+        dtype = self.columns[name]
+        if self.compressed:
+            values = np.frombuffer(zlib.decompress(self.buffer[offset:offset + stored_length]), dtype=dtype)
+        else:
+            values = np.frombuffer(self.buffer, dtype=dtype, count=raw_length // dtype.itemsize, offset=offset)
+        width = self.widths.get(name, 1)
+        values = values.reshape(-1, width) if width > 1 else values
+        self.block_cache[block, name] = values
+        return values
+
+    def column(self, name):
+        '''
+        Returns a column for all rounds. The offsets of actions and board cards are converted to positions in the whole column.
+        Columns that fit into one block are views of the block, longer ones are concatenated once and cached.
+        '''
+        values = self.column_cache.get(name)
+        if values is not None:
+            return values
+        if self.num_blocks == 0:
+            values = np.zeros((0, self.widths[name]) if self.widths.get(name, 1) > 1 else 0, dtype=self.columns[name])
+        elif name in ('action_offset', 'board_offset'):
+            values_name = 'action_code' if name == 'action_offset' else 'board'
+            lengths = self.index[:, self.column_ids[values_name], 2].astype(np.int64) // self.columns[values_name].itemsize
+            starts = np.cumsum(lengths) - lengths
+            values = np.concatenate([self.read_block_column(block, name).astype(np.int64) + starts[block]
+                                     for block in range(self.num_blocks)])
+        elif self.num_blocks == 1:
+            values = self.read_block_column(0, name)
+        else:
+            values = np.concatenate([self.read_block_column(block, name) for block in range(self.num_blocks)])
+        self.column_cache[name] = values
+        return values
+
+    def round(self, position):
+        '''
+        Returns the round at the position in the file as a dict.
+        '''
+        if not 0 <= position < self.num_rounds:
+            raise IndexError(position)
+        block, row = divmod(position, self.block_size)
+        read = lambda name: self.read_block_column(block, name)
+        values = {name: read(name)[row].tolist() for name, _, _ in ROUND_COLUMNS}
+        action_offsets = read('action_offset')
+        board_offsets = read('board_offset')
+        action_end = int(action_offsets[row + 1]) if row + 1 < len(action_offsets) else None
+        board_end = int(board_offsets[row + 1]) if row + 1 < len(board_offsets) else None
+        action_slice = slice(int(action_offsets[row]), action_end)
+        actions = zip(*[read(name)[action_slice].tolist() for name, _ in ACTION_COLUMNS])
+        return {
+            'round_num': values['round_num'],
+            'button': values['button'],
+            'final_street': values['final_street'],
+            'street': values['street'],
+            'showdown': bool(values['showdown']),
+            'deltas': values['deltas'],
+            'pot': values['pot'],
+            'clocks': values['clocks'],
+            'hands': [[CARD_NAMES[card] for card in values['hands'][:2]], [CARD_NAMES[card] for card in values['hands'][2:]]],
+            'board': [CARD_NAMES[card] for card in read('board')[int(board_offsets[row]):board_end].tolist()],
+            'actions': [(player, street, chr(code), amount) for player, street, code, amount in actions],
+        }
+
+
+def convert_log(log_path, history_path, block_size=BLOCK_SIZE, compression_level=COMPRESSION_LEVEL):
+    '''
+    Converts a text game log into a hand history file and returns the number of rounds.
+    Game clocks and the final street of rounds without showdown are not part of the log and stored as unknown.
+    '''
+    parser = GameLogParser(log_path)
+    writer = HandHistoryWriter(history_path, parser.players, parser.match_id, block_size, compression_level)
+    for hand in parser:
+        writer.add_round(hand['round_num'], hand['button'], hand['final_street'], hand['street'], hand['showdown'],
+                         hand['deltas'], hand['pot'], [float('nan')] * 2, hand['hands'], hand['board'], hand['actions'])
+    writer.close()
+    return writer.num_rounds
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog='python engine/handhistory.py', description='Converts game logs into hand history files.')
+    parser.add_argument('logs', nargs='+', help='Game logs to convert')
+    parser.add_argument('--output', help='Directory for the hand histories, defaults to the directory of each log')
+    parser.add_argument('--block-size', type=int, default=BLOCK_SIZE, help='Rounds per block, defaults to {}'.format(BLOCK_SIZE))
+    parser.add_argument('--compression-level', type=int, default=COMPRESSION_LEVEL,
+                        help='zlib compression level, 0 stores the blocks uncompressed, defaults to {}'.format(COMPRESSION_LEVEL))
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    for log_path in args.logs:
+        name = os.path.splitext(os.path.basename(log_path))[0] + FILE_EXTENSION
+        history_path = os.path.join(args.output or os.path.dirname(log_path), name)
+        num_rounds = convert_log(log_path, history_path, args.block_size, args.compression_level)
+        print('Converted', num_rounds, 'rounds of', log_path, 'to', history_path)
@@ -0,0 +1,273 @@
+'''
+SQLite index of the hands of many matches.
+
+Loads the rounds of hand history files and, for matches without one, of game logs into a SQLite database, so
+questions across matches become SQL queries. Files that did not change since they were indexed are skipped,
+a changed file replaces the rounds indexed from it before. Matches keep their rounds in the index when
+their files are deleted.
+
+Tables:
+- matches: id, name (the file name without extension), source, size, mtime, match_id, player1, player2, rounds
+- hands: one row per round with match, round_num, button (the player in the small blind, 1 or 2), final_street
+  (NULL if unknown), street (the street the round ended on), showdown, pot, board, actions, hole1, hole2,
+  delta1 and delta2 of player1 and player2
+- players: one row per player and round with match, round_num, position (1 or 2), player, seat (SB or BB), hole,
+  delta, outcome (won, lost or split) and all_in_street (the street the player went all-in on, NULL if not)
+
+Streets are 0 (preflop), 3 (flop), 4 (turn), 5 (river) and 6 and more (the run). Actions are the codes of the
+socket protocol (F, C, K, R<amount>) in the order they were made, with the streets separated by '/'. The seats
+act in turns, the small blind first before the flop and the big blind first after it.
+
+    SELECT m.name, p.round_num, p.hole, h.board, h.actions
+    FROM players p JOIN hands h USING (match, round_num) JOIN matches m ON m.id = p.match
+    WHERE p.player = 'harry' AND p.all_in_street = 0 AND p.outcome = 'lost'
+
+Run with: python engine/handindex.py [files or directories] [--query SQL]
+'''
+import argparse
+import glob
+import os
+import sqlite3
+import time
+
+from handhistory import HandHistoryReader, FILE_EXTENSION, CARD_NAMES
+from logparser import GameLogParser
+from config import STARTING_STACK, SMALL_BLIND, BIG_BLIND, HAND_HISTORY_PATH, GAME_LOGS_PATH, HAND_INDEX_PATH
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BATCH_SIZE = 10000  # rounds inserted with one executemany
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS matches (
+    id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL, source TEXT NOT NULL, size INTEGER, mtime REAL,
+    match_id TEXT, player1 TEXT, player2 TEXT, rounds INTEGER
+);
+CREATE TABLE IF NOT EXISTS hands (
+    match INTEGER NOT NULL, round_num INTEGER NOT NULL, button INTEGER, final_street INTEGER, street INTEGER,
+    showdown INTEGER, pot INTEGER, board TEXT, actions TEXT, hole1 TEXT, hole2 TEXT, delta1 INTEGER, delta2 INTEGER,
+    PRIMARY KEY (match, round_num)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS players (
+    match INTEGER NOT NULL, round_num INTEGER NOT NULL, position INTEGER NOT NULL, player TEXT, seat TEXT, hole TEXT,
+    delta INTEGER, outcome TEXT, all_in_street INTEGER,
+    PRIMARY KEY (match, round_num, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS players_by_player ON players (player, outcome, all_in_street);
+CREATE INDEX IF NOT EXISTS players_by_outcome ON players (outcome);
+CREATE INDEX IF NOT EXISTS hands_by_street ON hands (street, showdown);
+'''
+
+
+def history_rounds(reader):
+    '''
+    Yields the rounds of a hand history like HandHistoryReader.round, but converts every column only once.
+    '''
+    columns = {name: reader.column(name).tolist() for name in (
+        'round_num', 'button', 'final_street', 'street', 'showdown', 'deltas', 'pot', 'clocks', 'hands',
+        'action_offset', 'board_offset', 'action_player', 'action_street', 'action_code', 'action_amount', 'board')}
+    action_offsets = columns['action_offset'] + [len(columns['action_code'])]
+    board_offsets = columns['board_offset'] + [len(columns['board'])]
+    for position, round_num in enumerate(columns['round_num']):
+        action_slice = slice(action_offsets[position], action_offsets[position + 1])
+        hands = columns['hands'][position]
+        yield {
+            'round_num': round_num,
+            'button': columns['button'][position],
+            'final_street': columns['final_street'][position],
+            'street': columns['street'][position],
+            'showdown': bool(columns['showdown'][position]),
+            'deltas': columns['deltas'][position],
+            'pot': columns['pot'][position],
+            'clocks': columns['clocks'][position],
+            'hands': [[CARD_NAMES[card] for card in hands[:2]], [CARD_NAMES[card] for card in hands[2:]]],
+            'board': [CARD_NAMES[card] for card in columns['board'][board_offsets[position]:board_offsets[position + 1]]],
+            'actions': list(zip(columns['action_player'][action_slice], columns['action_street'][action_slice],
+                                map(chr, columns['action_code'][action_slice]), columns['action_amount'][action_slice])),
+        }
+
+
+def street_number(street):
+    return 0 if street == 0 else street - 2
+
+
+def encode_actions(hand):
+    '''
+    Returns the action string of a round and the street each player went all-in on.
+    '''
+    button = hand['button']
+    committed = [0, 0]  # on the previous streets
+    pips = [0, 0]
+    pips[button], pips[1 - button] = SMALL_BLIND, BIG_BLIND
+    all_in = [None, None]
+    tokens = []
+    current_street = 0
+    for player, street, code, amount in hand['actions']:
+        if street != current_street:
+            tokens.append('/' * (street_number(street) - street_number(current_street)))
+            committed = [committed[0] + pips[0], committed[1] + pips[1]]
+            pips = [0, 0]
+            current_street = street
+        elif tokens:
+            tokens.append(' ')
+        if code == 'R':
+            tokens.append('R' + str(amount))
+            pips[player] = amount
+        else:
+            tokens.append(code)
+            if code == 'C':
+                pips[player] = pips[1 - player]
+        if all_in[player] is None and code in 'RC' and committed[player] + pips[player] >= STARTING_STACK:
+            all_in[player] = street
+    return ''.join(tokens), all_in
+
+
+def hand_rows(match, players, hands):
+    '''
+    Yields the row of the hands table and the two rows of the players table of every round.
+    '''
+    for hand in hands:
+        actions, all_in = encode_actions(hand)
+        holes = [' '.join(hand['hands'][0]), ' '.join(hand['hands'][1])]
+        deltas = hand['deltas']
+        round_num = hand['round_num']
+        hand_row = (match, round_num, hand['button'] + 1, hand['final_street'] or None, hand['street'], int(hand['showdown']),
+                    hand['pot'], ' '.join(hand['board']), actions, holes[0], holes[1], deltas[0], deltas[1])
+        player_rows = [
+            (match, round_num, position + 1, players[position], 'SB' if position == hand['button'] else 'BB', holes[position],
+             deltas[position], 'won' if deltas[position] > 0 else 'lost' if deltas[position] < 0 else 'split', all_in[position])
+            for position in (0, 1)
+        ]
+        yield hand_row, player_rows
+
+
+def find_sources(paths):
+    '''
+    Expands directories into the hand histories and game logs they contain. A game log is left out if a hand history
+    of the same match is among the sources.
+    '''
+    sources = {}
+    for path in paths:
+        if os.path.isdir(path):
+            files = glob.glob(os.path.join(path, '*' + FILE_EXTENSION)) + glob.glob(os.path.join(path, '*.log'))
+        elif os.path.exists(path):
+            files = [path]
+        else:  # like the default directories before the first match
+            files = []
+        for file in files:
+            name, extension = os.path.splitext(os.path.basename(file))
+            if name not in sources or extension == FILE_EXTENSION:
+                sources[name] = file
+    return sorted(sources.items())
+
+
+class HandIndex():
+    '''
+    The SQLite database of indexed hands.
+    '''
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def is_indexed(self, name, source, size, mtime):
+        row = self.connection.execute('SELECT source, size, mtime FROM matches WHERE name = ?', (name,)).fetchone()
+        return row is not None and tuple(row) == (source, size, mtime)
+
+    def add(self, name, source):
+        '''
+        Indexes a hand history or game log in one transaction, replacing what was indexed for the match before.
+        Returns the number of rounds, None if the file is unchanged since it was indexed.
+        '''
+        source = os.path.abspath(source)
+        status = os.stat(source)
+        if self.is_indexed(name, source, status.st_size, status.st_mtime):
+            return None
+        reader = None
+        if source.endswith(FILE_EXTENSION):
+            reader = HandHistoryReader(source)
+            players, match_id, hands = reader.players, reader.header['match_id'], history_rounds(reader)
+        else:
+            parser = GameLogParser(source)
+            players, match_id, hands = parser.players, parser.match_id, iter(parser)
+        try:
+            with self.connection:
+                cursor = self.connection.cursor()
+                row = cursor.execute('SELECT id FROM matches WHERE name = ?', (name,)).fetchone()
+                if row is not None:
+                    cursor.execute('DELETE FROM hands WHERE match = ?', row)
+                    cursor.execute('DELETE FROM players WHERE match = ?', row)
+                    cursor.execute('DELETE FROM matches WHERE id = ?', row)
+                cursor.execute('INSERT INTO matches (name, source, size, mtime, match_id, player1, player2) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                               (name, source, status.st_size, status.st_mtime, match_id, players[0], players[1]))
+                match = cursor.lastrowid
+                num_rounds = 0
+                hand_batch, player_batch = [], []
+                for hand_row, player_rows in hand_rows(match, players, hands):
+                    hand_batch.append(hand_row)
+                    player_batch.extend(player_rows)
+                    if len(hand_batch) == BATCH_SIZE:
+                        num_rounds += self.insert(cursor, hand_batch, player_batch)
+                        hand_batch, player_batch = [], []
+                num_rounds += self.insert(cursor, hand_batch, player_batch)
+                cursor.execute('UPDATE matches SET rounds = ? WHERE id = ?', (num_rounds, match))
+        finally:
+            if reader is not None:
+                reader.close()
+        return num_rounds
+
+    def insert(self, cursor, hand_batch, player_batch):
+        cursor.executemany('INSERT OR REPLACE INTO hands VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', hand_batch)
+        cursor.executemany('INSERT OR REPLACE INTO players VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', player_batch)
+        return len(hand_batch)
+
+    def query(self, sql, parameters=()):
+        cursor = self.connection.execute(sql, parameters)
+        return [column[0] for column in cursor.description or []], cursor.fetchall()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog='python engine/handindex.py', description='Indexes hands of many matches in SQLite.')
+    parser.add_argument('paths', nargs='*', default=[os.path.join(BASE_DIR, HAND_HISTORY_PATH), os.path.join(BASE_DIR, GAME_LOGS_PATH)],
+                        help='Hand histories, game logs or directories, defaults to {} and {}'.format(HAND_HISTORY_PATH, GAME_LOGS_PATH))
+    parser.add_argument('--db', default=os.path.join(BASE_DIR, HAND_INDEX_PATH), help='Database, defaults to ' + HAND_INDEX_PATH)
+    parser.add_argument('--query', help='Run this SQL query on the index instead of indexing')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    with HandIndex(args.db) as index:
+        start_time = time.perf_counter()
+        if args.query:
+            columns, rows = index.query(args.query)
+            duration = time.perf_counter() - start_time
+            print('\t'.join(columns))
+            for row in rows:
+                print('\t'.join(str(value) for value in row))
+            print('{} rows in {:.1f}ms'.format(len(rows), duration * 1e3))
+        else:
+            num_matches = num_rounds = num_unchanged = 0
+            for name, source in find_sources(args.paths):
+                try:
+                    added = index.add(name, source)
+                except ValueError as e:  # an unfinished hand history or not a game log
+                    print('Skipping', source + ':', e)
+                    continue
+                if added is None:
+                    num_unchanged += 1
+                else:
+                    num_matches += 1
+                    num_rounds += added
+            print('Indexed {:,} rounds of {} matches in {:.2f}s, {} unchanged'.format(
+                num_rounds, num_matches, time.perf_counter() - start_time, num_unchanged))
@@ -0,0 +1,185 @@
+'''
+Queries over the hand histories of many matches.
+
+Every match is memory-mapped through HandHistoryReader, its columns are NumPy arrays and derived
+columns are computed once per match and cached, so repeated queries do not read the file again.
+
+    for match in open_matches('logs/hand_histories'):
+        player = match.player_index('harry')
+        for hand in match.rounds(match.three_bets(player)):
+            print(hand['round_num'], hand['actions'])
+
+Run with: python engine/handquery.py [files or directories] to print an overview of every match.
+'''
+import argparse
+import glob
+import os
+import numpy as np
+
+from handhistory import HandHistoryReader, FILE_EXTENSION
+from config import BIG_BLIND, HAND_HISTORY_PATH, STARTING_STACK
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class MatchQuery():
+    '''
+    Per round columns and filters of one match. Players are given by their index in the match (0 or 1).
+    '''
+
+    def __init__(self, path):
+        self.reader = HandHistoryReader(path)
+        self.path = path
+        self.players = self.reader.players
+        self.cache = {}
+
+    def __len__(self):
+        return len(self.reader)
+
+    def close(self):
+        self.cache.clear()
+        self.reader.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def player_index(self, name):
+        return self.players.index(name)
+
+    def column(self, name):
+        return self.reader.column(name)
+
+    @property
+    def deltas(self):
+        return self.column('deltas')
+
+    @property
+    def pot(self):
+        return self.column('pot')
+
+    @property
+    def street(self):
+        return self.column('street')
+
+    @property
+    def showdown(self):
+        return self.column('showdown').view(np.bool_)
+
+    def action_rounds(self):
+        '''
+        Returns the position of the round of every action.
+        '''
+        if 'action_rounds' not in self.cache:
+            offsets = self.column('action_offset')
+            counts = np.diff(np.append(offsets, len(self.column('action_code'))))
+            self.cache['action_rounds'] = np.repeat(np.arange(len(self)), counts)
+        return self.cache['action_rounds']
+
+    def nth_raises(self, number, street=0):
+        '''
+        Returns the rounds with a number-th raise (starting at 1) on the street and the positions of those raises.
+        '''
+        key = ('raises', number, street)
+        if key not in self.cache:
+            is_raise = (self.column('action_code') == ord('R')) & (self.column('action_street') == street)
+            raises = np.flatnonzero(is_raise)
+            rounds = self.action_rounds()[raises]
+            # actions are stored in round order, so this counts the raises before each one in its round
+            raise_numbers = np.arange(len(raises)) - np.searchsorted(rounds, rounds) + 1
+            selected = raise_numbers == number
+            self.cache[key] = rounds[selected], raises[selected]
+        return self.cache[key]
+
+    def raiser(self, number, street=0):
+        '''
+        Returns the player who made the number-th raise (starting at 1) on the street of every round, -1 if there was none.
+        '''
+        key = ('raiser', number, street)
+        if key not in self.cache:
+            rounds, raises = self.nth_raises(number, street)
+            raisers = np.full(len(self), -1, dtype=np.int8)
+            raisers[rounds] = self.column('action_player')[raises]
+            self.cache[key] = raisers
+        return self.cache[key]
+
+    def raise_amount(self, number, street=0):
+        '''
+        Returns the amount the number-th raise on the street of every round raised to, 0 if there was none.
+        '''
+        key = ('raise_amount', number, street)
+        if key not in self.cache:
+            rounds, raises = self.nth_raises(number, street)
+            amounts = np.zeros(len(self), dtype=np.int32)
+            amounts[rounds] = self.column('action_amount')[raises]
+            self.cache[key] = amounts
+        return self.cache[key]
+
+    def three_bets(self, player):
+        '''
+        Rounds in which the player 3-bet preflop. The big blind counts as the first bet, so this is the second raise.
+        '''
+        return self.raiser(2) == player
+
+    def three_bet_opportunities(self, player):
+        '''
+        Rounds in which the player faced the opponent's first raise preflop and could raise again, that is the
+        opponent did not go all-in. Together with three_bets this is the 3-bet rate of the summary.
+        '''
+        return (self.raiser(1) == 1 - player) & (self.raise_amount(1) < STARTING_STACK)
+
+    def reached(self, street):
+        '''
+        Rounds that got to the street (3 flop, 4 turn, 5 river, 6 or more the run).
+        '''
+        return self.street >= street
+
+    def won(self, player):
+        return self.deltas[:, player] > 0
+
+    def rounds(self, mask):
+        '''
+        Yields the rounds selected by a boolean mask as dicts.
+        '''
+        for position in np.flatnonzero(mask):
+            yield self.reader.round(int(position))
+
+
+def find_histories(paths):
+    '''
+    Expands directories into the hand history files they contain.
+    '''
+    for path in paths:
+        if os.path.isdir(path):
+            yield from sorted(glob.glob(os.path.join(path, '*' + FILE_EXTENSION)))
+        else:
+            yield path
+
+
+def open_matches(*paths):
+    '''
+    Yields a MatchQuery for every hand history file in the paths, closing each one before opening the next.
+    '''
+    for path in find_histories(paths):
+        with MatchQuery(path) as match:
+            yield match
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog='python engine/handquery.py', description='Prints an overview of hand history files.')
+    parser.add_argument('paths', nargs='*', default=[os.path.join(BASE_DIR, HAND_HISTORY_PATH)],
+                        help='Hand history files or directories, defaults to ' + HAND_HISTORY_PATH)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    for match in open_matches(*args.paths):
+        print(os.path.basename(match.path), len(match), 'rounds')
+        for player, name in enumerate(match.players):
+            bb_per_100 = 100 * match.deltas[:, player].sum() / BIG_BLIND / max(len(match), 1)
+            print('  {:<30} {:>+9.1f} bb/100  3-bet {:>5.1%}  showdown won {:>5.1%}'.format(
+                name, bb_per_100, match.three_bets(player).sum() / max(match.three_bet_opportunities(player).sum(), 1),
+                (match.showdown & match.won(player)).sum() / max(match.showdown.sum(), 1)))
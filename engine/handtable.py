@@ -0,0 +1,121 @@
+'''
+Table driven 7 card hand evaluator with scalar and batched (NumPy) evaluation.
+
+The scores are the same as eval7.evaluate returns for 7 cards, so both can be compared with each other.
+The table is built from eval7 on first use, stored next to this file and memory-mapped afterwards.
+It has two parts:
+- an entry for every 13 bit rank mask of a flush (with 7 cards a flush always beats the pairs)
+- an entry for every multiset of 7 ranks, indexed by its position in the combinatorial number system
+
+Cards are encoded as integers rank * 4 + suit with eval7's ranks (0 = two, ..., 12 = ace) and suits (c, d, h, s).
+The module only depends on eval7 and NumPy, so it can also be copied into a python bot.
+'''
+import os
+import eval7
+import numpy as np
+from math import comb
+
+TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'hand_ranks.npy')
+NUM_FLUSH_ENTRIES = 1 << 13
+NUM_RANK_ENTRIES = comb(13 + 7 - 1, 7)  # multisets of 7 out of 13 ranks
+# BINOMIALS[rank + i, i + 1] is the contribution of the i-th smallest rank to the index of a rank multiset
+BINOMIALS = np.array([[comb(n, k) for k in range(8)] for n in range(20)], dtype=np.int64)
+INDEX_TERMS = [[comb(rank + i, i + 1) for rank in range(13)] for i in range(7)]
+POPCOUNT = [bin(mask).count('1') for mask in range(1 << 13)]
+
+
+def card_id(card):
+    '''
+    Returns the integer encoding of an eval7.Card.
+    '''
+    return card.rank * 4 + card.suit
+
+
+def rank_index(sorted_ranks):
+    '''
+    Returns the index of a multiset of 7 ranks given in ascending order.
+    '''
+    return sum(INDEX_TERMS[i][rank] for i, rank in enumerate(sorted_ranks))
+
+
+def build_table():
+    '''
+    Computes the table with eval7.
+    '''
+    table = np.zeros(NUM_FLUSH_ENTRIES + NUM_RANK_ENTRIES, dtype=np.uint32)
+    cards = [[eval7.Card(rank + suit) for suit in 'cdhs'] for rank in '23456789TJQKA']
+    for mask in range(NUM_FLUSH_ENTRIES):
+        ranks = [rank for rank in range(13) if mask >> rank & 1]
+        if 5 <= len(ranks) <= 7:
+            table[mask] = eval7.evaluate([cards[rank][0] for rank in ranks])
+
+    def multisets(start, size):
+        if size == 0:
+            yield []
+            return
+        for rank in range(start, 13):
+            for rest in multisets(rank, size - 1):
+                yield [rank] + rest
+
+    for ranks in multisets(0, 7):
+        if max(ranks.count(rank) for rank in ranks) <= 4:
+            # dealing the suits round robin never gives a flush and never repeats a card
+            hand = [cards[rank][i % 4] for i, rank in enumerate(ranks)]
+            table[NUM_FLUSH_ENTRIES + rank_index(ranks)] = eval7.evaluate(hand)
+    return table
+
+
+def load_table():
+    '''
+    Memory-maps the table from disk, building and storing it first if necessary.
+    '''
+    if not os.path.exists(TABLE_PATH):
+        temporary_path = TABLE_PATH + '.' + str(os.getpid()) + '.npy'
+        np.save(temporary_path, build_table())
+        os.replace(temporary_path, TABLE_PATH)
+    return np.load(TABLE_PATH, mmap_mode='r')
+
+
+TABLE = load_table()
+FLUSH_TABLE = TABLE[:NUM_FLUSH_ENTRIES]
+RANK_TABLE = TABLE[NUM_FLUSH_ENTRIES:]
+SCORES = memoryview(TABLE)  # much faster than indexing the arrays for single lookups
+
+
+def evaluate(cards):
+    '''
+    Returns the score of 7 cards, given as eval7.Cards or integers.
+    '''
+    ids = [card if isinstance(card, int) else card_id(card) for card in cards]
+    suit_masks = [0, 0, 0, 0]
+    for card in ids:
+        suit_masks[card & 3] |= 1 << (card >> 2)
+    for mask in suit_masks:
+        if POPCOUNT[mask] >= 5:
+            return SCORES[mask]
+    return SCORES[NUM_FLUSH_ENTRIES + rank_index(sorted(card >> 2 for card in ids))]
+
+
+def evaluate_batch(cards):
+    '''
+    Returns the scores of an N x 7 array of integer encoded cards.
+    '''
+    cards = np.asarray(cards, dtype=np.uint8)
+    ranks = cards >> 2
+    suits = cards & 3
+    sorted_ranks = np.sort(ranks, axis=1).astype(np.intp)
+    index = BINOMIALS[sorted_ranks[:, 0], 1]
+    for i in range(1, 7):
+        index += BINOMIALS[sorted_ranks[:, i] + i, i + 1]
+    scores = np.asarray(RANK_TABLE[index])
+
+    # count the cards of every suit in one byte each
+    suit_counts = (np.uint32(1) << (suits.astype(np.uint32) * 8)).sum(axis=1, dtype=np.uint32)
+    counts = [(suit_counts >> (8 * suit)) & 0xff for suit in range(4)]
+    is_flush = (counts[0] >= 5) | (counts[1] >= 5) | (counts[2] >= 5) | (counts[3] >= 5)
+    if is_flush.any():
+        flush_suit = np.select([count[is_flush] >= 5 for count in counts], range(4))
+        in_flush = suits[is_flush] == flush_suit[:, None]
+        masks = np.where(in_flush, np.int64(1) << ranks[is_flush].astype(np.int64), 0).sum(axis=1)
+        scores[is_flush] = FLUSH_TABLE[masks]
+    return scores
@@ -0,0 +1,281 @@
+'''
+Runs python pokerbots inside the engine process instead of over a socket.
+'''
+import contextlib
+import importlib.util
+import os
+import sys
+import time
+import traceback
+
+from actions import FoldAction, CallAction, CheckAction, RaiseAction
+from states import TerminalState
+from stats import GameSummary
+from config import BOT_LOGS_PATH, STARTING_GAME_CLOCK, ENFORCE_GAME_CLOCK, PLAYER_LOG_SIZE_LIMIT
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# maps the class names of the skeleton actions to the engine actions
+ENGINE_ACTIONS = {'FoldAction': FoldAction, 'CallAction': CallAction, 'CheckAction': CheckAction, 'RaiseAction': RaiseAction}
+
+
+def load_bot(path):
+    '''
+    Imports player.py of the bot in path and returns it together with the bot's own skeleton modules.
+    Every bot ships its own copy of the skeleton package, so it is imported in isolation
+    and removed from sys.modules afterwards to make room for the next bot.
+    '''
+    is_skeleton = lambda module_name: module_name == 'skeleton' or module_name.startswith('skeleton.')
+    saved_modules = {name: sys.modules.pop(name) for name in list(sys.modules) if is_skeleton(name)}
+    sys.path.insert(0, path)
+    try:
+        module_name = 'pokerbot_' + str(abs(hash(path)))
+        spec = importlib.util.spec_from_file_location(module_name, os.path.join(path, 'player.py'))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        skeleton = {name: sys.modules[name] for name in list(sys.modules) if is_skeleton(name)}
+    finally:
+        sys.path.remove(path)
+        for name in [name for name in sys.modules if is_skeleton(name)]:
+            del sys.modules[name]
+        sys.modules.update(saved_modules)
+    return module, skeleton
+
+
+class BoundedLog():
+    '''
+    Collects what a bot prints, up to PLAYER_LOG_SIZE_LIMIT characters.
+    '''
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.size = 0
+        self.chunks = []
+
+    def write(self, text):
+        if self.size < self.limit:
+            text = text[:self.limit - self.size]
+            self.chunks.append(text)
+            self.size += len(text)
+        return len(text)
+
+    def flush(self):
+        pass
+
+    def getvalue(self):
+        return ''.join(self.chunks)
+
+
+class InProcessPlayer():
+    '''
+    Drives a skeleton.bot.Bot subclass directly, mirroring what skeleton/runner.py does with socket messages.
+    Has the same interface as Player so that Game can use either.
+    '''
+
+    def __init__(self, name, path, match_id, index):
+        self.match_id = match_id
+        self.name = name
+        self.index = index
+        self.path = os.path.join(BASE_DIR, path)
+        self.game_clock = STARTING_GAME_CLOCK
+        self.bankroll = 0
+        self.pokerbot = None
+        self.output = BoundedLog(PLAYER_LOG_SIZE_LIMIT)
+        self.bot_log_written = False
+        # state of the bot side, as it would be rebuilt by the skeleton runner
+        self.game_state = None
+        self.round_state = None
+        self.active = 0
+        self.round_flag = True
+
+    def build(self):
+        '''
+        Imports the pokerbot's player.py.
+        '''
+        try:
+            with contextlib.redirect_stdout(self.output), contextlib.redirect_stderr(self.output):
+                self.module, skeleton = load_bot(self.path)
+            self.actions = skeleton['skeleton.actions']
+            self.states = skeleton['skeleton.states']
+            self.bot_class = skeleton['skeleton.bot'].Bot
+        except FileNotFoundError:
+            print(self.name, 'player.py not found - check PLAYER_PATH:', self.path)
+        except KeyError:
+            print(self.name, 'player.py does not use the python skeleton')
+        except Exception as e:
+            print(self.name, 'import failed;', e)
+            self.output.write(traceback.format_exc())
+
+    def run(self):
+        '''
+        Instantiates the pokerbot.
+        '''
+        if not hasattr(self, 'bot_class'):
+            return
+        try:
+            with contextlib.redirect_stdout(self.output), contextlib.redirect_stderr(self.output):
+                pokerbot = self.module.Player()
+            if isinstance(pokerbot, self.bot_class):
+                self.pokerbot = pokerbot
+                self.game_state = self.states.GameState(0, 0., 1)
+                print(self.name, 'loaded successfully')
+            else:
+                print(self.name, 'Player is not a subclass of skeleton.bot.Bot')
+        except Exception as e:
+            print(self.name, 'initialization failed;', e)
+            self.output.write(traceback.format_exc())
+
+    def resume(self, bankroll, game_clock, round_num):
+        '''
+        Restores the bankroll and game clock of a match continued from a checkpoint.
+        The pokerbot starts fresh, but its GameState continues where the match left off.
+        '''
+        self.bankroll = bankroll
+        self.game_clock = game_clock
+        if self.pokerbot is not None:
+            self.game_state = self.states.GameState(bankroll, game_clock, round_num)
+
+    def new_match(self, name, match_id, index):
+        '''
+        Resets the GameState of the pokerbot for another match, like the N clause does in skeleton/runner.py.
+        '''
+        if self.pokerbot is None:
+            return False
+        self.name = name
+        self.match_id = match_id
+        self.index = index
+        self.game_clock = STARTING_GAME_CLOCK
+        self.bankroll = 0
+        self.game_state = self.states.GameState(0, 0., 1)
+        self.round_state = None
+        self.round_flag = True
+        self.bot_log_written = False
+        return True
+
+    def stop(self):
+        '''
+        Writes everything the pokerbot printed to its bot log.
+        '''
+        self.write_bot_log()
+
+    def write_bot_log(self):
+        '''
+        Writes what the pokerbot printed during the current match to its bot log.
+        '''
+        logs_dir = os.path.join(BASE_DIR, BOT_LOGS_PATH)
+        os.makedirs(logs_dir, exist_ok=True)
+        # a pokerbot kept for the next match appends what it prints until it stops
+        with open(os.path.join(logs_dir, self.match_id + "_" + self.name + '.txt'), 'a' if self.bot_log_written else 'w') as log_file:
+            log_file.write(self.output.getvalue())
+        self.bot_log_written = True
+        self.output = BoundedLog(PLAYER_LOG_SIZE_LIMIT)
+
+    def receive(self, player_message):
+        '''
+        Applies the clauses of one engine message to the bot's game and round state.
+        Returns True if the pokerbot has to act.
+        '''
+        states = self.states
+        actions = self.actions
+        GameState = states.GameState
+        for code, value in player_message[1:]:
+            if code == 'P':
+                self.active = value
+            elif code == 'H':
+                hands = [[], []]
+                hands[self.active] = list(map(str, value))
+                pips = [states.SMALL_BLIND, states.BIG_BLIND]
+                stacks = [states.STARTING_STACK - states.SMALL_BLIND, states.STARTING_STACK - states.BIG_BLIND]
+                self.round_state = states.RoundState(0, 0, pips, stacks, hands, [], None)
+                if self.round_flag:
+                    self.pokerbot.handle_new_round(self.game_state, self.round_state, self.active)
+                    self.round_flag = False
+            elif code == 'F':
+                self.round_state = self.round_state.proceed(actions.FoldAction())
+            elif code == 'C':
+                self.round_state = self.round_state.proceed(actions.CallAction())
+            elif code == 'K':
+                self.round_state = self.round_state.proceed(actions.CheckAction())
+            elif code == 'R':
+                self.round_state = self.round_state.proceed(actions.RaiseAction(value))
+            elif code == 'B':
+                round_state = self.round_state
+                self.round_state = states.RoundState(round_state.button, round_state.street, round_state.pips, round_state.stacks,
+                                                     round_state.hands, list(map(str, value)), round_state.previous_state)
+            elif code == 'O':
+                # backtrack
+                round_state = self.round_state.previous_state
+                revised_hands = list(round_state.hands)
+                revised_hands[1-self.active] = list(map(str, value))
+                # rebuild history
+                round_state = states.RoundState(round_state.button, round_state.street, round_state.pips, round_state.stacks,
+                                                revised_hands, round_state.deck, round_state.previous_state)
+                self.round_state = states.TerminalState([0, 0], round_state)
+            elif code == 'D':
+                delta = value
+                deltas = [-delta, -delta]
+                deltas[self.active] = delta
+                self.round_state = states.TerminalState(deltas, self.round_state.previous_state)
+                game_state = self.game_state
+                self.game_state = GameState(game_state.bankroll + delta, game_state.game_clock, game_state.round_num)
+                self.pokerbot.handle_round_over(self.game_state, self.round_state, self.active)
+                self.game_state = GameState(self.game_state.bankroll, self.game_state.game_clock, self.game_state.round_num + 1)
+                self.round_flag = True
+        return not self.round_flag
+
+    def query(self, round_state, player_message, game_log, summary: GameSummary):
+        '''
+        Requests one action from the pokerbot by calling it directly.
+        At the end of the round, the pokerbot is only notified and we return a CheckAction.
+        '''
+        is_terminal = isinstance(round_state, TerminalState)
+        legal_actions = {CheckAction} if is_terminal else round_state.legal_actions()
+        if self.pokerbot is None or self.game_clock <= 0.:
+            del player_message[1:]
+            return CheckAction() if CheckAction in legal_actions else FoldAction()
+        action = None
+        try:
+            game_state = self.game_state
+            self.game_state = self.states.GameState(game_state.bankroll, round(self.game_clock, 3), game_state.round_num)
+            start_time = time.perf_counter()
+            with contextlib.redirect_stdout(self.output), contextlib.redirect_stderr(self.output):
+                if self.receive(player_message):
+                    action = self.pokerbot.get_action(self.game_state, self.round_state, self.active)
+            end_time = time.perf_counter()
+        except Exception:
+            self.output.write(traceback.format_exc())
+            error_message = self.name + ' crashed'
+            game_log.append(error_message)
+            print(error_message)
+            self.game_clock = 0.
+            return CheckAction() if CheckAction in legal_actions else FoldAction()
+        finally:
+            del player_message[1:]  # do not replay the action history
+        if ENFORCE_GAME_CLOCK:
+            self.game_clock -= end_time - start_time
+        if self.game_clock <= 0.:
+            error_message = self.name + ' ran out of time'
+            game_log.append(error_message)
+            print(error_message)
+            self.game_clock = 0.
+            summary.add_timeout(self.index)
+        elif is_terminal:
+            summary.add_response_time(self.index, round_state, None, end_time - start_time)
+            return CheckAction()
+        else:
+            engine_action = ENGINE_ACTIONS.get(type(action).__name__)
+            summary.add_response_time(self.index, round_state, engine_action, end_time - start_time)
+            try:
+                if engine_action in legal_actions:
+                    if engine_action is RaiseAction:
+                        amount = int(str(action.amount))  # same parsing as for socket messages
+                        min_raise, max_raise = round_state.raise_bounds()
+                        if min_raise <= amount <= max_raise:
+                            return RaiseAction(amount)
+                    else:
+                        return engine_action()
+                game_log.append(self.name + ' attempted illegal ' + type(action).__name__)
+                summary.add_illegal_action(self.index)
+            except ValueError:
+                game_log.append(self.name + ' response misformatted: R' + str(action.amount))
+        return CheckAction() if CheckAction in legal_actions else FoldAction()
@@ -0,0 +1,304 @@
+'''
+Combines the summaries of many matches into a leaderboard.
+
+The results of every match (players, rounds and chips won) are kept in a small state file, so a refresh only
+reads the summaries written since the last one, in parallel when there are many. From the state the leaderboard
+computes every bot's big blinds won per 100 rounds, the head-to-head results of every pair of bots and
+Bradley-Terry ratings on the Elo scale from the matches won, lost and tied. The confidence intervals of both
+come from a Poisson bootstrap over the matches.
+
+Run with: python engine/leaderboard.py [--summaries DIR] [--json PATH] [--rebuild]
+'''
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+from config import BIG_BLIND, SUMMARY_PATH, LEADERBOARD_PATH
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STATE_VERSION = 1
+PARALLEL_THRESHOLD = 64  # fewer new summaries are read without starting worker processes
+BOOTSTRAP_SAMPLES = 200
+BOOTSTRAP_CHUNK = 50  # resamples drawn at once, bounds the memory to BOOTSTRAP_CHUNK * matches
+CONFIDENCE = 0.95
+PRIOR_WINS = 0.5  # virtual wins of each bot against every opponent, so unbeaten bots get a finite rating
+MAX_ITERATIONS = 500
+TOLERANCE = 1e-6
+
+
+def read_summary(path):
+    '''
+    Returns the players, the number of rounds and the chips won by the first player of a summary,
+    None if it is not a complete summary (yet).
+    '''
+    try:
+        with open(path) as summary_file:
+            summary = json.load(summary_file)
+        players = [player['name'] for player in summary['Player stats']]
+        chips = int(summary['Score'].split(' vs ')[0])
+        return players[0], players[1], summary['Number of rounds'], chips
+    except (OSError, ValueError, KeyError, IndexError, TypeError):
+        return None
+
+
+class Leaderboard():
+    '''
+    The results of all ingested matches as NumPy columns, with bots given by their index in self.bots.
+    '''
+
+    def __init__(self, state_path):
+        self.state_path = state_path
+        self.bots = []
+        self.bot_indices = {}
+        self.matches = {}  # summary file name -> [first bot, second bot, rounds, chips of the first bot]
+
+    def load(self):
+        try:
+            with open(self.state_path) as state_file:
+                state = json.load(state_file)
+            if state.get('version') == STATE_VERSION:
+                self.bots = state['bots']
+                self.matches = state['matches']
+        except (FileNotFoundError, json.decoder.JSONDecodeError, KeyError):
+            pass
+        self.bot_indices = {bot: index for index, bot in enumerate(self.bots)}
+
+    def bot_index(self, name):
+        if name not in self.bot_indices:
+            self.bot_indices[name] = len(self.bots)
+            self.bots.append(name)
+        return self.bot_indices[name]
+
+    def refresh(self, summary_path):
+        '''
+        Ingests the summaries that are new since the last refresh and forgets the ones that were deleted.
+        Returns the numbers of new and deleted matches.
+        '''
+        names = {entry.name for entry in os.scandir(summary_path) if entry.name.endswith('.json')} if os.path.isdir(summary_path) else set()
+        deleted = set(self.matches) - names
+        for name in deleted:
+            del self.matches[name]
+        new_names = sorted(names - set(self.matches))
+        paths = [os.path.join(summary_path, name) for name in new_names]
+        if len(paths) >= PARALLEL_THRESHOLD:
+            workers = os.cpu_count() or 1
+            with ProcessPoolExecutor(workers) as executor:
+                results = list(executor.map(read_summary, paths, chunksize=max(1, len(paths) // (4 * workers))))
+        else:
+            results = [read_summary(path) for path in paths]
+        num_new = 0
+        for name, result in zip(new_names, results):
+            # an unreadable summary may still be being written, so it is tried again next time
+            if result is not None:
+                first, second, rounds, chips = result
+                self.matches[name] = [self.bot_index(first), self.bot_index(second), rounds, chips]
+                num_new += 1
+        self.prune()
+        return num_new, len(deleted)
+
+    def prune(self):
+        '''
+        Forgets the bots without any match left, so deleted summaries leave no empty rows on the leaderboard.
+        '''
+        used = sorted({bot for match in self.matches.values() for bot in match[:2]})
+        if len(used) == len(self.bots):
+            return
+        new_indices = {old: new for new, old in enumerate(used)}
+        self.bots = [self.bots[old] for old in used]
+        self.bot_indices = {bot: index for index, bot in enumerate(self.bots)}
+        for match in self.matches.values():
+            match[0], match[1] = new_indices[match[0]], new_indices[match[1]]
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.state_path) or '.', exist_ok=True)
+        temporary_path = self.state_path + '.tmp'
+        with open(temporary_path, 'w') as state_file:
+            json.dump({'version': STATE_VERSION, 'bots': self.bots, 'matches': self.matches}, state_file, separators=(',', ':'))
+        os.replace(temporary_path, self.state_path)
+
+    def columns(self):
+        '''
+        Returns the first bot, second bot, rounds and chips of the first bot of every match as arrays.
+        '''
+        if not self.matches:
+            return tuple(np.zeros(0, dtype=np.int64) for _ in range(4))
+        table = np.array(list(self.matches.values()), dtype=np.int64)
+        return table[:, 0], table[:, 1], table[:, 2], table[:, 3]
+
+    def compute(self, samples=BOOTSTRAP_SAMPLES, seed=None):
+        '''
+        Returns the leaderboard as a dict, best rated bot first.
+        '''
+        first, second, rounds, chips = self.columns()
+        num_bots = len(self.bots)
+        rng = np.random.default_rng(seed)
+        bot_chips, bot_rounds = bot_totals(first, second, rounds, chips, num_bots, np.ones((1, len(chips))))
+        bb_per_100 = per_100(bot_chips[0], bot_rounds[0])
+        wins, ties = match_outcomes(first, second, chips, num_bots)
+        ratings = bradley_terry(wins[None] + ties[None] / 2)[0]
+        matches = (wins + wins.T + ties).sum(axis=1)
+
+        bb_samples, rating_samples = [], []
+        for start in range(0, samples, BOOTSTRAP_CHUNK):
+            count = min(BOOTSTRAP_CHUNK, samples - start)
+            weights = rng.poisson(1., (count, len(chips)))
+            sample_chips, sample_rounds = bot_totals(first, second, rounds, chips, num_bots, weights)
+            bb_samples.append(per_100(sample_chips, sample_rounds))
+            # the wins of a pair in a Poisson bootstrap are Poisson distributed around the observed wins
+            sample_ties = np.triu(rng.poisson(np.broadcast_to(ties, (count,) + ties.shape)), 1)
+            sample_wins = rng.poisson(np.broadcast_to(wins, (count,) + wins.shape)) + (sample_ties + sample_ties.transpose(0, 2, 1)) / 2
+            rating_samples.append(bradley_terry(sample_wins))
+        tail = 100 * (1 - CONFIDENCE) / 2
+        if samples > 0:
+            bb_bounds = np.nanpercentile(np.concatenate(bb_samples), [tail, 100 - tail], axis=0) if num_bots else np.zeros((2, 0))
+            rating_bounds = np.percentile(np.concatenate(rating_samples), [tail, 100 - tail], axis=0) if num_bots else np.zeros((2, 0))
+        else:
+            bb_bounds = rating_bounds = np.full((2, num_bots), np.nan)
+
+        pair_matches, pair_rounds, pair_chips = head_to_head(first, second, rounds, chips, num_bots)
+        order = np.argsort(-ratings, kind='stable')
+        leaderboard = []
+        for bot in order:
+            if matches[bot] == 0:
+                continue  # prune keeps these out of the state, but never rank a bot without a match
+            opponents = np.flatnonzero(pair_matches[bot])
+            leaderboard.append({
+                'bot': self.bots[bot],
+                'matches': int(matches[bot]),
+                'rounds': int(bot_rounds[0][bot]),
+                'won': int(wins[bot].sum()),
+                'tied': int(ties[bot].sum()),
+                'lost': int(wins[:, bot].sum()),
+                'bb/100': rounded(bb_per_100[bot]),
+                'bb/100 interval': [rounded(bb_bounds[0][bot]), rounded(bb_bounds[1][bot])],
+                'rating': rounded(ratings[bot], 1),
+                'rating interval': [rounded(rating_bounds[0][bot], 1), rounded(rating_bounds[1][bot], 1)],
+                'head to head': {
+                    self.bots[opponent]: {
+                        'matches': int(pair_matches[bot, opponent]),
+                        'won': int(wins[bot, opponent]),
+                        'tied': int(ties[bot, opponent]),
+                        'lost': int(wins[opponent, bot]),
+                        'bb/100': rounded(per_100(pair_chips[bot, opponent], pair_rounds[bot, opponent])),
+                    } for opponent in opponents
+                },
+            })
+        return {'matches': len(chips), 'bootstrap samples': samples, 'confidence': CONFIDENCE, 'bots': leaderboard}
+
+
+def rounded(value, digits=2):
+    return None if np.isnan(value) else round(float(value), digits)
+
+
+def per_100(chips, rounds):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(rounds > 0, 100 * chips / BIG_BLIND / np.maximum(rounds, 1), np.nan)
+
+
+def bot_totals(first, second, rounds, chips, num_bots, weights):
+    '''
+    Sums the chips and rounds of every bot over the matches, once for every row of match weights.
+    '''
+    count = len(weights)
+    offsets = (np.arange(count) * num_bots)[:, None]
+    size = count * num_bots
+    weighted_chips = (weights * chips).ravel()
+    weighted_rounds = (weights * rounds).ravel()
+    first_bins = (first + offsets).ravel()
+    second_bins = (second + offsets).ravel()
+    bot_chips = np.bincount(first_bins, weighted_chips, size) - np.bincount(second_bins, weighted_chips, size)
+    bot_rounds = np.bincount(first_bins, weighted_rounds, size) + np.bincount(second_bins, weighted_rounds, size)
+    return bot_chips.reshape(count, num_bots), bot_rounds.reshape(count, num_bots)
+
+
+def match_outcomes(first, second, chips, num_bots):
+    '''
+    Returns how many matches each bot won against each other bot and how many they tied.
+    '''
+    winner = np.where(chips > 0, first, second)
+    loser = np.where(chips > 0, second, first)
+    decided = chips != 0
+    wins = np.bincount(winner[decided] * num_bots + loser[decided], minlength=num_bots * num_bots).reshape(num_bots, num_bots)
+    tied = np.bincount(first[~decided] * num_bots + second[~decided], minlength=num_bots * num_bots).reshape(num_bots, num_bots)
+    return wins, tied + tied.T
+
+
+def head_to_head(first, second, rounds, chips, num_bots):
+    '''
+    Returns the matches, rounds and chips won of every bot against every other bot.
+    '''
+    size = num_bots * num_bots
+    pairs = first * num_bots + second
+    matches = np.bincount(pairs, minlength=size).reshape(num_bots, num_bots)
+    pair_rounds = np.bincount(pairs, rounds, size).reshape(num_bots, num_bots)
+    pair_chips = np.bincount(pairs, chips, size).reshape(num_bots, num_bots)
+    return matches + matches.T, pair_rounds + pair_rounds.T, pair_chips - pair_chips.T
+
+
+def bradley_terry(wins):
+    '''
+    Fits Bradley-Terry strengths to a stack of win matrices with the MM algorithm and returns them as Elo ratings
+    centered on 1500. wins[..., i, j] are the (possibly fractional) wins of bot i against bot j.
+    '''
+    if wins.shape[-1] == 0:
+        return np.zeros(wins.shape[:2])
+    games = wins + wins.transpose(0, 2, 1)
+    played = games > 0
+    wins = wins + PRIOR_WINS * played
+    games = games + 2 * PRIOR_WINS * played
+    total_wins = wins.sum(axis=2)
+    strengths = np.ones(wins.shape[:2])
+    for _ in range(MAX_ITERATIONS):
+        denominator = (games / (strengths[:, :, None] + strengths[:, None, :])).sum(axis=2)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            updated = np.where(denominator > 0, total_wins / denominator, 1.)
+        updated /= np.exp(np.log(updated).mean(axis=1, keepdims=True))
+        converged = np.abs(updated - strengths).max(initial=0.) < TOLERANCE
+        strengths = updated
+        if converged:
+            break
+    return 1500 + 400 * np.log10(strengths)
+
+
+def print_leaderboard(result):
+    print('{} matches, {:.0%} confidence intervals from {} bootstrap samples'.format(
+        result['matches'], result['confidence'], result['bootstrap samples']))
+    print('{:>4}  {:<30} {:>7} {:>9} {:>18} {:>9} {:>18}'.format('rank', 'bot', 'matches', 'bb/100', '', 'rating', ''))
+    for rank, entry in enumerate(result['bots'], 1):
+        low, high = entry['bb/100 interval']
+        rating_low, rating_high = entry['rating interval']
+        print('{:>4}  {:<30} {:>7} {:>+9.2f} {:>18} {:>9.1f} {:>18}'.format(
+            rank, entry['bot'][:30], entry['matches'], entry['bb/100'] if entry['bb/100'] is not None else float('nan'),
+            '' if low is None else '[{:+.2f}, {:+.2f}]'.format(low, high), entry['rating'],
+            '' if rating_low is None else '[{:.1f}, {:.1f}]'.format(rating_low, rating_high)))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog='python engine/leaderboard.py', description='Combines match summaries into a leaderboard.')
+    parser.add_argument('--summaries', default=os.path.join(BASE_DIR, SUMMARY_PATH), help='Directory of the summaries, defaults to ' + SUMMARY_PATH)
+    parser.add_argument('--state', default=os.path.join(BASE_DIR, LEADERBOARD_PATH), help='State file, defaults to ' + LEADERBOARD_PATH)
+    parser.add_argument('--samples', type=int, default=BOOTSTRAP_SAMPLES, help='Bootstrap samples, defaults to {}'.format(BOOTSTRAP_SAMPLES))
+    parser.add_argument('--seed', type=int, help='Seed of the bootstrap')
+    parser.add_argument('--json', help='Also write the leaderboard with the head-to-head results as JSON to this path')
+    parser.add_argument('--rebuild', action='store_true', help='Ignore the state file and read all summaries again')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    start_time = time.perf_counter()
+    leaderboard = Leaderboard(args.state)
+    if not args.rebuild:
+        leaderboard.load()
+    num_new, num_deleted = leaderboard.refresh(args.summaries)
+    if num_new or num_deleted or args.rebuild:
+        leaderboard.save()
+    result = leaderboard.compute(args.samples, args.seed)
+    print_leaderboard(result)
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump(result, json_file, indent=2)
+    print('Read {} new summaries, took {:.3f}s'.format(num_new, time.perf_counter() - start_time))
@@ -0,0 +1,283 @@
+'''
+Streaming parser for the text game logs.
+
+GameLogParser reads a game log in large chunks and yields one dict per round, so even logs of millions of
+rounds are parsed in constant memory. The rounds have the same keys as HandHistoryReader.round, with players
+given by their index in the match (the order of PLAYER1 and PLAYER2), plus the bankrolls at the start of the
+round and the notes the engine logged about illegal actions, timeouts and disconnects. Game clocks are not in
+the log. The final street is only known for rounds that went to showdown and 0 otherwise.
+
+    for hand in GameLogParser('logs/game_logs/match.log'):
+        if hand['showdown'] and hand['street'] > 5:
+            print(hand['round_num'], hand['board'], hand['deltas'])
+
+map_logs runs a function on the parser of every log in a pool of processes, for directories of large logs.
+
+Run with: python engine/logparser.py [files or directories] [--processes N] to count the rounds of every log,
+or with --check to play random rounds through the engine and compare the parsed log with what was played.
+'''
+import argparse
+import glob
+import os
+import time
+from multiprocessing import Pool
+
+from config import GAME_LOGS_PATH
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHUNK_SIZE = 1 << 22  # characters read at once
+HEADER_PREFIX = ' HPI Pokerbots - '
+ACTION_CODES = {'folds': 'F', 'calls': 'C', 'checks': 'K'}
+NOTE_SUFFIXES = (' ran out of time', ' disconnected')
+
+
+class GameLogParser():
+    '''
+    The rounds of one game log. The header is read on construction, the rounds while iterating.
+    '''
+
+    def __init__(self, path):
+        self.path = path
+        with open(path) as log_file:
+            header = log_file.readline().rstrip('\n')
+        version, separator, names = header.partition(HEADER_PREFIX)
+        players = names.split(' vs ')
+        if not separator or len(players) != 2:
+            raise ValueError(path + ' is not a game log')
+        self.version = version
+        self.players = players
+        self.match_id = os.path.basename(path).split('_' + players[0] + '_vs_')[0]
+        self.final_bankrolls = None  # known once the log was read to the end
+
+    def __iter__(self):
+        players = {name: index for index, name in enumerate(self.players)}
+        record = None  # the round being parsed
+        with open(self.path) as log_file:
+            log_file.readline()
+            rest = ''
+            while True:
+                chunk = log_file.read(CHUNK_SIZE)
+                if not chunk:
+                    if not rest:
+                        break
+                    chunk = '\n'
+                lines = (rest + chunk).split('\n')
+                rest = lines.pop()
+                for line in lines:
+                    # dispatch on the last character, the lines are told apart by their ending
+                    end = line[-1:]
+                    if end == 's':
+                        head, _, verb = line.rpartition(' ')
+                        player = players.get(head)
+                        code = ACTION_CODES.get(verb)
+                        if player is not None and code is not None and record is not None:
+                            actions.append((player, street, code, 0))
+                            if code == 'C':
+                                pips[player] = pips[1 - player]
+                            continue
+                    elif end.isdigit():
+                        head, _, last = line.rpartition(' ')
+                        name, _, verb = head.partition(' ')
+                        player = players.get(name)
+                        if player is None or record is None:
+                            pass
+                        elif verb == 'raises to' or verb == 'bets':
+                            amount = int(last)
+                            actions.append((player, street, 'R', amount))
+                            pips[player] = amount
+                            continue
+                        elif verb == 'awarded':
+                            record['deltas'][player] = int(last)
+                            continue
+                        elif verb == 'posts the blind of':
+                            pips[player] = int(last)
+                            continue
+                        elif verb == 'won':  # the winnings of the run
+                            continue
+                    elif end == ']':
+                        name, verb, cards = line.split(' ', 2)
+                        if name in players and record is not None and (verb == 'dealt' or verb == 'shows'):
+                            record['hands'][players[name]] = cards[1:-1].split(' ')
+                            if verb == 'shows':
+                                record['showdown'] = True
+                            continue
+                    elif end == ')':
+                        if line.startswith('Round #'):
+                            if record is not None:
+                                yield finish_round(record, street, street_line, pips)
+                            number, first, second = line[len('Round #'):].split(', ')
+                            first_name, _, first_bankroll = first.rpartition(' (')
+                            second_name, _, second_bankroll = second.rpartition(' (')
+                            bankrolls = [0, 0]
+                            bankrolls[players[first_name]] = int(first_bankroll[:-1])
+                            bankrolls[players[second_name]] = int(second_bankroll[:-1])
+                            actions = []
+                            record = {'round_num': int(number), 'button': players[first_name], 'final_street': 0, 'street': 0,
+                                      'showdown': False, 'deltas': [0, 0], 'pot': 0, 'hands': [[], []], 'board': [],
+                                      'actions': actions, 'bankrolls': bankrolls, 'notes': []}
+                            street = 0
+                            street_line = None
+                            pips = [0, 0]
+                            continue
+                        if line.startswith('Final, '):
+                            self.final_bankrolls = [0, 0]
+                            for status in line[len('Final, '):].split(', '):
+                                name, _, bankroll = status.rpartition(' (')
+                                self.final_bankrolls[players[name]] = int(bankroll[:-1])
+                            continue
+                        if record is not None and line[:1] in 'FTR' and ' [' in line:
+                            # only the board and the chips put in on the last street line of the round are needed
+                            street = 3 if street == 0 else street + 1
+                            street_line = line
+                            pips = [0, 0]
+                            continue
+                    if record is not None and (' attempted illegal ' in line or line.endswith(NOTE_SUFFIXES)):
+                        record['notes'].append(line)
+        if record is not None:
+            yield finish_round(record, street, street_line, pips)
+
+
+def finish_round(record, street, street_line, pips):
+    '''
+    Completes the record of a round with what is only known at its end.
+    '''
+    contributions = 0
+    if street_line is not None:
+        end = street_line.index(']')
+        record['board'] = street_line[street_line.index('[') + 1:end].split(' ')
+        # the street lines show what both players put in before the street
+        for status in street_line[end + 3:].split(', '):
+            contributions += int(status.rpartition(' (')[2][:-1])
+    record['street'] = street
+    if record['showdown']:
+        record['final_street'] = street
+    record['pot'] = contributions + pips[0] + pips[1]
+    return record
+
+
+def find_logs(paths):
+    '''
+    Expands directories into the game logs they contain.
+    '''
+    for path in paths:
+        if os.path.isdir(path):
+            yield from sorted(glob.glob(os.path.join(path, '*.log')))
+        else:
+            yield path
+
+
+def count_rounds(parser):
+    return sum(1 for _ in parser)
+
+
+def apply_to_log(arguments):
+    function, path = arguments
+    return path, function(GameLogParser(path))
+
+
+def map_logs(function, paths, processes=None):
+    '''
+    Yields (path, function(GameLogParser(path))) for every game log in the paths, computed by a pool of processes
+    in the order the logs finish. The function has to be defined at the top level of a module.
+    '''
+    logs = list(find_logs(paths))
+    if processes == 1 or len(logs) <= 1:
+        for path in logs:
+            yield apply_to_log((function, path))
+        return
+    with Pool(processes) as pool:
+        yield from pool.imap_unordered(apply_to_log, [(function, path) for path in logs])
+
+
+def check_round_trip(num_rounds, seed):
+    '''
+    Plays rounds with random actions through the engine, which writes the game log and the hand history, and
+    compares the parsed log with the rounds in the hand history. Returns the number of differences.
+    '''
+    import contextlib
+    import io
+    import random
+    import tempfile
+    from benchmark import StubPlayer, load_engine
+    from handhistory import HandHistoryReader, FILE_EXTENSION
+    from actions import FoldAction, CallAction, CheckAction, RaiseAction
+    from states import TerminalState
+
+    rng = random.Random(seed)
+
+    class RandomPlayer(StubPlayer):
+        def query(self, round_state, player_message, game_log, summary):
+            del player_message[1:]
+            if isinstance(round_state, TerminalState):
+                return CheckAction()
+            legal_actions = round_state.legal_actions()
+            action = rng.choice(sorted(legal_actions, key=lambda action: action.__name__))
+            if action is RaiseAction:
+                min_raise, max_raise = round_state.raise_bounds()
+                return RaiseAction(rng.randint(min_raise, max_raise) if rng.random() < 0.1 else min_raise)
+            if action is FoldAction and rng.random() < 0.5:  # keep some rounds going to the river and the run
+                return CallAction() if CallAction in legal_actions else CheckAction()
+            return action()
+
+    differences = 0
+    with tempfile.TemporaryDirectory() as directory:
+        engine = load_engine(directory, NUM_ROUNDS=num_rounds, DECK_SEED=seed, HAND_HISTORY=True, HAND_HISTORY_PATH=directory)
+        game = engine.Game(engine.GameConfig('player_1', 'bots/python_skeleton', 'player_2', 'bots/python_skeleton', 'round_trip'))
+        with contextlib.redirect_stdout(io.StringIO()):
+            game.run(engine.BotPool(RandomPlayer, isolate=True))
+        parser = GameLogParser(game.log_path)
+        history_path = os.path.join(directory, os.path.splitext(os.path.basename(game.log_path))[0] + FILE_EXTENSION)
+        with HandHistoryReader(history_path) as reader:
+            bankrolls = [0, 0]
+            hands = iter(parser)
+            for position in range(len(reader)):
+                expected = reader.round(position)
+                expected['bankrolls'] = list(bankrolls)
+                bankrolls = [bankroll + delta for bankroll, delta in zip(bankrolls, expected['deltas'])]
+                if not expected['showdown']:
+                    expected['final_street'] = 0
+                del expected['clocks']
+                parsed = next(hands, None)
+                if parsed is None:
+                    print('The parsed log ends before round', expected['round_num'])
+                    return differences + 1
+                del parsed['notes']
+                if parsed != expected:
+                    differences += 1
+                    if differences <= 5:
+                        print('Round', expected['round_num'], 'differs:')
+                        for key in expected:
+                            if parsed.get(key) != expected[key]:
+                                print('  {}: parsed {} expected {}'.format(key, parsed.get(key), expected[key]))
+            if next(hands, None) is not None:
+                print('The parsed log has more rounds than the hand history')
+                differences += 1
+            if parser.final_bankrolls != bankrolls:
+                print('Final bankrolls differ: parsed {} expected {}'.format(parser.final_bankrolls, bankrolls))
+                differences += 1
+    print('Compared {} rounds, {} differences'.format(num_rounds, differences))
+    return differences
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog='python engine/logparser.py', description='Parses game logs.')
+    parser.add_argument('paths', nargs='*', default=[os.path.join(BASE_DIR, GAME_LOGS_PATH)],
+                        help='Game logs or directories, defaults to ' + GAME_LOGS_PATH)
+    parser.add_argument('--processes', type=int, help='Worker processes, defaults to one per CPU')
+    parser.add_argument('--check', type=int, metavar='ROUNDS', help='Compare the parsed log of ROUNDS random rounds with the hand history instead')
+    parser.add_argument('--seed', type=int, default=1, help='Seed of the --check rounds, defaults to 1')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.check:
+        raise SystemExit(1 if check_round_trip(args.check, args.seed) else 0)
+    start_time = time.perf_counter()
+    total_rounds = total_size = 0
+    for path, num_rounds in map_logs(count_rounds, args.paths, args.processes):
+        print('{:>10,} rounds  {}'.format(num_rounds, path))
+        total_rounds += num_rounds
+        total_size += os.path.getsize(path)
+    duration = time.perf_counter() - start_time
+    print('Parsed {:,} rounds, {:.1f} MB in {:.2f}s ({:.0f} MB/s)'.format(total_rounds, total_size / 1e6, duration, total_size / 1e6 / max(duration, 1e-9)))
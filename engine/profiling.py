@@ -0,0 +1,174 @@
+'''
+Opt-in profiling of the engine itself.
+
+With PROFILE=cprofile a match runs under cProfile, with PROFILE=sample a background thread samples the stacks
+of all engine threads every PROFILE_INTERVAL seconds, which costs far less than cProfile but misses short
+calls. Both write collapsed stacks, one "frame;frame;frame count" line per stack, to
+logs/profiles/<match>.folded, which flamegraph.pl, speedscope or inferno turn into a flame graph. The counts
+are microseconds for cProfile and samples for the sampler. cProfile only sees the thread that plays the match,
+the sampler also sees the game log writer. The other threads only wait for the bots' output.
+
+In addition the wall time of the engine's phases (deal, query, proceed, showdown, log, summary write) is
+written to logs/profiles/<match>.phases.json. The phases are timed by wrapping the methods that implement
+them for the duration of the match, so with PROFILE=off nothing is wrapped and nothing costs any time.
+Phases can be nested: proceed includes showdown.
+'''
+import cProfile
+import functools
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+MAX_DEPTH = 64  # of the stacks reconstructed from cProfile's call graph
+MIN_TIME = 1e-6  # seconds below which a reconstructed stack is dropped
+SAMPLED_THREADS = ('MainThread', 'GameLogWriter')
+
+
+def frame_name(filename, function_name):
+    '''
+    file:function without spaces, which separate the stack from the count in a collapsed stack.
+    '''
+    if filename == '~':  # a built-in function like <method 'recv' of '_socket.socket' objects>
+        return function_name.strip('<>').replace(' ', '_')
+    return '{}:{}'.format(os.path.basename(filename), function_name).replace(' ', '_')
+
+
+def collapse_cprofile(profile):
+    '''
+    Turns cProfile's call graph into collapsed stacks. cProfile only knows how much time a function spent
+    below each of its callers, so the time of a callee is split between the stacks of a caller in proportion
+    to how often the caller is reached on each of them, as flameprof and gprof2dot do.
+    '''
+    stats = pstats.Stats(profile).stats
+    callees = {}
+    for function, (_, _, _, _, callers) in stats.items():
+        for caller, (_, _, _, cumulative_time) in callers.items():
+            callees.setdefault(caller, []).append((function, cumulative_time))
+    stacks = Counter()
+
+    def visit(function, stack, fraction):
+        _, _, total_time, cumulative_time, _ = stats[function]
+        stack = stack + [frame_name(function[0], function[2])]
+        stacks[';'.join(stack)] += total_time * fraction
+        if len(stack) >= MAX_DEPTH or cumulative_time <= 0:
+            return
+        for callee, edge_time in callees.get(function, []):
+            if frame_name(callee[0], callee[2]) in stack:
+                continue  # recursion, its time is already part of the caller's
+            if edge_time * fraction >= MIN_TIME:
+                visit(callee, stack, fraction * edge_time / stats[callee][3])
+
+    for function, (_, _, _, _, callers) in stats.items():
+        if not callers:
+            visit(function, [], 1.)
+    return Counter({stack: int(seconds * 1e6) for stack, seconds in stacks.items() if seconds >= MIN_TIME})
+
+
+class StackSampler():
+    '''
+    Samples the stacks of the SAMPLED_THREADS from a daemon thread.
+    '''
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def sample(self):
+        while not self.stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate() if thread.name in SAMPLED_THREADS}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id not in names:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame_name(frame.f_code.co_filename, frame.f_code.co_name))
+                    frame = frame.f_back
+                stack.append(names[thread_id])
+                self.stacks[';'.join(reversed(stack))] += 1
+
+
+class Profiler():
+    '''
+    Profiles one match and times its phases.
+    '''
+
+    def __init__(self, mode, interval):
+        self.mode = mode
+        self.interval = interval
+        self.phases = {}  # phase -> [calls, seconds]
+        self.wrapped = []
+
+    def instrument(self, owner, attribute, phase):
+        '''
+        Adds the time spent in owner.attribute to the phase until the match is over.
+        '''
+        original = owner.__dict__[attribute]
+        totals = self.phases.setdefault(phase, [0, 0.])
+
+        @functools.wraps(original)
+        def timed(*args, **kwargs):
+            start_time = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                totals[0] += 1
+                totals[1] += time.perf_counter() - start_time
+
+        setattr(owner, attribute, timed)
+        self.wrapped.append((owner, attribute, original))
+
+    def restore(self):
+        for owner, attribute, original in reversed(self.wrapped):
+            setattr(owner, attribute, original)
+        self.wrapped.clear()
+
+    def run(self, function, path):
+        '''
+        Calls function under the profiler and writes path + '.folded' and path + '.phases.json'.
+        '''
+        start_time = time.perf_counter()
+        try:
+            if self.mode == 'cprofile':
+                profile = cProfile.Profile()
+                try:
+                    profile.runcall(function)
+                finally:
+                    stacks = collapse_cprofile(profile)
+            else:
+                sampler = StackSampler(self.interval)
+                sampler.start()
+                try:
+                    function()
+                finally:
+                    sampler.stop()
+                    stacks = sampler.stacks
+        finally:
+            self.restore()
+        self.write(path, stacks, time.perf_counter() - start_time)
+
+    def write(self, path, stacks, total_time):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.folded', 'w') as folded_file:
+            for stack, count in sorted(stacks.items()):
+                folded_file.write('{} {}\n'.format(stack, count))
+        phases = {
+            phase: {'calls': calls, 'seconds': round(seconds, 6), 'share': round(seconds / total_time, 4) if total_time > 0 else 0.}
+            for phase, (calls, seconds) in self.phases.items()
+        }
+        with open(path + '.phases.json', 'w') as phases_file:
+            json.dump({'profile': self.mode, 'seconds': round(total_time, 6), 'phases': phases}, phases_file, indent=2)
+        print('Engine phases:', ', '.join('{} {:.3f}s'.format(phase, seconds) for phase, (_, seconds) in self.phases.items()))
+        print('Writing profile to', os.path.normpath(path + '.folded'), flush=True)
@@ -0,0 +1,99 @@
+'''
+Encodings of the messages between the engine and the pokerbots.
+
+The engine collects the clauses of a message as (code, value) tuples, see the socket encoding scheme in
+engine.py, and encodes them once they are sent. Version 1 is the original text protocol. Version 2 is offered
+by the engine with a V2 clause right after a pokerbot connected; a runner that speaks it answers V2 and both
+switch to binary frames, any other answer keeps version 1.
+
+A version 2 frame is a little-endian uint16 payload length followed by the payload. The payload of an engine
+message is a sequence of clauses, each a one byte code (the same letters as in version 1) and its value:
+
+    T  float64 game clock        P  uint8 player index
+    H  2 cards                   O  2 cards
+    B  uint8 count, count cards  R  int32 raise amount
+    D  int32 bankroll delta      G  int32 bankroll, int32 round number
+    F, C, K, N, Q  nothing
+
+Cards are one byte each, rank * 4 + suit with ranks 23456789TJQKA and suits cdhs. B only carries the cards
+dealt since the previous B clause of the round, the runner appends them to the board it already has.
+The payload of a pokerbot reply is the code of its action, followed by the int32 amount for R.
+'''
+import struct
+
+PROTOCOL_VERSION = 2
+CARD_NAMES = [rank + suit for rank in '23456789TJQKA' for suit in 'cdhs']
+CARD_CODE = lambda card: card.rank * 4 + card.suit  # eval7 numbers ranks and suits in the same order
+FRAME_HEADER = struct.Struct('<H')
+CLOCK = struct.Struct('<cd')
+AMOUNT = struct.Struct('<ci')
+RESUME = struct.Struct('<cii')
+
+
+class TextProtocol():
+    '''
+    Version 1: space separated clauses, messages end with a newline.
+    '''
+    version = 1
+    framed = False
+
+    def encode(self, clauses, game_clock=0.):
+        encoded = []
+        for code, value in clauses:
+            if code == 'T':
+                encoded.append('T{:.3f}'.format(game_clock))
+            elif value is None:
+                encoded.append(code)
+            elif code in 'HBOG':
+                encoded.append(code + ','.join(map(str, value)))
+            else:
+                encoded.append(code + str(value))
+        return ' '.join(encoded) + '\n'
+
+    def decode(self, reply):
+        '''
+        Returns the action code and the unparsed raise amount of a reply.
+        '''
+        clause = reply.strip()
+        return clause[0], clause[1:]
+
+
+class BinaryProtocol():
+    '''
+    Version 2: binary frames with one byte cards and incremental boards.
+    '''
+    version = 2
+    framed = True
+
+    def __init__(self):
+        self.board_size = 0  # board cards the pokerbot already got this round
+
+    def encode(self, clauses, game_clock=0.):
+        encoded = bytearray()
+        for code, value in clauses:
+            if code == 'T':
+                encoded += CLOCK.pack(b'T', game_clock)
+            elif code == 'P':
+                encoded += bytes((ord('P'), value))
+            elif code == 'H' or code == 'O':
+                encoded += bytes((ord(code), CARD_CODE(value[0]), CARD_CODE(value[1])))
+                if code == 'H':
+                    self.board_size = 0
+            elif code == 'B':
+                dealt = value[self.board_size:]
+                encoded += bytes([ord('B'), len(dealt)] + [CARD_CODE(card) for card in dealt])
+                self.board_size = len(value)
+            elif code == 'R' or code == 'D':
+                encoded += AMOUNT.pack(code.encode(), value)
+            elif code == 'G':
+                encoded += RESUME.pack(b'G', *value)
+            else:
+                encoded += code.encode()
+        return bytes(encoded)
+
+    def decode(self, reply):
+        '''
+        Returns the action code and the raise amount of a reply.
+        '''
+        code = chr(reply[0])
+        return code, AMOUNT.unpack(reply)[1] if code == 'R' else 0
@@ -0,0 +1,234 @@
+'''
+Replays recorded hands to a python pokerbot to find the decisions that changed.
+
+The rounds of hand histories, or of game logs for matches without one, are turned back into the messages the
+engine sent to one of the players, and the pokerbot is driven in-process like with HEADLESS=true, so it sees the
+same GameState and RoundState sequence the skeleton runner built in the match. The pokerbot acts wherever the
+player acted, but the round always continues with the logged action. Every decision that differs from the logged
+one is reported with the time the pokerbot took, together with the latencies of all decisions.
+
+Game clocks are only known from hand histories, with game logs the pokerbot always gets STARTING_GAME_CLOCK.
+Decisions after the player ran out of time or crashed in the match are not compared. Pokerbots that draw random
+numbers are seeded with --seed before every match, so their replays are repeatable, but their decisions can
+still differ from the match.
+
+Run with: python engine/replay.py bots/harry [files or directories] [--player NAME] [--processes N]
+'''
+import argparse
+import contextlib
+import heapq
+import io
+import os
+import random
+import sys
+import time
+import traceback
+from multiprocessing import Pool
+
+from handhistory import HandHistoryReader, FILE_EXTENSION
+from handindex import history_rounds, find_sources
+from headless import InProcessPlayer
+from logparser import GameLogParser
+from stats import LatencyHistogram
+from config import STARTING_GAME_CLOCK, HAND_HISTORY_PATH, GAME_LOGS_PATH
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ACTION_CODES = {'FoldAction': 'F', 'CallAction': 'C', 'CheckAction': 'K', 'RaiseAction': 'R'}
+STREET_NAMES = {0: 'preflop', 3: 'flop', 4: 'turn', 5: 'river'}
+NUM_SLOWEST = 5  # decisions listed per match
+LOST_CONTROL = (' ran out of time', ' disconnected')
+
+
+def encode_action(action):
+    '''
+    Returns the action of the pokerbot in the notation of the socket protocol (F, C, K, R<amount>).
+    '''
+    code = ACTION_CODES.get(type(action).__name__)
+    if code is None:
+        return repr(action)
+    if code == 'R':
+        try:
+            return 'R' + str(int(str(action.amount)))  # same parsing as for socket messages
+        except ValueError:
+            return 'R' + str(action.amount)
+    return code
+
+
+def street_name(street):
+    return STREET_NAMES.get(street, 'run')
+
+
+class Replay():
+    '''
+    The outcome of replaying one match.
+    '''
+
+    def __init__(self, name):
+        self.name = name
+        self.rounds = 0
+        self.decisions = 0
+        self.differences = []  # (round_num, street, logged, replayed, latency)
+        self.latencies = LatencyHistogram()
+        self.slowest = []  # heap of (latency, round_num, street)
+        self.error = None
+
+    def add_decision(self, round_num, street, logged, replayed, latency):
+        self.decisions += 1
+        self.latencies.add(latency)
+        if replayed != logged:
+            self.differences.append((round_num, street, logged, replayed, latency))
+        if len(self.slowest) < NUM_SLOWEST:
+            heapq.heappush(self.slowest, (latency, round_num, street))
+        else:
+            heapq.heappushpop(self.slowest, (latency, round_num, street))
+
+
+def read_rounds(source, stack):
+    '''
+    Returns the players of a hand history or game log and an iterator over its rounds.
+    A hand history is closed with the ExitStack stack.
+    '''
+    if source.endswith(FILE_EXTENSION):
+        reader = stack.enter_context(HandHistoryReader(source))
+        return reader.players, history_rounds(reader)
+    parser = GameLogParser(source)
+    return parser.players, iter(parser)
+
+
+def replay_match(task):
+    '''
+    Replays the rounds of the player in one match to the pokerbot in bot_path.
+    '''
+    name, source, player_name, bot_path, seed, max_rounds = task
+    replay = Replay(name)
+    with contextlib.ExitStack() as stack:
+        try:
+            players, rounds = read_rounds(source, stack)
+        except ValueError as e:  # an unfinished hand history or not a game log
+            replay.error = str(e)
+            return replay
+        if player_name in players:
+            return replay_rounds(replay, players.index(player_name), rounds, player_name, bot_path, seed, max_rounds)
+    return None
+
+
+def replay_rounds(replay, index, rounds, player_name, bot_path, seed, max_rounds):
+    '''
+    Loads the pokerbot and replays the rounds of the player with the given index in the match.
+    '''
+    player = InProcessPlayer(player_name, bot_path, replay.name, index)
+    loading = io.StringIO()
+    with contextlib.redirect_stdout(loading):
+        player.build()
+        random.seed(seed)
+        if 'numpy' in sys.modules:
+            sys.modules['numpy'].random.seed(seed)
+        player.run()
+    if player.pokerbot is None:
+        replay.error = (loading.getvalue() + player.output.getvalue()).strip()
+        return replay
+    GameState = player.states.GameState
+    bankroll = 0
+    game_clock = STARTING_GAME_CLOCK
+    in_control = True  # until the player ran out of time or crashed in the match
+    for hand in rounds:
+        if max_rounds is not None and replay.rounds >= max_rounds:
+            break
+        replay.rounds += 1
+        round_num = hand['round_num']
+        seat = 0 if hand['button'] == index else 1
+        in_control = in_control and game_clock > 0.
+        player.game_state = GameState(bankroll, round(game_clock, 3), round_num)
+        message = [('T', game_clock), ('P', seat), ('H', hand['hands'][index])]
+        street = 0
+        try:
+            for acting, action_street, code, amount in hand['actions']:
+                if action_street != street:
+                    message.append(('B', hand['board'][:action_street]))
+                    street = action_street
+                if acting == index:
+                    action = None
+                    with contextlib.redirect_stdout(player.output), contextlib.redirect_stderr(player.output):
+                        start_time = time.perf_counter()
+                        if player.receive(message):
+                            action = player.pokerbot.get_action(player.game_state, player.round_state, player.active)
+                        latency = time.perf_counter() - start_time
+                    del message[1:]
+                    if in_control:
+                        replay.add_decision(round_num, street, code + (str(amount) if code == 'R' else ''), encode_action(action), latency)
+                message.append((code, amount if code == 'R' else None))
+            if hand['showdown']:
+                message.append(('O', hand['hands'][1 - index]))
+            message.append(('D', hand['deltas'][index]))
+            with contextlib.redirect_stdout(player.output), contextlib.redirect_stderr(player.output):
+                player.receive(message)
+        except Exception:
+            replay.error = 'crashed in round {}\n{}'.format(round_num, traceback.format_exc())
+            break
+        bankroll += hand['deltas'][index]
+        if 'clocks' in hand:
+            game_clock = hand['clocks'][index]
+        elif any(note.startswith(player_name) and note.endswith(LOST_CONTROL) for note in hand['notes']):
+            in_control = False
+    return replay
+
+
+def replay_matches(tasks, processes=None):
+    '''
+    Yields the replays of the tasks, computed by a pool of processes in the order they finish.
+    '''
+    if processes == 1 or len(tasks) <= 1:
+        yield from map(replay_match, tasks)
+        return
+    with Pool(processes) as pool:
+        yield from pool.imap_unordered(replay_match, tasks)
+
+
+def print_replay(replay, num_shown):
+    latencies = replay.latencies
+    print('{}: {} rounds, {} decisions, {} differ, mean {:.3f}ms, p99 {:.3f}ms, max {:.3f}ms'.format(
+        replay.name, replay.rounds, replay.decisions, len(replay.differences),
+        latencies.total / max(latencies.count, 1) * 1e3, latencies.percentile(0.99) * 1e3, latencies.max * 1e3))
+    for round_num, street, logged, replayed, latency in replay.differences[:num_shown]:
+        print('  round {:>6} {:<8} logged {:<6} replayed {:<6} {:.3f}ms'.format(round_num, street_name(street), logged, replayed, latency * 1e3))
+    if len(replay.differences) > num_shown:
+        print('  ... {} more'.format(len(replay.differences) - num_shown))
+    if replay.slowest:
+        print('  slowest: ' + ', '.join('round {} {} {:.3f}ms'.format(round_num, street_name(street), latency * 1e3)
+                                        for latency, round_num, street in sorted(replay.slowest, reverse=True)))
+    if replay.error is not None:
+        print('  ' + replay.error.replace('\n', '\n  ').rstrip())
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog='python engine/replay.py', description='Replays recorded hands to a python pokerbot.')
+    parser.add_argument('bot', help='Path of the pokerbot, like bots/harry')
+    parser.add_argument('paths', nargs='*', default=[os.path.join(BASE_DIR, HAND_HISTORY_PATH), os.path.join(BASE_DIR, GAME_LOGS_PATH)],
+                        help='Hand histories, game logs or directories, defaults to {} and {}'.format(HAND_HISTORY_PATH, GAME_LOGS_PATH))
+    parser.add_argument('--player', help='Name of the player to replay, defaults to the name of the bot directory')
+    parser.add_argument('--rounds', type=int, help='Replay at most this many rounds of every match')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the pokerbot\'s random numbers, defaults to 0')
+    parser.add_argument('--processes', type=int, help='Worker processes, defaults to one per CPU')
+    parser.add_argument('--show', type=int, default=20, help='Differing decisions listed per match, defaults to 20')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    bot_path = os.path.abspath(args.bot)
+    player_name = args.player or os.path.basename(os.path.normpath(bot_path))
+    tasks = [(name, source, player_name, bot_path, args.seed, args.rounds) for name, source in find_sources(args.paths)]
+    start_time = time.perf_counter()
+    num_matches = num_decisions = num_differences = num_errors = 0
+    for replay in replay_matches(tasks, args.processes):
+        if replay is None:
+            continue
+        print_replay(replay, args.show)
+        num_matches += 1
+        num_decisions += replay.decisions
+        num_differences += len(replay.differences)
+        num_errors += replay.error is not None
+    print('Replayed {:,} decisions of {} in {} matches in {:.2f}s, {:,} differ'.format(
+        num_decisions, player_name, num_matches, time.perf_counter() - start_time, num_differences)
+        + (', {} failed'.format(num_errors) if num_errors else ''))
+    raise SystemExit(1 if num_differences or num_errors else 0)
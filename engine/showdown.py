@@ -0,0 +1,100 @@
+'''
+Showdown evaluation for boards of any length.
+
+In the royal variant the board keeps growing while face cards are dealt, so a showdown can involve
+up to 50 cards. eval7.evaluate is only reliable for up to 7 cards (it can misrank flushes beyond that).
+For longer boards we keep one 13 bit rank mask per suit, pick the few five card hands that can be
+the best one from these masks and score them with eval7. The scores are therefore the same as eval7's
+for every hand of up to 7 cards, and the cost does not depend on the length of the run.
+'''
+import eval7
+
+CARDS = [[eval7.Card(rank + suit) for rank in '23456789TJQKA'] for suit in 'cdhs']  # indexed by card.suit and card.rank
+TOP_RANKS = [tuple(rank for rank in range(12, -1, -1) if mask >> rank & 1) for mask in range(1 << 13)]
+POPCOUNT = [len(ranks) for ranks in TOP_RANKS]
+
+
+def straight_ranks(mask):
+    '''
+    Returns the ranks of the highest straight in the rank mask or None.
+    '''
+    extended = (mask << 1) | (mask >> 12 & 1)  # the ace also counts below the two
+    runs = extended & (extended >> 1) & (extended >> 2) & (extended >> 3) & (extended >> 4)
+    if not runs:
+        return None
+    top = runs.bit_length() + 2  # bit i of runs is a straight up to rank i + 3
+    return [rank % 13 for rank in range(top, top - 5, -1)]
+
+
+def best_score(masks):
+    '''
+    Returns the eval7 score of the best five card hand in the rank masks of the four suits.
+    '''
+    scores = []
+    for suit, mask in enumerate(masks):
+        if POPCOUNT[mask] >= 5:
+            ranks = straight_ranks(mask) or TOP_RANKS[mask][:5]
+            scores.append(eval7.evaluate([CARDS[suit][rank] for rank in ranks]))
+
+    m0, m1, m2, m3 = masks
+    cards_of = lambda rank: [CARDS[suit][rank] for suit in range(4) if masks[suit] >> rank & 1]
+    kickers = lambda mask, n: [cards_of(rank)[0] for rank in TOP_RANKS[mask][:n]]
+    ranks = m0 | m1 | m2 | m3
+    twos = (m0 & m1) | (m0 & m2) | (m0 & m3) | (m1 & m2) | (m1 & m3) | (m2 & m3)  # at least two cards
+    threes = (m0 & m1 & (m2 | m3)) | (m2 & m3 & (m0 | m1))  # at least three cards
+    fours = m0 & m1 & m2 & m3
+    if fours:
+        quad = fours.bit_length() - 1
+        scores.append(eval7.evaluate(cards_of(quad) + kickers(ranks & ~(1 << quad), 1)))
+    elif threes and twos & ~(1 << (threes.bit_length() - 1)):  # full house
+        trip = threes.bit_length() - 1
+        pair = (twos & ~(1 << trip)).bit_length() - 1
+        scores.append(eval7.evaluate(cards_of(trip)[:3] + cards_of(pair)[:2]))
+    else:
+        straight = straight_ranks(ranks)
+        if straight is not None:
+            scores.append(eval7.evaluate([cards_of(rank)[0] for rank in straight]))
+        if threes:
+            trip = threes.bit_length() - 1
+            scores.append(eval7.evaluate(cards_of(trip) + kickers(ranks & ~(1 << trip), 2)))
+        elif twos:
+            pairs = TOP_RANKS[twos][:2]
+            pair_mask = sum(1 << rank for rank in pairs)
+            hand = [card for rank in pairs for card in cards_of(rank)]
+            scores.append(eval7.evaluate(hand + kickers(ranks & ~pair_mask, 5 - len(hand))))
+        else:
+            scores.append(eval7.evaluate(kickers(ranks, 5)))
+    return max(scores)
+
+
+class ShowdownEvaluator():
+    '''
+    Scores hands against boards of any length.
+    The rank masks of the board are memoized, and extended when the next board starts with the previous one,
+    so both players of a showdown share the work on the board.
+    '''
+
+    def __init__(self):
+        self.board = []
+        self.masks = [0, 0, 0, 0]
+
+    def group_board(self, board):
+        num_cards = len(self.board)
+        if len(board) < num_cards or board[:num_cards] != self.board:
+            num_cards, self.masks = 0, [0, 0, 0, 0]
+        for card in board[num_cards:]:
+            self.masks[card.suit] |= 1 << card.rank
+        self.board = list(board)
+
+    def evaluate(self, board, hand):
+        '''
+        Returns the eval7 score of the best five card hand made from board and hand.
+        '''
+        if len(board) + len(hand) <= 7:
+            return eval7.evaluate(board + hand)
+        if board != self.board:
+            self.group_board(board)
+        masks = list(self.masks)
+        for card in hand:
+            masks[card.suit] |= 1 << card.rank
+        return best_score(masks)
@@ -0,0 +1,267 @@
+'''
+Encapsulates the game tree for one round of poker on the engine side.
+'''
+from array import array
+from collections import namedtuple
+
+from actions import FoldAction, CallAction, CheckAction, RaiseAction
+from config import STARTING_STACK, BIG_BLIND, SMALL_BLIND
+from stats import GameSummary
+from showdown import ShowdownEvaluator
+
+TerminalState = namedtuple('TerminalState', ['deltas', 'previous_state'])
+SHOWDOWN_EVALUATOR = ShowdownEvaluator()
+
+
+class RoundState(namedtuple('_RoundState', ['button', 'street', 'final_street', 'pips', 'stacks', 'hands', 'deck', 'reached_run', 'previous_state'])):
+    '''
+    Encodes the game tree for one round of poker.
+    '''
+
+    # Showdown street is no longer guaranteed to be street == 5
+    # Need to include check on final card dealt whether it is a black card (clubs or spades)
+
+    def showdown(self, summary: GameSummary):
+        '''
+        Compares the players' hands and computes payoffs.
+        '''
+        board = self.deck.peek(self.final_street)
+        score0 = SHOWDOWN_EVALUATOR.evaluate(board, self.hands[0])
+        score1 = SHOWDOWN_EVALUATOR.evaluate(board, self.hands[1])
+        if score0 > score1:
+            delta = STARTING_STACK - self.stacks[1]
+        elif score0 < score1:
+            delta = self.stacks[0] - STARTING_STACK
+        else:  # split the pot
+            delta = (self.stacks[0] - self.stacks[1]) // 2
+            summary.num_chops += 1
+        return TerminalState([delta, -delta], self)
+
+    def legal_actions(self):
+        '''
+        Returns a set which corresponds to the active player's legal moves.
+        '''
+        active = self.button % 2
+        continue_cost = self.pips[1-active] - self.pips[active]
+        if continue_cost == 0:
+            # we can only raise the stakes if both players can afford it
+            bets_forbidden = (self.stacks[0] == 0 or self.stacks[1] == 0)
+            return {CheckAction} if bets_forbidden else {CheckAction, RaiseAction}
+        # continue_cost > 0
+        # similarly, re-raising is only allowed if both players can afford it
+        raises_forbidden = (continue_cost == self.stacks[active] or self.stacks[1-active] == 0)
+        return {FoldAction, CallAction} if raises_forbidden else {FoldAction, CallAction, RaiseAction}
+
+    def raise_bounds(self):
+        '''
+        Returns a tuple of the minimum and maximum legal raises.
+        '''
+        active = self.button % 2
+        continue_cost = self.pips[1-active] - self.pips[active]
+        max_contribution = min(self.stacks[active], self.stacks[1-active] + continue_cost)
+        min_contribution = min(max_contribution, continue_cost + max(continue_cost, BIG_BLIND))
+        return (self.pips[active] + min_contribution, self.pips[active] + max_contribution)
+
+    def proceed_street(self, summary: GameSummary):
+        '''
+        Resets the players' pips and advances the game tree to the next round of betting.
+        '''
+        # if self.street == 5:
+        #     return self.showdown()
+        if self.street == self.final_street:
+            return self.showdown(summary)
+        new_street = 3 if self.street == 0 else self.street + 1
+        if self.street < 5: 
+            reached_run = -1 
+        elif self.street == 5:
+            reached_run = self.stacks[0]
+        else:
+            reached_run = self.reached_run
+        return RoundState(1, new_street, self.final_street, [0, 0], self.stacks, self.hands, self.deck, reached_run, self)
+
+    def proceed(self, action, summary: GameSummary):
+        '''
+        Advances the game tree by one action performed by the active player.
+        '''
+        active = self.button % 2
+        if isinstance(action, FoldAction):
+            delta = self.stacks[0] - STARTING_STACK if active == 0 else STARTING_STACK - self.stacks[1]
+            return TerminalState([delta, -delta], self)
+        if isinstance(action, CallAction):
+            if self.button == 0:  # sb calls bb
+                return RoundState(1, 0, self.final_street, [BIG_BLIND] * 2, [STARTING_STACK - BIG_BLIND] * 2, self.hands, self.deck, self.reached_run, self)
+            # both players acted
+            new_pips = list(self.pips)
+            new_stacks = list(self.stacks)
+            contribution = new_pips[1-active] - new_pips[active]
+            new_stacks[active] -= contribution
+            new_pips[active] += contribution
+            state = RoundState(self.button + 1, self.street, self.final_street, new_pips, new_stacks, self.hands, self.deck, self.reached_run, self)
+            return state.proceed_street(summary)
+        if isinstance(action, CheckAction):
+            if (self.street == 0 and self.button > 0) or self.button > 1:  # both players acted
+                return self.proceed_street(summary)
+            # let opponent act
+            return RoundState(self.button + 1, self.street, self.final_street, self.pips, self.stacks, self.hands, self.deck, self.reached_run, self)
+        # isinstance(action, RaiseAction)
+        new_pips = list(self.pips)
+        new_stacks = list(self.stacks)
+        contribution = action.amount - new_pips[active]
+        new_stacks[active] -= contribution
+        new_pips[active] += contribution
+        return RoundState(self.button + 1, self.street, self.final_street, new_pips, new_stacks, self.hands, self.deck, self.reached_run, self)
+
+
+# bits of the legal action masks of CompactRoundState
+FOLD = 1
+CALL = 2
+CHECK = 4
+RAISE = 8
+ACTION_BITS = {FoldAction: FOLD, CallAction: CALL, CheckAction: CHECK, RaiseAction: RAISE}
+MASK_TO_ACTIONS = {mask: frozenset(action for action, bit in ACTION_BITS.items() if mask & bit) for mask in range(16)}
+
+
+class CompactRoundState():
+    '''
+    Mutable version of RoundState, which the engine plays its rounds on.
+    Actions are applied in place and recorded in an undo log instead of chaining new states.
+    The legal actions (as a bitmask) and the raise bounds are computed at most once per state.
+    '''
+    __slots__ = ['button', 'street', 'final_street', 'pips', 'stacks', 'hands', 'deck', 'reached_run', 'deltas',
+                 'undo_log', '_legal_mask', '_raise_bounds']
+
+    def __init__(self, final_street, hands, deck):
+        self.button = 0
+        self.street = 0
+        self.final_street = final_street
+        self.pips = array('i', [SMALL_BLIND, BIG_BLIND])
+        self.stacks = array('i', [STARTING_STACK - SMALL_BLIND, STARTING_STACK - BIG_BLIND])
+        self.hands = hands
+        self.deck = deck
+        self.reached_run = -1
+        self.deltas = None  # set once the round is over
+        self.undo_log = []
+        self._legal_mask = 0
+        self._raise_bounds = None
+
+    def is_terminal(self):
+        return self.deltas is not None
+
+    def legal_mask(self):
+        '''
+        Returns the active player's legal moves as a bitmask of FOLD, CALL, CHECK and RAISE.
+        '''
+        if self._legal_mask:
+            return self._legal_mask
+        active = self.button % 2
+        stacks = self.stacks
+        continue_cost = self.pips[1-active] - self.pips[active]
+        if continue_cost == 0:
+            # we can only raise the stakes if both players can afford it
+            mask = CHECK if (stacks[0] == 0 or stacks[1] == 0) else CHECK | RAISE
+        else:
+            # similarly, re-raising is only allowed if both players can afford it
+            mask = FOLD | CALL if (continue_cost == stacks[active] or stacks[1-active] == 0) else FOLD | CALL | RAISE
+        self._legal_mask = mask
+        return mask
+
+    def legal_actions(self):
+        '''
+        Returns a set which corresponds to the active player's legal moves.
+        '''
+        return MASK_TO_ACTIONS[self.legal_mask()]
+
+    def raise_bounds(self):
+        '''
+        Returns a tuple of the minimum and maximum legal raises.
+        '''
+        if self._raise_bounds is None:
+            active = self.button % 2
+            continue_cost = self.pips[1-active] - self.pips[active]
+            max_contribution = min(self.stacks[active], self.stacks[1-active] + continue_cost)
+            min_contribution = min(max_contribution, continue_cost + max(continue_cost, BIG_BLIND))
+            self._raise_bounds = (self.pips[active] + min_contribution, self.pips[active] + max_contribution)
+        return self._raise_bounds
+
+    def showdown(self, summary=None):
+        '''
+        Compares the players' hands and computes payoffs.
+        '''
+        board = self.deck.peek(self.final_street)
+        score0 = SHOWDOWN_EVALUATOR.evaluate(board, self.hands[0])
+        score1 = SHOWDOWN_EVALUATOR.evaluate(board, self.hands[1])
+        if score0 > score1:
+            delta = STARTING_STACK - self.stacks[1]
+        elif score0 < score1:
+            delta = self.stacks[0] - STARTING_STACK
+        else:  # split the pot
+            delta = (self.stacks[0] - self.stacks[1]) // 2
+            if summary is not None:
+                summary.num_chops += 1
+        self.deltas = [delta, -delta]
+
+    def proceed_street(self, summary=None):
+        '''
+        Resets the players' pips and advances to the next round of betting.
+        '''
+        if self.street == self.final_street:
+            self.showdown(summary)
+            return
+        if self.street < 5:
+            self.reached_run = -1
+        elif self.street == 5:
+            self.reached_run = self.stacks[0]
+        self.street = 3 if self.street == 0 else self.street + 1
+        self.button = 1
+        self.pips[0] = self.pips[1] = 0
+
+    def apply(self, action, amount=0, summary=None):
+        '''
+        Performs the action bit (FOLD, CALL, CHECK or RAISE to amount) of the active player in place.
+        '''
+        pips = self.pips
+        stacks = self.stacks
+        self.undo_log.append((self.button, self.street, pips[0], pips[1], stacks[0], stacks[1], self.reached_run))
+        self._legal_mask = 0
+        self._raise_bounds = None
+        active = self.button % 2
+        if action == FOLD:
+            delta = stacks[0] - STARTING_STACK if active == 0 else STARTING_STACK - stacks[1]
+            self.deltas = [delta, -delta]
+        elif action == CALL:
+            if self.button == 0:  # sb calls bb
+                self.button = 1
+                pips[0] = pips[1] = BIG_BLIND
+                stacks[0] = stacks[1] = STARTING_STACK - BIG_BLIND
+                return
+            # both players acted
+            contribution = pips[1-active] - pips[active]
+            stacks[active] -= contribution
+            pips[active] += contribution
+            self.button += 1
+            self.proceed_street(summary)
+        elif action == CHECK:
+            if (self.street == 0 and self.button > 0) or self.button > 1:  # both players acted
+                self.proceed_street(summary)
+            else:  # let opponent act
+                self.button += 1
+        else:  # action == RAISE
+            contribution = amount - pips[active]
+            stacks[active] -= contribution
+            pips[active] += contribution
+            self.button += 1
+
+    def undo(self):
+        '''
+        Reverts the last applied action.
+        '''
+        self.button, self.street, self.pips[0], self.pips[1], self.stacks[0], self.stacks[1], self.reached_run = self.undo_log.pop()
+        self.deltas = None
+        self._legal_mask = 0
+        self._raise_bounds = None
+
+    def to_round_state(self):
+        '''
+        Returns the current state as an immutable RoundState (without the history).
+        '''
+        return RoundState(self.button, self.street, self.final_street, list(self.pips), list(self.stacks), self.hands, self.deck, self.reached_run, None)
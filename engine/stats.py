@@ -1,90 +1,441 @@
-from config import SUMMARY_PATH, STARTING_STACK, NUM_ROUNDS
+from actions import FoldAction, CallAction, RaiseAction
+from config import SUMMARY_PATH, STARTING_STACK
+from array import array
 from collections import namedtuple
+import heapq
 import os
 import json
+import math
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 HandDelta = namedtuple('HandDelta', ['round_num', 'chip_delta'])
 
+NUM_EXTREME_HANDS = 5 # rounds with the largest and smallest deltas in the summary
+BANKROLL_BUCKETS = 100 # the summary keeps the lowest and highest bankroll of each bucket of rounds
+GAME_CLOCK_BUCKETS = 100 # and the lowest and highest remaining game clock of each bucket of rounds
+
+QUERY_STREETS = {0: 'Preflop', 3: 'Flop', 4: 'Turn', 5: 'River'}
+
+def query_street(round_state):
+    '''
+    Name of the street a query was made on, 'Round over' for the query that ends the round.
+    '''
+    street = getattr(round_state, 'street', None)  # a TerminalState has none
+    if street is None:
+        return 'Round over'
+    return QUERY_STREETS.get(street, 'Run')
+
+def significant(value, digits=3):
+    return float('{:.{}g}'.format(value, digits))
+
+class LatencyHistogram:
+    '''
+    Counts latencies in logarithmic buckets, BUCKETS_PER_DOUBLING for every doubling of the latency above
+    MIN_LATENCY. Percentiles are the upper bound of their bucket, at most 9% above the exact value.
+    The log gives seconds to 3 significant figures, which keeps the bounds of neighbouring buckets apart.
+    '''
+    MIN_LATENCY = 1e-6
+    BUCKETS_PER_DOUBLING = 8
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.
+        self.max = 0.
+
+    def add(self, latency):
+        bucket = 0 if latency <= self.MIN_LATENCY else int(math.log2(latency / self.MIN_LATENCY) * self.BUCKETS_PER_DOUBLING)
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += latency
+        self.max = max(self.max, latency)
+
+    def upper_bound(self, bucket):
+        return self.MIN_LATENCY * 2 ** ((bucket + 1) / self.BUCKETS_PER_DOUBLING)
+
+    def percentile(self, fraction):
+        rank = fraction * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(self.upper_bound(bucket), self.max)
+        return self.max
+
+    def log(self):
+        if self.count == 0:
+            return {'count': 0}
+        return {
+            'count': self.count,
+            'mean': significant(self.total / self.count),
+            'p50': significant(self.percentile(0.5)),
+            'p90': significant(self.percentile(0.9)),
+            'p99': significant(self.percentile(0.99)),
+            'max': significant(self.max),
+            'buckets': [[significant(self.upper_bound(bucket)), self.buckets[bucket]] for bucket in sorted(self.buckets)],
+        }
+
 # VPIP: Voluntarily Put Money in Pot: measures how often one voluntarily pays money into a hand before seeing the flop. Paying the big blind, the small blind, or the ante is not considered voluntary.
 # PFR : Preflop Raise
+# AF  : Aggression Factor: bets and raises per call after the flop
+# 3-bet: reraising the first raise before the flop, the big blind counting as the first bet
+# c-bet: continuation bet: the last raiser before the flop bets the flop when nobody bet before
+# WTSD: Went To ShowDown, of the rounds that saw the flop. W$SD: Won money at ShowDown, of the showdowns
+# indices into PlayerSummary.counts, which GameSummary updates by the index of the player in the match
+# not all vpip opportunities are pfr opportunities (e.g. opponent is all-in)
+(VPIP_OPPORTUNITIES, VPIP, PFR_OPPORTUNITIES, PFR, ILLEGAL_ACTIONS, TIMEOUTS, POSTFLOP_RAISES, POSTFLOP_CALLS,
+ THREE_BET_OPPORTUNITIES, THREE_BETS, FOLD_TO_THREE_BET_OPPORTUNITIES, FOLDS_TO_THREE_BET, CBET_OPPORTUNITIES, CBETS,
+ SAW_FLOP, WENT_TO_SHOWDOWN, WON_AT_SHOWDOWN, NUM_COUNTERS) = range(18)
+
+SIZING_STREETS = ('Preflop', 'Flop', 'Turn', 'River', 'Run')
+# upper bounds of the bet sizing buckets, in pots
+BET_SIZE_BOUNDS = (0.25, 0.5, 0.75, 1., 1.5, 2., 3., float('inf'))
+# the buckets in the summary: '<=0.25' up to '<=3', and '>3' for the open-ended last one
+BET_SIZE_LABELS = ['<={:g}'.format(bound) for bound in BET_SIZE_BOUNDS[:-1]] + ['>{:g}'.format(BET_SIZE_BOUNDS[-2])]
+
+def sizing_street(street):
+    return 0 if street == 0 else min(street - 2, 4)
+
+def ratio(numerator, denominator):
+    if denominator == 0:
+        return None
+    return round(numerator / denominator, 3)
+
 class PlayerSummary:
     def __init__(self, player1_name):
         self.player1_name = player1_name
-        self.num_won_at_showdown = 0
-        self.num_vpip_opportunities = 0
-        self.num_vpip = 0
-        self.num_pfr_opportunities = 0 # not all vpip opportunities are pfr opportunities (e.g. opponent is all-in)
-        self.num_pfr = 0
-        self.num_illegal_actions = 0
-        self.num_timeouts = 0
+        self.counts = [0] * NUM_COUNTERS
+        # bets and raises by street and size, the size is the raise beyond a call relative to the pot after the call
+        self.bet_sizes = [[0] * len(BET_SIZE_BOUNDS) for _ in SIZING_STREETS]
+        self.bet_size_totals = [0.] * len(SIZING_STREETS)
+        self.connect_time = None
+        self.handshake_time = None
+        # seconds from sending a message until the reply arrived, so the bot's thinking plus the transport
+        self.response_times = LatencyHistogram()
+        self.street_response_times = {}
+        self.action_response_times = {}
+
+    def add_response_time(self, street, action_name, latency):
+        self.response_times.add(latency)
+        self.street_response_times.setdefault(street, LatencyHistogram()).add(latency)
+        if action_name is not None:
+            self.action_response_times.setdefault(action_name, LatencyHistogram()).add(latency)
+
+    def add_bet_size(self, street, size):
+        bucket = 0
+        while size > BET_SIZE_BOUNDS[bucket]:
+            bucket += 1
+        self.bet_sizes[street][bucket] += 1
+        self.bet_size_totals[street] += size
 
     def get_pfr(self):
-        if self.num_vpip_opportunities == 0:
+        if self.counts[VPIP_OPPORTUNITIES] == 0:
             return 1.0
-        return round(self.num_pfr / self.num_vpip_opportunities, 3)
+        return round(self.counts[PFR] / self.counts[VPIP_OPPORTUNITIES], 3)
 
     def get_vpip(self):
-        if self.num_vpip_opportunities == 0:
+        if self.counts[VPIP_OPPORTUNITIES] == 0:
             return 1.0
-        return round(self.num_vpip / self.num_vpip_opportunities, 3)
+        return round(self.counts[VPIP] / self.counts[VPIP_OPPORTUNITIES], 3)
 
-    def log(self):
+    def log_bet_sizes(self):
+        log = {}
+        for street, (buckets, total) in enumerate(zip(self.bet_sizes, self.bet_size_totals)):
+            count = sum(buckets)
+            if count == 0:
+                continue
+            log[SIZING_STREETS[street]] = {
+                'count': count,
+                'mean': round(total / count, 3),
+                'buckets': [[label, bucket_count] for label, bucket_count in zip(BET_SIZE_LABELS, buckets) if bucket_count],
+            }
+        return log
+
+    def log(self, game_clocks):
+        counts = self.counts
         return {
             'name': self.player1_name,
             'VPIP': self.get_vpip(),
             'PFR': self.get_pfr(),
-            'illegal actions': self.num_illegal_actions,
-            'timeouts': self.num_timeouts,
+            'AF': ratio(counts[POSTFLOP_RAISES], counts[POSTFLOP_CALLS]),
+            '3-bet': ratio(counts[THREE_BETS], counts[THREE_BET_OPPORTUNITIES]),
+            'fold to 3-bet': ratio(counts[FOLDS_TO_THREE_BET], counts[FOLD_TO_THREE_BET_OPPORTUNITIES]),
+            'c-bet': ratio(counts[CBETS], counts[CBET_OPPORTUNITIES]),
+            'WTSD': ratio(counts[WENT_TO_SHOWDOWN], counts[SAW_FLOP]),
+            'W$SD': ratio(counts[WON_AT_SHOWDOWN], counts[WENT_TO_SHOWDOWN]),
+            'bet size by street': self.log_bet_sizes(),
+            'illegal actions': counts[ILLEGAL_ACTIONS],
+            'timeouts': counts[TIMEOUTS],
+            'connect time': None if self.connect_time is None else round(self.connect_time, 6),
+            'handshake time': None if self.handshake_time is None else round(self.handshake_time, 6),
+            'response time': self.response_times.log(),
+            'response time by street': {street: histogram.log() for street, histogram in self.street_response_times.items()},
+            'response time by action': {action: histogram.log() for action, histogram in self.action_response_times.items()},
+            'remaining game clock': game_clocks,
+        }
+
+class SequentialTest:
+    '''
+    Sequential probability ratio test on the chip deltas of the first player.
+    H0: the first player loses margin chips per round on average, H1: the first player wins margin chips per round.
+    The variance of the deltas is estimated from the rounds played so far.
+    '''
+    def __init__(self, confidence, margin, min_rounds):
+        error = 1 - confidence
+        self.threshold = math.log((1 - error) / error)
+        self.margin = margin
+        self.min_rounds = max(min_rounds, 2)
+        self.num_rounds = 0
+        self.total = 0
+        self.mean = 0.
+        self.sum_of_squares = 0. # of the differences from the mean
+        self.statistic = 0.
+        self.stopping_round = None
+
+    def add_delta(self, delta):
+        self.num_rounds += 1
+        self.total += delta
+        difference = delta - self.mean
+        self.mean += difference / self.num_rounds
+        self.sum_of_squares += difference * (delta - self.mean)
+        if self.num_rounds >= self.min_rounds and self.sum_of_squares > 0:
+            variance = self.sum_of_squares / (self.num_rounds - 1)
+            # log-likelihood ratio of H1 against H0 for normally distributed deltas
+            self.statistic = 2 * self.margin * self.total / variance
+
+    def is_decided(self):
+        return abs(self.statistic) >= self.threshold
+
+    def log(self):
+        return {
+            'Stopping round': self.stopping_round,
+            'Log-likelihood ratio': round(self.statistic, 3),
+            'Threshold': round(self.threshold, 3),
         }
 
+def downsample(values, num_buckets):
+    '''
+    Indices of at most 2 * num_buckets + 2 values that keep the shape of the curve: the first and the last value and
+    the lowest and the highest value of each of num_buckets buckets of consecutive values, in order.
+    '''
+    if len(values) <= 2 * num_buckets + 2:
+        return list(range(len(values)))
+    bucket_size = -(-len(values) // num_buckets)
+    indices = {0, len(values) - 1}
+    for start in range(0, len(values), bucket_size):
+        bucket = values[start:start + bucket_size]
+        # min, max and index run in C on arrays, the first of equal values is kept
+        indices.add(start + bucket.index(min(bucket)))
+        indices.add(start + bucket.index(max(bucket)))
+    return sorted(indices)
+
+class Ledger:
+    '''
+    The chip delta and the bankroll of the first player after every round in compact arrays, and the rounds with the
+    largest and smallest deltas in heaps. Rounds are zero-sum, so the second player's are the negated values.
+    The remaining game clocks of both players after every round are kept in arrays too, if the engine records them.
+    '''
+    def __init__(self, num_extremes):
+        self.round_nums = array('i')
+        self.deltas = array('i')
+        self.bankrolls = array('q')
+        self.game_clocks = (array('d'), array('d'))
+        self.num_extremes = num_extremes
+        # min-heaps of (delta, -round_num) and (-delta, -round_num), so on ties the earlier round stays
+        self.largest = []
+        self.smallest = []
+
+    def __len__(self):
+        return len(self.deltas)
+
+    def add(self, round_num, delta):
+        self.round_nums.append(round_num)
+        self.deltas.append(delta)
+        self.bankrolls.append(self.bankroll() + delta)
+        for heap, item in ((self.largest, (delta, -round_num)), (self.smallest, (-delta, -round_num))):
+            if len(heap) < self.num_extremes:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+
+    def add_game_clocks(self, game_clocks):
+        for series, game_clock in zip(self.game_clocks, game_clocks):
+            series.append(game_clock)
+
+    def bankroll(self):
+        return self.bankrolls[-1] if self.bankrolls else 0
+
+    def largest_deltas(self):
+        return [(-negative_round_num, delta) for delta, negative_round_num in sorted(self.largest, reverse=True)]
+
+    def smallest_deltas(self):
+        return [(-negative_round_num, -delta) for delta, negative_round_num in sorted(self.smallest, reverse=True)]
+
+    def bankroll_curve(self):
+        '''
+        Round numbers and bankrolls of every round as arrays, starting with round 0 and a bankroll of 0.
+        '''
+        return array('i', [0]) + self.round_nums, array('q', [0]) + self.bankrolls
+
+    def game_clock_curve(self, index):
+        '''
+        Round numbers and the remaining game clock of the player at index after every round with a recorded clock.
+        '''
+        return self.round_nums[:len(self.game_clocks[index])], self.game_clocks[index]
+
 class GameSummary:
+    '''
+    The stats of a match. Players are identified by their index in the match, the order of players, not by their seat.
+    '''
     def __init__(self, players, match_id):
         self.match_id = match_id
         self.players = players
-        self.discretized_bankrolls = [(0, [0, 0])]
-        self.hand_deltas = []
+        self.ledger = Ledger(NUM_EXTREME_HANDS)
         self.player_summaries = [PlayerSummary(players[0]), PlayerSummary(players[1])]
         self.num_chops = 0
-        self.logs = []
+        self.log_file = None
+        self.deck_seed = None
+        self.duplicate_deals = False
+        self.sequential_test = None
+        self.total_response_time = 0.
+        # seconds per round the engine spent on anything but waiting for the bots
+        self.engine_overhead = LatencyHistogram()
+        # cards dealt past the river -> rounds, and the rounds that were still running when the run was dealt
+        self.run_lengths = {}
+        self.num_runs_reached = 0
+        # the preflop betting of the current round
+        self.preflop_raises = 0
+        self.preflop_aggressor = None
+        self.cbet_pending = False
 
-    def add_bankrolls(self, round_num, name_to_bankrolls):
-        if (name_to_bankrolls.keys() != set(self.players)):
-            raise Exception(f"Unknown player names: {name_to_bankrolls.keys()}")
-        bankrolls = [name_to_bankrolls[self.players[0]], name_to_bankrolls[self.players[1]]]
-        self.discretized_bankrolls.append((round_num, bankrolls))
+    def get_bankrolls(self):
+        bankroll = self.ledger.bankroll()
+        return [bankroll, -bankroll]
 
-    def add_pfr_opportunity(self, player_name):
-        self.player_summaries[self._name_to_player_id(player_name)].num_pfr_opportunities += 1
+    def new_round(self):
+        self.preflop_raises = 0
+        self.preflop_aggressor = None
+        self.cbet_pending = True
 
-    def add_pfr(self, player_name):
-        self.player_summaries[self._name_to_player_id(player_name)].num_pfr += 1
+    def add_action(self, index, round_state, action):
+        '''
+        Updates the stats of the player with the action taken in round_state, before the round state proceeds.
+        '''
+        player_summary = self.player_summaries[index]
+        counts = player_summary.counts
+        street = round_state.street
+        raised = isinstance(action, RaiseAction)
+        can_raise = RaiseAction in round_state.legal_actions()
+        if street == 0:
+            counts[VPIP_OPPORTUNITIES] += 1
+            if raised or isinstance(action, CallAction):
+                counts[VPIP] += 1
+            if can_raise:
+                counts[PFR_OPPORTUNITIES] += 1
+                if raised:
+                    counts[PFR] += 1
+                if self.preflop_raises == 1:
+                    counts[THREE_BET_OPPORTUNITIES] += 1
+                    if raised:
+                        counts[THREE_BETS] += 1
+            if self.preflop_raises == 2:  # heads-up only the player who raised first can face the 3-bet
+                counts[FOLD_TO_THREE_BET_OPPORTUNITIES] += 1
+                if isinstance(action, FoldAction):
+                    counts[FOLDS_TO_THREE_BET] += 1
+            if raised:
+                self.preflop_raises += 1
+                self.preflop_aggressor = index
+        else:
+            if raised:
+                counts[POSTFLOP_RAISES] += 1
+            elif isinstance(action, CallAction):
+                counts[POSTFLOP_CALLS] += 1
+            if street == 3 and self.cbet_pending and index == self.preflop_aggressor:
+                self.cbet_pending = False
+                if can_raise and round_state.pips[0] == round_state.pips[1] == 0:
+                    counts[CBET_OPPORTUNITIES] += 1
+                    if raised:
+                        counts[CBETS] += 1
+        if raised:
+            active = round_state.button % 2
+            pot = 2 * STARTING_STACK - round_state.stacks[0] - round_state.stacks[1]
+            continue_cost = round_state.pips[1-active] - round_state.pips[active]
+            player_summary.add_bet_size(sizing_street(street), (action.amount - round_state.pips[1-active]) / (pot + continue_cost))
 
-    def add_vpip_opportunity(self, player_name):
-        self.player_summaries[self._name_to_player_id(player_name)].num_vpip_opportunities += 1
-    
-    def add_vpip(self, player_name):
-        self.player_summaries[self._name_to_player_id(player_name)].num_vpip += 1
+    def add_round(self, round_num, seats, round_state):
+        '''
+        Records the outcome of a round. seats are the indices of the players in the order of their seats.
+        '''
+        deltas = [0, 0]
+        for seat, index in enumerate(seats):
+            deltas[index] = round_state.deltas[seat]
+        self.ledger.add(round_num, deltas[0])
+        if self.sequential_test is not None:
+            self.sequential_test.add_delta(deltas[0])
+        previous_state = round_state.previous_state
+        if previous_state.final_street > 5:
+            run_length = previous_state.final_street - 5
+            self.run_lengths[run_length] = self.run_lengths.get(run_length, 0) + 1
+            if previous_state.street > 5:
+                self.num_runs_reached += 1
+        if previous_state.street > 0:
+            showdown = FoldAction not in previous_state.legal_actions()
+            for index, delta in enumerate(deltas):
+                counts = self.player_summaries[index].counts
+                counts[SAW_FLOP] += 1
+                if showdown:
+                    counts[WENT_TO_SHOWDOWN] += 1
+                    if delta > 0:
+                        counts[WON_AT_SHOWDOWN] += 1
+
+    def enable_early_stopping(self, confidence, margin, min_rounds):
+        self.sequential_test = SequentialTest(confidence, margin, min_rounds)
+
+    def is_decided(self):
+        return self.sequential_test is not None and self.sequential_test.is_decided()
 
-    def add_round(self, round_num, name_to_delta): # chip counts order needs to be self.players'
-        if (name_to_delta.keys() != set(self.players)):
-            raise Exception(f"Unknown player names: {name_to_delta.keys()}")
-        d = HandDelta(round_num, [name_to_delta[self.players[0]], name_to_delta[self.players[1]]])
-        self.hand_deltas.append(d)
+    def stop_early(self, round_num):
+        self.sequential_test.stopping_round = round_num
 
     def get_top_hands(self, no_of_hands) -> list:
-        self.hand_deltas.sort(key=lambda x: x[1], reverse=True)
-        return self.hand_deltas[:no_of_hands]
+        return [HandDelta(round_num, [delta, -delta]) for round_num, delta in self.ledger.largest_deltas()[:no_of_hands]]
+
+    def get_bottom_hands(self, no_of_hands) -> list:
+        return [HandDelta(round_num, [delta, -delta]) for round_num, delta in self.ledger.smallest_deltas()[:no_of_hands]]
     
-    def add_illegal_action(self, player_name):
-        self.player_summaries[self._name_to_player_id(player_name)].num_illegal_actions += 1
+    def add_illegal_action(self, index):
+        self.player_summaries[index].counts[ILLEGAL_ACTIONS] += 1
+
+    def add_timeout(self, index):
+        self.player_summaries[index].counts[TIMEOUTS] += 1
+
+    def add_response_time(self, index, round_state, action, latency):
+        '''
+        Records the latency of one query. action is the action class the bot replied with, None at the end of a round.
+        '''
+        action_name = None if action is None else action.__name__[:-len('Action')]
+        self.player_summaries[index].add_response_time(query_street(round_state), action_name, latency)
+        self.total_response_time += latency
+
+    def add_round_time(self, round_time, response_time, game_clocks):
+        '''
+        Records the wall time of a round, of which response_time was spent waiting for the bots, and the game clocks left.
+        '''
+        self.engine_overhead.add(max(round_time - response_time, 0.))
+        self.ledger.add_game_clocks(game_clocks)
 
-    def add_timeout(self, player_name):
-        self.player_summaries[self._name_to_player_id(player_name)].num_timeouts += 1
+    def set_connection_times(self, index, connect_time, handshake_time):
+        player_summary = self.player_summaries[index]
+        player_summary.connect_time = connect_time
+        player_summary.handshake_time = handshake_time
 
-    def set_logs(self, logs):
-        self.logs = logs
+    def set_deck_seed(self, deck_seed, duplicate_deals):
+        self.deck_seed = deck_seed
+        self.duplicate_deals = duplicate_deals
+
+    def set_log_file(self, log_file):
+        self.log_file = log_file
 
     def write_summary(self):
         name =  'SUM_' + self.match_id + '_' + self.players[0] + '_vs_' + self.players[1] + '.json'
@@ -93,45 +444,62 @@ class GameSummary:
 
         print("Writing game summary to " + summary_file)
 
-        bankrolls = self.discretized_bankrolls[-1][1]
+        bankrolls = self.get_bankrolls()
         self.log = {
             'Game Summary': self.players[0] + ' vs ' + self.players[1],
             'Score': str(bankrolls[0]) + ' vs ' + str(bankrolls[1]),
             'Tie': bankrolls[0] == bankrolls[1],
             'Winner': None if bankrolls[0] == bankrolls[1] else (self.players[0] if bankrolls[0] > bankrolls[1] else self.players[1]),
             'Starting stack': STARTING_STACK,
-            'Number of rounds': NUM_ROUNDS,
+            'Number of rounds': len(self.ledger),
             'Number of chop': self.num_chops,
-            'Player stats': [p.log() for p in self.player_summaries],
+            'Deck seed': self.deck_seed,
+            'Duplicate deals': self.duplicate_deals,
+            'Early stopping': None if self.sequential_test is None else self.sequential_test.log(),
+            'Player stats': [p.log(self._log_game_clocks(index)) for index, p in enumerate(self.player_summaries)],
+            'Royal runs': self._log_runs(),
+            'Engine overhead per round': self.engine_overhead.log(),
             'Discretized bankroll counts': self._log_discretized_bankrolls(),
-            'Top hands': self._log_top_hands(5),
-            'Logs': self.logs,
+            'Top hands': self._log_hands(self.get_top_hands(NUM_EXTREME_HANDS)),
+            'Bottom hands': self._log_hands(self.get_bottom_hands(NUM_EXTREME_HANDS)),
+            'Log file': self.log_file,
         }
         os.makedirs(summary_path, exist_ok=True)
         with open(summary_file, 'w') as json_file:
             json.dump(self.log, json_file, indent=2)
 
-    def _name_to_player_id(self, player_name):
-        if player_name == self.players[0]:
-            return 0
-        elif player_name == self.players[1]:
-            return 1
-        else:
-            raise Exception(f"Unknown player name: {player_name}")
-        
     def _log_discretized_bankrolls(self):
         log = []
-        for round_num, bankrolls in self.discretized_bankrolls:
+        round_nums, bankrolls = self.ledger.bankroll_curve()
+        for index in downsample(bankrolls, BANKROLL_BUCKETS):
+            log.append({
+                'Round number': int(round_nums[index]),
+                'Player_1_bankroll': int(bankrolls[index]),
+                'Player_2_bankroll': -int(bankrolls[index])
+            })
+        return log
+
+    def _log_game_clocks(self, index):
+        log = []
+        round_nums, game_clocks = self.ledger.game_clock_curve(index)
+        for clock_index in downsample(game_clocks, GAME_CLOCK_BUCKETS):
             log.append({
-                'Round number': round_num,
-                'Player_1_bankroll': bankrolls[0],
-                'Player_2_bankroll': bankrolls[1]
+                'Round number': round_nums[clock_index],
+                'Game clock': round(game_clocks[clock_index], 3)
             })
         return log
 
-    def _log_top_hands(self, no_of_hands):
+    def _log_runs(self):
+        num_runs = sum(self.run_lengths.values())
+        return {
+            'Dealt': num_runs,
+            'Frequency': ratio(num_runs, len(self.ledger)),
+            'Reached': self.num_runs_reached,
+            'Run lengths': {str(length): self.run_lengths[length] for length in sorted(self.run_lengths)},
+        }
+
+    def _log_hands(self, hands):
         log = []
-        hands = self.get_top_hands(no_of_hands)
         for hand in hands:
             log.append({
                 'Round number': hand.round_num,
@@ -0,0 +1,202 @@
+'''
+Socket connections to the pokerbots.
+
+Both pokerbots are built, started and accepted concurrently on an asyncio event loop, so setting up a match
+takes as long as the slower pokerbot instead of both together. The game itself is synchronous: once connected,
+every query is one send and one read with a deadline on the socket, which is cheaper than a round trip through
+the event loop.
+
+Besides TCP, pokerbots started by the engine can be offered a unix domain socket or a shared memory channel,
+the latter only on x86 (see channel.py).
+The engine tells the runner about them in environment variables and keeps listening on TCP as well, so runners
+that do not know them still connect.
+'''
+import asyncio
+import os
+import platform
+import shutil
+import socket
+import tempfile
+import time
+
+from channel import ORDERED_STORES, SharedMemoryChannel
+from protocol import FRAME_HEADER
+
+EVENT_LOOP = asyncio.new_event_loop()
+
+
+def run(coroutine):
+    '''
+    Runs a coroutine on the engine's event loop until it is done.
+    '''
+    return EVENT_LOOP.run_until_complete(coroutine)
+
+
+def run_concurrently(coroutines):
+    '''
+    Runs the coroutines concurrently on the engine's event loop and returns their results.
+    '''
+    async def gather():
+        return await asyncio.gather(*coroutines)
+    return run(gather())
+
+
+class BotConnection():
+    '''
+    Listens for one pokerbot and exchanges newline terminated messages or binary frames with it.
+    Records how long the pokerbot took to connect and to answer the first message.
+    '''
+
+    def __init__(self):
+        self.server_socket = None
+        self.local_server = None
+        self.local_directory = None
+        self.channel = None
+        self.transport = None
+        self.socket = None
+        self.buffer = b''
+        self.framed = False
+        self.start_time = None
+        self.connect_time = None
+        self.handshake_time = None
+
+    def listen(self, port):
+        '''
+        Starts listening on the port (0 picks a free one) and returns the port.
+        '''
+        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server_socket.bind(('', port))
+        server_socket.listen()
+        server_socket.setblocking(False)
+        self.server_socket = server_socket
+        self.start_time = time.perf_counter()
+        return server_socket.getsockname()[1]
+
+    def listen_local(self, transport):
+        '''
+        Also offers a local transport, 'unix' or 'shm', to the pokerbot. Returns the environment variables and
+        file descriptors the pokerbot process needs to find it.
+        '''
+        if transport == 'shm' and not ORDERED_STORES:
+            print('BOT_TRANSPORT=shm needs the store order of x86, using unix on', platform.machine())
+            transport = 'unix'
+        if transport == 'unix' and hasattr(socket, 'AF_UNIX'):
+            self.local_directory = tempfile.mkdtemp(prefix='pokerbot_')
+            path = os.path.join(self.local_directory, 'engine.sock')
+            local_server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            local_server.bind(path)
+            local_server.listen()
+            local_server.setblocking(False)
+            self.local_server = local_server
+            return {'POKERBOT_SOCKET': path}, ()
+        if transport == 'shm':
+            self.channel = SharedMemoryChannel()
+            return self.channel.environment()
+        return {}, ()
+
+    def started(self):
+        '''
+        Called once the pokerbot process is running.
+        '''
+        if self.channel is not None:
+            self.channel.started()
+
+    async def wait_connected(self, timeout):
+        '''
+        Waits until the pokerbot connected over any of the offered transports and stops listening.
+        Raises asyncio.TimeoutError after timeout seconds.
+        '''
+        accepts = {EVENT_LOOP.create_task(EVENT_LOOP.sock_accept(server)): server
+                   for server in (self.server_socket, self.local_server) if server is not None}
+        waits = list(accepts)
+        if self.channel is not None:
+            attached = EVENT_LOOP.create_future()
+            EVENT_LOOP.add_reader(self.channel.fileno(), lambda: attached.done() or attached.set_result(None))
+            waits.append(attached)
+        try:
+            done, _ = await asyncio.wait(waits, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for wait in waits:
+                wait.cancel()
+            if self.channel is not None:
+                EVENT_LOOP.remove_reader(self.channel.fileno())
+            for server in accepts.values():
+                server.close()
+            if self.local_directory is not None:
+                shutil.rmtree(self.local_directory, ignore_errors=True)
+        if not done:
+            self.close()
+            raise asyncio.TimeoutError
+        winner = next(wait for wait in waits if wait in done)
+        if winner in accepts:
+            client_socket, _ = winner.result()
+            if accepts[winner] is self.server_socket:
+                client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                self.transport = 'tcp'
+            else:
+                self.transport = 'unix'
+            if self.channel is not None:
+                self.channel.close()
+                self.channel = None
+            self.socket = client_socket
+        elif self.channel.attached():
+            self.socket = self.channel
+            self.transport = 'shm'
+        else:
+            self.close()
+            raise OSError('the pokerbot exited before attaching the shared memory')
+        self.connect_time = time.perf_counter() - self.start_time
+
+    def request(self, message, timeout):
+        '''
+        Sends a message and returns the pokerbot's reply. Raises socket.timeout after timeout seconds.
+        An empty reply means the pokerbot closed the connection.
+        Once framed is set, messages and replies are the payloads of binary frames instead of text lines.
+        '''
+        start_time = time.perf_counter()
+        deadline = start_time + timeout
+        self.socket.settimeout(timeout)
+        self.socket.sendall(self.encode(message))
+        while True:
+            if self.framed:
+                if len(self.buffer) >= FRAME_HEADER.size:
+                    end = FRAME_HEADER.size + FRAME_HEADER.unpack_from(self.buffer)[0]
+                    if len(self.buffer) >= end:
+                        reply, self.buffer = self.buffer[FRAME_HEADER.size:end], self.buffer[end:]
+                        break
+            elif b'\n' in self.buffer:
+                reply, self.buffer = self.buffer.split(b'\n', 1)
+                reply = reply.decode() + '\n'
+                break
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0.:
+                raise socket.timeout
+            self.socket.settimeout(remaining)
+            data = self.socket.recv(4096)
+            if not data:
+                reply, self.buffer = self.buffer, b''
+                return b'' if self.framed else reply.decode()
+            self.buffer += data
+        if self.handshake_time is None:
+            self.handshake_time = time.perf_counter() - start_time
+        return reply
+
+    def encode(self, message):
+        if self.framed:
+            return FRAME_HEADER.pack(len(message)) + message
+        return message.encode()
+
+    def close(self, message=None):
+        '''
+        Sends a last message, if any, and closes the connection.
+        '''
+        if self.socket is None:
+            if self.channel is not None:
+                self.channel.close()
+            return
+        try:
+            if message is not None:
+                self.socket.sendall(self.encode(message))
+        finally:
+            self.socket.close()